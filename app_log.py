@@ -0,0 +1,162 @@
+"""
+CH Pines - Registro de la aplicación
+Niveles, búfer circular de tamaño fijo detrás del log de la ventana y
+escritura a archivo rotativo en un hilo aparte
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from collections import deque
+
+# Niveles a mano para quien importe solo este módulo
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+LOGGER_NAME = 'ch_pines'
+LOG_FILE = 'ch_pines.log'
+
+# Líneas que conserva el log de la ventana (las más viejas se descartan)
+LOG_BUFFER_LINES = 2000
+# Archivo rotativo: tamaño máximo de cada archivo y cuántos se conservan
+LOG_FILE_MAX_BYTES = 2 * 1024 * 1024
+LOG_FILE_BACKUPS = 3
+
+# CHPINES_DEBUG=1 activa los mensajes de depuración al iniciar
+DEBUG_ENV = 'CHPINES_DEBUG'
+
+VIEW_FORMAT = '[%(asctime)s] %(message)s'
+VIEW_DATE_FORMAT = '%H:%M:%S'
+FILE_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+
+def get_logger(name=None):
+    """Logger de un módulo bajo el logger de la aplicación
+
+    Sin LogSystem (p. ej. importado desde la línea de comandos) solo las
+    advertencias y errores llegan a la consola.
+    """
+    if not name or name == LOGGER_NAME:
+        return logging.getLogger(LOGGER_NAME)
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+class LogBuffer:
+    """Búfer circular de líneas ya formateadas, seguro entre hilos
+
+    Cada línea lleva un número de secuencia: la vista pide las nuevas con
+    since(ultimo) y, si se quedó atrás más de `capacity` líneas, recibe
+    solo las más recientes (las demás siguen en el archivo).
+    """
+
+    def __init__(self, capacity=LOG_BUFFER_LINES):
+        self.capacity = capacity
+        self._lines = deque(maxlen=capacity)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._lines)
+
+    def append(self, line):
+        with self._lock:
+            self._lines.append(line)
+            self._seq += 1
+
+    def since(self, seq):
+        """Devuelve (secuencia_actual, líneas agregadas después de seq)"""
+        with self._lock:
+            new = self._seq - seq
+            if new <= 0:
+                return self._seq, []
+            if new >= len(self._lines):
+                return self._seq, list(self._lines)
+            start = len(self._lines) - new
+            return self._seq, [self._lines[i] for i in range(start, len(self._lines))]
+
+    def lines(self):
+        with self._lock:
+            return list(self._lines)
+
+    def clear(self):
+        with self._lock:
+            self._lines.clear()
+
+
+class BufferHandler(logging.Handler):
+    """Handler que deja cada registro formateado en un LogBuffer"""
+
+    def __init__(self, buffer, level=logging.INFO):
+        super().__init__(level)
+        self.buffer = buffer
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+class LogSystem:
+    """Configura el logger de la aplicación
+
+    - Búfer circular (nivel INFO en adelante) que la ventana vacía en bloque.
+    - Archivo rotativo escrito por un QueueListener en su propio hilo: quien
+      registra solo encola el registro, nunca espera al disco.
+    Los mensajes de depuración cuestan una comparación de nivel mientras
+    están apagados; set_debug(True) los activa sin reiniciar.
+    """
+
+    def __init__(self, log_path=None, capacity=LOG_BUFFER_LINES, debug=None):
+        if log_path is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            log_path = os.path.join(script_dir, LOG_FILE)
+        if debug is None:
+            debug = os.environ.get(DEBUG_ENV, '').strip() not in ('', '0')
+        self.log_path = log_path
+        self.logger = get_logger()
+        self.logger.propagate = False
+        self.buffer = LogBuffer(capacity)
+
+        self._buffer_handler = BufferHandler(self.buffer)
+        self._buffer_handler.setFormatter(logging.Formatter(VIEW_FORMAT, VIEW_DATE_FORMAT))
+        self.logger.addHandler(self._buffer_handler)
+
+        self._queue_handler = None
+        self._listener = None
+        try:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS,
+                encoding='utf-8', delay=True)
+            file_handler.setFormatter(logging.Formatter(FILE_FORMAT))
+            records = queue.SimpleQueue()
+            self._queue_handler = logging.handlers.QueueHandler(records)
+            self._listener = logging.handlers.QueueListener(records, file_handler)
+            self.logger.addHandler(self._queue_handler)
+            self._listener.start()
+        except OSError as e:
+            self.logger.warning(f"⚠️ No se pudo abrir el archivo de log {log_path}: {e}")
+
+        self.set_debug(debug)
+
+    @property
+    def debug(self):
+        return self.logger.isEnabledFor(logging.DEBUG)
+
+    def set_debug(self, enabled):
+        self.logger.setLevel(logging.DEBUG if enabled else logging.INFO)
+
+    def stop(self):
+        """Escribe lo pendiente al archivo y quita los handlers"""
+        self.logger.removeHandler(self._buffer_handler)
+        if self._queue_handler is not None:
+            self.logger.removeHandler(self._queue_handler)
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
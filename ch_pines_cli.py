@@ -0,0 +1,334 @@
+"""
+CH Pines - Línea de comandos (sin interfaz gráfica)
+Genera lotes, los sube a uno o varios MikroTik y exporta Excel/PDF con la
+plantilla; no importa tkinter, sirve para cron y servidores sin pantalla
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import mikrotik_ssh
+import provisioning
+import routeros_api
+import ticket_batch
+import ticket_codes
+import ticket_ledger
+import ticket_store
+
+# Contraseña del router por variable de entorno (no queda en el historial ni en ps)
+PASSWORD_ENV = 'CHPINES_PASSWORD'
+
+# Valores por defecto de un lote (los mismos de la ventana)
+DEFAULT_PROFILE = 'default'
+DEFAULT_TIME = '1h'
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Plantilla.xlsx')
+
+UPLOAD_MODES = (provisioning.MODE_SCRIPT, provisioning.MODE_PARALLEL, provisioning.MODE_SINGLE)
+TRANSPORTS = (provisioning.TRANSPORT_SSH, provisioning.TRANSPORT_API, provisioning.TRANSPORT_API_SSL)
+
+# Códigos de salida
+EXIT_OK = 0
+EXIT_UPLOAD_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_CANCELLED = 130
+
+
+def parse_batch_spec(spec):
+    """'PREFIJO:CANTIDAD[:PERFIL[:TIEMPO]]' -> diccionario de lote"""
+    parts = spec.split(':', 3)
+    if len(parts) < 2 or not parts[0]:
+        raise argparse.ArgumentTypeError(f"Lote inválido '{spec}' (usa PREFIJO:CANTIDAD[:PERFIL[:TIEMPO]])")
+    try:
+        quantity = int(parts[1])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Cantidad inválida en el lote '{spec}'")
+    if quantity <= 0:
+        raise argparse.ArgumentTypeError(f"La cantidad del lote '{spec}' debe ser mayor que 0")
+    return {
+        'prefix': parts[0],
+        'quantity': quantity,
+        'profile': parts[2] if len(parts) > 2 and parts[2] else DEFAULT_PROFILE,
+        'time_limit': parts[3] if len(parts) > 3 and parts[3] else DEFAULT_TIME,
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="CH Pines sin interfaz: genera lotes de tickets, los sube al MikroTik y exporta Excel/PDF",
+        epilog=f"La contraseña del router también se puede pasar en la variable {PASSWORD_ENV}.")
+
+    batch = parser.add_argument_group("lote")
+    batch.add_argument('--lote', action='append', type=parse_batch_spec, default=[], metavar='ESPEC',
+                       help="PREFIJO:CANTIDAD[:PERFIL[:TIEMPO]] (se puede repetir)")
+    batch.add_argument('--prefijo', help="prefijo de un lote simple")
+    batch.add_argument('--cantidad', type=int, help="tickets del lote simple")
+    batch.add_argument('--perfil', default=DEFAULT_PROFILE, help="perfil hotspot (por defecto: default)")
+    batch.add_argument('--tiempo', default=DEFAULT_TIME, help="límite de tiempo, p. ej. 1h, 1d, 01:00:00")
+
+    router = parser.add_argument_group("router (sin --router solo se genera localmente)")
+    router.add_argument('--router', action='append', default=[], metavar='HOST',
+                        help="IP o nombre del MikroTik; repetir para un grupo de routers")
+    router.add_argument('--usuario', default='admin', help="usuario del router")
+    router.add_argument('--password', default=None, help=f"contraseña (mejor usar {PASSWORD_ENV})")
+    router.add_argument('--puerto', type=int, default=None, help="puerto (por defecto el del transporte)")
+    router.add_argument('--transporte', choices=TRANSPORTS, default=provisioning.TRANSPORT_SSH)
+    router.add_argument('--modo', choices=UPLOAD_MODES, default=provisioning.MODE_SCRIPT,
+                        help="modo de subida por SSH (con la API siempre se usa pipeline)")
+    router.add_argument('--canales', type=int, default=mikrotik_ssh.DEFAULT_CONCURRENCY,
+                        help="canales simultáneos del modo paralelo")
+
+    output = parser.add_argument_group("salida")
+    output.add_argument('--excel', metavar='ARCHIVO', help="exportar a Excel con la plantilla")
+    output.add_argument('--pdf', metavar='ARCHIVO', help="exportar a PDF con el diseño de la plantilla")
+    output.add_argument('--plantilla', default=DEFAULT_TEMPLATE, help="ruta de Plantilla.xlsx")
+    output.add_argument('--estado', default=None, metavar='ARCHIVO',
+                        help="archivo de cursores de códigos (por defecto ticket_codes.json)")
+    output.add_argument('--registro', default=None, metavar='ARCHIVO',
+                        help="base SQLite del registro (por defecto ticket_ledger.db)")
+    output.add_argument('--silencioso', action='store_true', help="solo errores y resumen final")
+
+    parser.add_argument('--bench', action='store_true',
+                        help="mide generación, registro, subida (servidor API local) y exportación "
+                             "sin tocar routers ni el estado real")
+    parser.add_argument('--latencia', type=float, default=0.0,
+                        help="retardo simulado del servidor API local en --bench (segundos)")
+    return parser
+
+
+def collect_batches(args, parser):
+    batches = list(args.lote)
+    if args.prefijo or args.cantidad:
+        if not args.prefijo or not args.cantidad or args.cantidad <= 0:
+            parser.error("--prefijo y --cantidad (mayor que 0) van juntos")
+        batches.append({'prefix': args.prefijo, 'quantity': args.cantidad,
+                        'profile': args.perfil, 'time_limit': args.tiempo})
+    return batches
+
+
+def make_logger(quiet):
+    def log(message):
+        if not quiet:
+            print(message, flush=True)
+    return log
+
+
+def run_cancellable(func, cancel_event):
+    """Ejecuta func() en un hilo; Ctrl+C pide la cancelación y espera a que termine
+
+    Así lo que ya está en vuelo (subida y registro) se completa igual que al
+    pulsar Cancelar en la ventana.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func()
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, name='chpines-cli', daemon=True)
+    thread.start()
+    while thread.is_alive():
+        try:
+            thread.join(0.2)
+        except KeyboardInterrupt:
+            if cancel_event.is_set():
+                raise
+            print("⏹️ Cancelando... se detiene al terminar el bloque en curso", flush=True)
+            cancel_event.set()
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome.get('result')
+
+
+def open_target(args, password, log):
+    """Conexión (un router) o DeviceGroup (varios) según --router"""
+    devices = [provisioning.make_device(host, args.usuario, password, args.puerto, args.transporte)
+               for host in args.router]
+    if len(devices) > 1:
+        log(f"🌐 Grupo de {len(devices)} routers: {', '.join(device['name'] for device in devices)}")
+        return None, provisioning.DeviceGroup("CLI", devices), None
+
+    device = devices[0]
+    log(f"🔄 Conectando a {device['host']}:{device['port']} por {device['transport']}...")
+    connection = provisioning.open_connection(device)
+    connect_params = None
+    if device['transport'] == provisioning.TRANSPORT_SSH:
+        connect_params = (device['host'], device['port'], device['username'], device['password'])
+    log(f"✅ Conectado a {device['host']}")
+    return connection, None, connect_params
+
+
+def close_connection(connection):
+    try:
+        if connection:
+            connection.close()
+    except Exception:
+        pass
+
+
+def export_tickets(tickets, args, log):
+    """Exporta Excel y/o PDF con la plantilla (openpyxl solo se importa aquí)"""
+    if not (args.excel or args.pdf):
+        return
+    import plantilla_export
+    import pdf_writer
+
+    if args.excel:
+        start = time.perf_counter()
+        result = plantilla_export.export_tickets(args.plantilla, args.excel, tickets,
+                                                 ticket_batch.format_time_display)
+        log(f"✅ Excel: {args.excel} ({result['pages']} páginas, {time.perf_counter() - start:.2f}s)")
+    if args.pdf:
+        start = time.perf_counter()
+        result = pdf_writer.render_tickets_pdf(args.plantilla, args.pdf, tickets,
+                                               ticket_batch.format_time_display)
+        log(f"✅ PDF: {args.pdf} ({result['pages']} páginas, {time.perf_counter() - start:.2f}s)")
+
+
+def run_batches(args, batches, password):
+    log = make_logger(args.silencioso)
+    cancel_event = threading.Event()
+    connection = group = connect_params = None
+    if args.router:
+        connection, group, connect_params = open_target(args, password, log)
+
+    code_generator = ticket_codes.CodeGenerator(args.estado)
+    ledger = ticket_ledger.TicketLedger(args.registro)
+    runner = ticket_batch.BatchRunner(code_generator, ledger, connection=connection, group=group,
+                                      connect_params=connect_params, upload_mode=args.modo,
+                                      concurrency=args.canales, router_name=', '.join(args.router),
+                                      log=log)
+    keep = bool(args.excel or args.pdf)
+    tickets = ticket_store.TicketStore()  # Solo lo que se exporta, en columnas
+    totals = {provisioning.RESULT_OK: 0, provisioning.RESULT_DUP: 0, provisioning.RESULT_ERROR: 0}
+    start = time.perf_counter()
+    try:
+        for i, batch in enumerate(batches):
+            if cancel_event.is_set():
+                break
+            log(f"🎯 Lote {i + 1}/{len(batches)}: {batch['quantity']} tickets {batch['prefix']} "
+                f"({batch['profile']}, {batch['time_limit']})")
+
+            def on_chunk(chunk):
+                for ticket in chunk:
+                    state = ticket.get('status', '')
+                    if state.startswith('Error'):
+                        totals[provisioning.RESULT_ERROR] += 1
+                    elif state == provisioning.status_for_result(provisioning.RESULT_DUP, ''):
+                        totals[provisioning.RESULT_DUP] += 1
+                    elif runner.uploads:
+                        totals[provisioning.RESULT_OK] += 1
+                if keep:
+                    tickets.extend(chunk)
+
+            stats = run_cancellable(
+                lambda: runner.generate(batch['prefix'], batch['quantity'], batch['profile'],
+                                        batch['time_limit'], on_chunk=on_chunk, cancel_event=cancel_event),
+                cancel_event)
+            log(f"✅ Lote {stats['batch_id']}: {stats['done']} tickets")
+    finally:
+        close_connection(connection)
+        ledger.close()
+
+    export_tickets(tickets, args, log)
+
+    elapsed = time.perf_counter() - start
+    if runner.uploads:
+        print(f"📊 {totals['ok']} creados, {totals['dup']} ya existían, {totals['error']} con error "
+              f"({elapsed:.1f}s)", flush=True)
+    if cancel_event.is_set():
+        print("⏹️ Cancelado: lo ya generado quedó en el registro", flush=True)
+        return EXIT_CANCELLED
+    return EXIT_UPLOAD_ERRORS if totals['error'] else EXIT_OK
+
+
+def run_bench(args, batches):
+    """Mide las etapas del núcleo sin interfaz, con estado y registro temporales"""
+    quantity = sum(batch['quantity'] for batch in batches) or 10000
+    batch = batches[0] if batches else {'prefix': 'BENCH', 'quantity': quantity,
+                                        'profile': DEFAULT_PROFILE, 'time_limit': DEFAULT_TIME}
+    timings = []
+
+    def timed(label, func):
+        start = time.perf_counter()
+        result = func()
+        timings.append((label, time.perf_counter() - start))
+        return result
+
+    with tempfile.TemporaryDirectory(prefix='chpines-bench-') as work_dir:
+        code_generator = ticket_codes.CodeGenerator(os.path.join(work_dir, ticket_codes.STATE_FILE))
+        ledger = ticket_ledger.TicketLedger(os.path.join(work_dir, ticket_ledger.LEDGER_FILE))
+        try:
+            usernames, _ = timed("Códigos (permutación)",
+                                 lambda: code_generator.take(batch['prefix'], quantity))
+            tickets = ticket_batch.make_tickets(usernames, batch['profile'], batch['time_limit'],
+                                                ticket_batch.STATUS_LOCAL)
+            timed("Registro SQLite", lambda: ledger.record_tickets(tickets, 'bench', batch['prefix'], 'local'))
+
+            stand_in = routeros_api.RouterOSApiStandIn(latency=args.latencia)
+            host, port = stand_in.start()
+            try:
+                connection = routeros_api.RouterOSApiClient(host, port).connect('admin', '')
+                runner = ticket_batch.BatchRunner(code_generator, ledger, connection=connection,
+                                                  router_name='stand-in', log=lambda message: None)
+                stats = timed("Pipeline generar→subir→registro (API local)",
+                              lambda: runner.generate(batch['prefix'] + 'P', quantity, batch['profile'],
+                                                      batch['time_limit']))
+                connection.close()
+            finally:
+                stand_in.stop()
+
+            if os.path.exists(args.plantilla):
+                import plantilla_export
+                import pdf_writer
+                timed("Plantilla compilada", lambda: plantilla_export.load_template(args.plantilla))
+                export = timed("Excel con plantilla", lambda: plantilla_export.export_tickets(
+                    args.plantilla, os.path.join(work_dir, 'bench.xlsx'), tickets,
+                    ticket_batch.format_time_display))
+                timed("PDF directo", lambda: pdf_writer.render_tickets_pdf(
+                    args.plantilla, os.path.join(work_dir, 'bench.pdf'), tickets,
+                    ticket_batch.format_time_display))
+                pages = export['pages']
+            else:
+                pages = 0
+                print(f"⚠️ Sin plantilla ({args.plantilla}): se omite la exportación")
+        finally:
+            ledger.close()
+
+    print(f"\n⏱️ Benchmark CH Pines: {quantity} tickets, {pages} páginas")
+    for label, elapsed in timings:
+        print(f"  {label:<45} {elapsed:8.3f}s  ({quantity / elapsed if elapsed else 0:,.0f} tickets/s)")
+    print(f"  Subida: {stats['counts']['ok']} creados, {stats['counts']['error']} con error")
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    batches = collect_batches(args, parser)
+
+    if args.bench:
+        return run_bench(args, batches)
+
+    if not batches:
+        parser.error("indica al menos un lote (--lote o --prefijo/--cantidad)")
+    if (args.excel or args.pdf) and not os.path.exists(args.plantilla):
+        parser.error(f"no se encontró la plantilla: {args.plantilla}")
+
+    password = args.password if args.password is not None else os.environ.get(PASSWORD_ENV, '')
+    try:
+        return run_batches(args, batches, password)
+    except KeyboardInterrupt:
+        return EXIT_CANCELLED
+    except Exception as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        return EXIT_UPLOAD_ERRORS
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,521 @@
+"""
+CH Pines - Motor de trabajos en segundo plano
+Hilos de trabajo, canal de eventos seguro entre hilos hacia la interfaz,
+cancelación cooperativa y trabajo por partes con presupuesto por cuadro
+"""
+
+import queue
+import threading
+import time
+import app_log
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# Estados de un trabajo
+JOB_PENDING = 'pendiente'
+JOB_RUNNING = 'ejecutando'
+JOB_DONE = 'completado'
+JOB_CANCELLED = 'cancelado'
+JOB_FAILED = 'error'
+
+# Tipos de evento que viajan del hilo de trabajo a la interfaz
+EVENT_LOG = 'log'
+EVENT_PROGRESS = 'progress'
+EVENT_CALL = 'call'
+EVENT_FINISHED = 'finished'
+
+# Cada cuánto (ms) la interfaz vacía el canal
+POLL_INTERVAL_MS = 50
+
+# Trabajo en el hilo de la interfaz: ms por cuadro para tareas por partes
+# (el resto del cuadro de ~16 ms queda para eventos y repintado)
+FRAME_BUDGET_MS = 8
+FRAME_INTERVAL_MS = 16
+# Peso de cada medición nueva en el costo promedio de una unidad
+COST_SMOOTHING = 0.2
+
+# Clave del vaciado del canal en el IdleScheduler
+UI_CHANNEL_TASK = 'ui-channel'
+
+log = app_log.get_logger('job_engine')
+
+# Entradas del canal hacia la interfaz
+_UI_LOG = 'log'
+_UI_CALL = 'call'
+_UI_UPDATE = 'update'
+
+
+class IdleScheduler:
+    """Trabajo por partes en el hilo de la interfaz con presupuesto por cuadro
+
+    schedule(ms, callback): programador del hilo de la interfaz (root.after).
+    submit(unidades, clave): cada elemento que produce el iterable (p. ej.
+    un generador con un yield por bloque) es una unidad de trabajo. En
+    cada cuadro se corren unidades de los trabajos en cola, por turnos,
+    hasta gastar budget_ms; luego se devuelve el control a Tk y se sigue
+    en el próximo cuadro. Siempre corre al menos una unidad por cuadro.
+    El costo de una unidad se mide por clave (promedio móvil): no se
+    empieza una unidad que no entra en lo que queda del presupuesto, así
+    la cantidad por cuadro se ajusta sola a la máquina.
+    Solo se usa desde el hilo de la interfaz.
+    """
+
+    def __init__(self, schedule, budget_ms=FRAME_BUDGET_MS, frame_ms=FRAME_INTERVAL_MS,
+                 clock=time.perf_counter):
+        self.schedule = schedule
+        self.budget = budget_ms / 1000
+        self.frame_ms = frame_ms
+        self.clock = clock
+        self._tasks = deque()  # [clave, iterador, unidades, segundos]
+        self._costs = {}       # clave → segundos por unidad (promedio móvil)
+        self._scheduled = False
+
+    def submit(self, units, key=None):
+        """Encola un trabajo; con clave, reemplaza al pendiente con la misma clave"""
+        if key is not None:
+            self.cancel(key)
+        self._tasks.append([key, iter(units), 0, 0.0])
+        if not self._scheduled:
+            self._scheduled = True
+            self.schedule(0, self._frame)
+
+    def cancel(self, key):
+        self._tasks = deque(task for task in self._tasks if task[0] != key)
+
+    def pending(self, key=None):
+        """Cantidad de trabajos en cola (o si hay uno con esa clave)"""
+        if key is None:
+            return len(self._tasks)
+        return any(task[0] == key for task in self._tasks)
+
+    def unit_cost(self, key=None):
+        """Segundos medidos por unidad de los trabajos con esa clave (None si aún no hay)"""
+        return self._costs.get(key)
+
+    def throughput(self, key=None):
+        """Unidades por segundo medidas para esa clave"""
+        cost = self._costs.get(key)
+        return 1 / cost if cost else None
+
+    def run_frame(self):
+        """Corre unidades hasta gastar el presupuesto; devuelve cuántas corrió"""
+        deadline = self.clock() + self.budget
+        ran = 0
+        while self._tasks:
+            task = self._tasks[0]
+            key = task[0]
+            cost = self._costs.get(key, 0.0)
+            started = self.clock()
+            if ran and started + cost > deadline:
+                break
+            try:
+                next(task[1])
+            except StopIteration:
+                self._finish(task)
+            except Exception as e:
+                log.exception(f"⚠️ Error en trabajo de la interfaz {key}: {e}")
+                self._finish(task)
+            else:
+                elapsed = self.clock() - started
+                task[2] += 1
+                task[3] += elapsed
+                self._costs[key] = elapsed if key not in self._costs else cost + (elapsed - cost) * COST_SMOOTHING
+                # Turno del siguiente trabajo (la unidad pudo cancelar o encolar otros)
+                if self._tasks and self._tasks[0] is task:
+                    self._tasks.rotate(-1)
+            ran += 1
+        return ran
+
+    def _finish(self, task):
+        try:
+            self._tasks.remove(task)
+        except ValueError:
+            pass  # Se canceló durante su propia unidad
+        if task[2] and log.isEnabledFor(app_log.DEBUG):
+            log.debug("⏱️ Trabajo %s: %d unidades en %.1f ms (%.0f unidades/s)",
+                      task[0], task[2], task[3] * 1000, task[2] / task[3] if task[3] else 0)
+
+    def _frame(self):
+        self._scheduled = False
+        started = self.clock()
+        self.run_frame()
+        if self._tasks:
+            # Lo que queda del cuadro es para Tk (eventos y repintado)
+            spent_ms = (self.clock() - started) * 1000
+            self._scheduled = True
+            self.schedule(max(1, int(self.frame_ms - spent_ms)), self._frame)
+
+
+class UIChannel:
+    """Único canal hilo → interfaz, vaciado en un tick fijo
+
+    schedule(ms, callback): programador del hilo de la interfaz (root.after).
+    Desde cualquier hilo:
+    - log(texto): la línea se agrega con su hora; todas las líneas de un
+      tick llegan juntas a log_sink(lineas), una sola inserción.
+    - call(callback, *args): se ejecuta en el hilo de la interfaz, en orden.
+    - update(clave, callback, *args): solo se entrega el último valor de
+      cada clave por tick (progreso); miles de avances = una actualización.
+    Con log_buffer (app_log.LogBuffer) el canal además entrega en cada tick
+    las líneas nuevas del búfer circular del registro.
+    Con scheduler (IdleScheduler) el tick solo recoge lo pendiente y cada
+    llamada se entrega como una unidad de trabajo, dentro del presupuesto
+    por cuadro: un tick con muchos bloques no congela la ventana.
+    Nada de esto fuerza un redibujado: Tk repinta al quedar libre.
+    """
+
+    def __init__(self, schedule, log_sink=None, tick_ms=POLL_INTERVAL_MS, log_buffer=None,
+                 scheduler=None):
+        self.schedule = schedule
+        self.log_sink = log_sink
+        self.log_buffer = log_buffer
+        self.scheduler = scheduler
+        self._log_seq = 0
+        self.tick_ms = tick_ms
+        self._lock = threading.Lock()
+        self._entries = []
+        self._latest = {}
+        self._backlog = deque()  # Entradas ya recogidas, aún sin entregar (hilo de la interfaz)
+        self._draining = False
+        self._running = False
+
+    def start(self):
+        """Arranca el tick (llamar desde el hilo de la interfaz)"""
+        if not self._running:
+            self._running = True
+            self.schedule(self.tick_ms, self._tick)
+
+    def stop(self):
+        self._running = False
+
+    def log(self, message):
+        line = f"[{datetime.now().strftime('%H:%M:%S')}] {message}"
+        with self._lock:
+            self._entries.append((_UI_LOG, line))
+
+    def call(self, callback, *args):
+        with self._lock:
+            self._entries.append((_UI_CALL, (callback, args)))
+
+    def update(self, key, callback, *args):
+        with self._lock:
+            # Se entrega en la posición de su primer aviso pendiente, con el último valor
+            if key not in self._latest:
+                self._entries.append((_UI_UPDATE, key))
+            self._latest[key] = (callback, args)
+
+    def flush(self):
+        """Entrega todo lo pendiente ahora (hilo de la interfaz)"""
+        self._collect()
+        for _ in self._deliver_backlog():
+            pass
+        self._deliver_buffered()
+
+    def _collect(self):
+        """Pasa lo encolado por los hilos al backlog (updates ya con su último valor)"""
+        with self._lock:
+            entries, self._entries = self._entries, []
+            latest, self._latest = self._latest, {}
+        for kind, payload in entries:
+            if kind == _UI_UPDATE:
+                self._backlog.append((_UI_CALL, latest[payload]))
+            else:
+                self._backlog.append((kind, payload))
+
+    def _deliver_backlog(self):
+        """Entrega el backlog en orden; cada llamada es una unidad (yield)"""
+        backlog = self._backlog
+        lines = []
+        while backlog:
+            kind, payload = backlog.popleft()
+            if kind == _UI_LOG:
+                lines.append(payload)
+                continue
+            if lines:
+                self._deliver_lines(lines)
+                lines = []
+            callback, args = payload
+            try:
+                callback(*args)
+            except Exception as e:
+                log.exception(f"⚠️ Error procesando evento de la interfaz: {e}")
+            yield
+        if lines:
+            self._deliver_lines(lines)
+
+    def _drain(self):
+        try:
+            yield from self._deliver_backlog()
+        finally:
+            self._draining = False
+
+    def _deliver_buffered(self):
+        if self.log_buffer is not None:
+            self._log_seq, buffered = self.log_buffer.since(self._log_seq)
+            if buffered:
+                self._deliver_lines(buffered)
+
+    def _deliver_lines(self, lines):
+        if self.log_sink is None:
+            for line in lines:
+                print(line)
+            return
+        try:
+            self.log_sink(lines)
+        except Exception as e:
+            log.warning(f"⚠️ Error escribiendo el log: {e}")
+
+    def _tick(self):
+        try:
+            if self.scheduler is None:
+                self.flush()
+            else:
+                self._collect()
+                if self._backlog and not self._draining:
+                    self._draining = True
+                    self.scheduler.submit(self._drain(), key=UI_CHANNEL_TASK)
+                self._deliver_buffered()
+        finally:
+            if self._running:
+                self.schedule(self.tick_ms, self._tick)
+
+
+class JobCancelled(Exception):
+    """Se lanza dentro de un trabajo cuando el usuario lo cancela"""
+
+
+class Job:
+    """Un trabajo en segundo plano y su canal hacia la interfaz
+
+    La función del trabajo recibe este objeto: usa log()/progress() para
+    informar (nunca toca widgets) y check_cancelled() entre pasos. Si la
+    función termina y devuelve algo después de pedirse la cancelación, ese
+    resultado parcial llega a on_cancelled(resultado); si se cortó con
+    JobCancelled, on_cancelled recibe None.
+    """
+
+    def __init__(self, engine, name, func, on_log=None, on_progress=None,
+                 on_done=None, on_error=None, on_cancelled=None):
+        self.engine = engine
+        self.name = name
+        self.func = func
+        self.on_log = on_log
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancelled = on_cancelled
+        self.cancel_event = threading.Event()
+        self.state = JOB_PENDING
+        self.result = None
+        self.error = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    @property
+    def active(self):
+        return self.state in (JOB_PENDING, JOB_RUNNING)
+
+    def cancel(self):
+        """Pide la cancelación; el trabajo se detiene en su siguiente punto de control"""
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def log(self, message):
+        self.engine.post(self, EVENT_LOG, message)
+
+    def progress(self, done, total, message=''):
+        self.engine.post(self, EVENT_PROGRESS, (done, total, message))
+
+    def call_ui(self, callback):
+        """Ejecuta callback() en el hilo de la interfaz"""
+        self.engine.post(self, EVENT_CALL, callback)
+
+    def _run(self):
+        if self.cancelled:
+            self.state = JOB_CANCELLED
+        else:
+            self.state = JOB_RUNNING
+            try:
+                self.result = self.func(self)
+                self.state = JOB_CANCELLED if self.cancelled else JOB_DONE
+            except JobCancelled:
+                self.state = JOB_CANCELLED
+            except Exception as e:
+                self.error = e
+                self.state = JOB_FAILED
+        self.engine.post(self, EVENT_FINISHED, None)
+
+
+class JobEngine:
+    """Ejecuta trabajos en hilos y entrega sus eventos en el hilo de la interfaz
+
+    schedule(ms, callback): programador del hilo de la interfaz (root.after
+    en Tk). Los hilos de trabajo solo publican eventos en un UIChannel
+    (el de la ventana o uno propio) que la interfaz vacía en un tick fijo;
+    el progreso de cada trabajo se agrupa y llega solo el último valor.
+    """
+
+    def __init__(self, schedule, workers=2, poll_interval=POLL_INTERVAL_MS, channel=None):
+        self.channel = channel if channel is not None else UIChannel(schedule, tick_ms=poll_interval)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='chpines-job')
+        self._jobs = []
+        self._lock = threading.Lock()
+
+    def submit(self, name, func, **callbacks):
+        """Lanza func(job) en un hilo de trabajo; devuelve el Job (llamar desde la interfaz)"""
+        job = Job(self, name, func, **callbacks)
+        with self._lock:
+            self._jobs.append(job)
+        self.channel.start()
+        self._executor.submit(job._run)
+        return job
+
+    def post(self, job, kind, payload):
+        """Publica un evento (seguro desde cualquier hilo)"""
+        if kind == EVENT_PROGRESS:
+            self.channel.update((id(job), EVENT_PROGRESS), self._dispatch, job, kind, payload)
+        else:
+            self.channel.call(self._dispatch, job, kind, payload)
+
+    def active_jobs(self):
+        with self._lock:
+            return [job for job in self._jobs if job.active]
+
+    def cancel_all(self):
+        for job in self.active_jobs():
+            job.cancel()
+
+    def shutdown(self):
+        """Cancela lo pendiente y libera los hilos sin esperar"""
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
+
+    def _dispatch(self, job, kind, payload):
+        if kind == EVENT_LOG:
+            if job.on_log:
+                job.on_log(payload)
+        elif kind == EVENT_PROGRESS:
+            if job.on_progress:
+                job.on_progress(*payload)
+        elif kind == EVENT_CALL:
+            payload()
+        elif kind == EVENT_FINISHED:
+            # Un trabajo sale de la lista solo cuando su evento final ya se entregó
+            with self._lock:
+                if job in self._jobs:
+                    self._jobs.remove(job)
+            if job.state == JOB_DONE and job.on_done:
+                job.on_done(job.result)
+            elif job.state == JOB_CANCELLED and job.on_cancelled:
+                job.on_cancelled(job.result)
+            elif job.state == JOB_FAILED and job.on_error:
+                job.on_error(job.error)
+
+
+# Elementos que caben en cada cola entre etapas (contrapresión)
+PIPELINE_QUEUE_SIZE = 4
+
+_END = object()
+
+
+class Pipeline:
+    """Etapas en hilos unidas por colas acotadas
+
+    La fuente (un iterable) se recorre en el hilo que llama a run(); cada
+    etapa recibe un elemento, lo procesa y pasa lo que devuelve a la
+    siguiente (None = no pasar nada). Si una etapa va más lenta, su cola se
+    llena y las anteriores esperan en lugar de acumular memoria.
+
+    Al cancelar solo se deja de leer la fuente: lo que ya está en vuelo
+    termina de pasar por todas las etapas (las funciones pueden revisar
+    cancel_event para despacharlo rápido), así ningún elemento procesado
+    a medias se pierde antes de llegar a la última etapa.
+    """
+
+    def __init__(self, cancel_event=None, maxsize=PIPELINE_QUEUE_SIZE):
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        self.maxsize = maxsize
+        self.stages = []
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, name, func, workers=1):
+        """Agrega una etapa func(elemento) con `workers` hilos propios"""
+        self.stages.append((name, func, max(1, int(workers))))
+        return self
+
+    def _worker(self, index, inbox, outbox, remaining):
+        name, func, _ = self.stages[index]
+        failed = False
+        try:
+            while True:
+                item = inbox.get()
+                if item is _END:
+                    break
+                if failed:
+                    continue  # Tras un fallo solo se vacía la cola para no bloquear a nadie
+                try:
+                    result = func(item)
+                except Exception as e:
+                    with self._lock:
+                        self.errors.append((name, e))
+                    # Un fallo detiene la fuente; las etapas siguientes terminan lo suyo
+                    self.cancel_event.set()
+                    failed = True
+                    continue
+                if result is not None and outbox is not None:
+                    outbox.put(result)
+        finally:
+            with self._lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and outbox is not None:
+                # El último hilo de la etapa avisa el fin a cada hilo de la siguiente
+                for _ in range(self.stages[index + 1][2]):
+                    outbox.put(_END)
+
+    def run(self, source):
+        """Procesa toda la fuente; bloquea hasta vaciar las etapas
+
+        Relanza la primera excepción de la fuente o de una etapa.
+        """
+        if not self.stages:
+            for _ in source:
+                pass
+            return
+
+        queues = [queue.Queue(maxsize=self.maxsize) for _ in self.stages]
+        remaining = [workers for _, _, workers in self.stages]
+        threads = []
+        for index, (name, _, workers) in enumerate(self.stages):
+            outbox = queues[index + 1] if index + 1 < len(self.stages) else None
+            for n in range(workers):
+                thread = threading.Thread(target=self._worker, args=(index, queues[index], outbox, remaining),
+                                          name=f'chpines-{name}-{n}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in source:
+                # Lo que la fuente ya produjo sigue por las etapas; solo se deja de pedir más
+                queues[0].put(item)
+                if self.cancel_event.is_set():
+                    break
+        except Exception as e:
+            with self._lock:
+                self.errors.insert(0, ('fuente', e))
+            self.cancel_event.set()
+        finally:
+            for _ in range(self.stages[0][2]):
+                queues[0].put(_END)
+            for thread in threads:
+                thread.join()
+
+        if self.errors:
+            raise self.errors[0][1]
@@ -0,0 +1,301 @@
+"""
+CH Pines - Operaciones SSH sobre MikroTik
+Comandos de usuarios hotspot, subida masiva mediante scripts RouterOS (.rsc)
+y pool de canales SSH para crear usuarios en paralelo
+"""
+
+import io
+import itertools
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+
+import app_log
+
+log = app_log.get_logger('mikrotik_ssh')
+
+# Estados por usuario devueltos por las funciones de subida
+RESULT_OK = 'ok'
+RESULT_DUP = 'dup'
+RESULT_ERROR = 'error'
+
+# Detalle de los usuarios que no se enviaron por cancelación
+CANCELLED_DETAIL = 'Cancelado'
+
+# Prefijo de las líneas que el script .rsc imprime con :put
+SCRIPT_MARKER = 'CHP'
+
+# Usuarios por archivo .rsc (mantiene los scripts manejables en routers pequeños)
+SCRIPT_CHUNK_SIZE = 1000
+
+# Sufijo de los .rsc remotos: dos subidas a la vez no comparten archivo
+_script_ids = itertools.count()
+
+# name=valor en la salida 'print terse' (valor simple o entre comillas)
+TERSE_NAME_PATTERN = re.compile(r'(?:^|\s)name=("(?:[^"\\]|\\.)*"|\S+)')
+# Todos los campo=valor de una línea 'print terse'
+TERSE_FIELD_PATTERN = re.compile(r'(?:^|\s)([\w.-]+)=("(?:[^"\\]|\\.)*"|\S*)')
+
+# Canales simultáneos por defecto y máximo de canales por Transport
+DEFAULT_CONCURRENCY = 8
+CHANNELS_PER_TRANSPORT = 8
+
+
+def quote_routeros(value):
+    """Escapa un valor para usarlo entre comillas dobles en RouterOS"""
+    text = str(value)
+    return text.replace('\\', '\\\\').replace('"', '\\"').replace('$', '\\$')
+
+
+def is_duplicate_error(message):
+    """Indica si el error de MikroTik corresponde a un usuario ya existente"""
+    lowered = message.lower()
+    return "already have user" in lowered or "item already exists" in lowered
+
+
+def build_user_add_command(username, password, profile, limit_uptime):
+    """Construye el comando /ip hotspot user add para un usuario"""
+    command = f'/ip hotspot user add name="{quote_routeros(username)}"'
+    if password and password.strip():
+        command += f' password="{quote_routeros(password)}"'
+    command += f' profile="{quote_routeros(profile)}"'
+    if limit_uptime and limit_uptime.strip():
+        command += f' limit-uptime="{quote_routeros(limit_uptime)}"'
+    return command
+
+
+def create_hotspot_user(client, username, password, profile, limit_uptime):
+    """Crea un usuario con un exec_command; devuelve RESULT_OK o RESULT_DUP"""
+    command = build_user_add_command(username, password, profile, limit_uptime)
+    stdin, stdout, stderr = client.exec_command(command)
+    stdout.read()
+    errors = stderr.read().decode('utf-8', errors='ignore').strip()
+
+    if errors:
+        if is_duplicate_error(errors):
+            return RESULT_DUP
+        raise Exception(f"Error MikroTik: {errors}")
+    return RESULT_OK
+
+
+def unquote_routeros(value):
+    """Revierte quote_routeros para valores leídos de la salida de RouterOS"""
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        value = re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+
+def iter_existing_usernames(client):
+    """Recorre los nombres de usuarios hotspot del router con un solo comando
+
+    Lee la salida de 'print terse' línea a línea sin cargarla completa.
+    """
+    stdin, stdout, stderr = client.exec_command('/ip hotspot user print terse without-paging')
+    for line in stdout:
+        match = TERSE_NAME_PATTERN.search(line)
+        if match:
+            yield unquote_routeros(match.group(1))
+
+
+def iter_hotspot_user_usage(client):
+    """Recorre (usuario, uptime, bytes-in) de los usuarios hotspot con un solo comando"""
+    stdin, stdout, stderr = client.exec_command('/ip hotspot user print terse without-paging')
+    for line in stdout:
+        fields = dict(TERSE_FIELD_PATTERN.findall(line))
+        if 'name' in fields:
+            yield unquote_routeros(fields['name']), fields.get('uptime', ''), fields.get('bytes-in', '')
+
+
+def hotspot_user_used(uptime, bytes_in):
+    """Indica si un usuario hotspot ya se usó (tiene tiempo o tráfico acumulado)"""
+    return (uptime or '0s') not in ('0s', '0') or (bytes_in or '0') != '0'
+
+
+def render_user_script(users):
+    """Genera el texto .rsc que crea todos los usuarios y reporta cada resultado
+
+    users: iterable de tuplas (username, password, profile, limit_uptime)
+    Cada usuario imprime una línea 'CHP;<estado>;<usuario>' para poder
+    conciliar el resultado individual tras un único /import. El add va
+    directo (sin buscar antes en toda la tabla de usuarios); solo si falla
+    se busca el nombre para distinguir un duplicado de un error.
+    """
+    lines = [f'# CH Pines - script generado {time.strftime("%Y-%m-%d %H:%M:%S")}']
+    for username, password, profile, limit_uptime in users:
+        name = quote_routeros(username)
+        add_command = build_user_add_command(username, password, profile, limit_uptime)
+        lines.append(
+            f':do {{{add_command}; :put "{SCRIPT_MARKER};{RESULT_OK};{name}"}} '
+            f'on-error={{:if ([:len [/ip hotspot user find where name="{name}"]] > 0) '
+            f'do={{:put "{SCRIPT_MARKER};{RESULT_DUP};{name}"}} '
+            f'else={{:put "{SCRIPT_MARKER};{RESULT_ERROR};{name}"}}}}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+def parse_script_output(output, usernames, failure_detail=''):
+    """Convierte la salida de /import en {usuario: (estado, detalle)}"""
+    results = {}
+    for line in output.splitlines():
+        line = line.strip()
+        if not line.startswith(SCRIPT_MARKER + ';'):
+            continue
+        parts = line.split(';', 2)
+        if len(parts) == 3 and parts[1] in (RESULT_OK, RESULT_DUP, RESULT_ERROR):
+            detail = 'Rechazado por RouterOS' if parts[1] == RESULT_ERROR else ''
+            results[parts[2]] = (parts[1], detail)
+
+    # Usuarios sin marca: el script se interrumpió antes de llegar a ellos
+    detail = failure_detail or 'Sin respuesta del script'
+    for username in usernames:
+        if username not in results:
+            results[username] = (RESULT_ERROR, detail)
+    return results
+
+
+def upload_users_script(client, users, chunk_size=SCRIPT_CHUNK_SIZE, on_progress=None,
+                        cancel_event=None):
+    """Sube usuarios en bloque: .rsc por SFTP + un /import por bloque
+
+    client: paramiko.SSHClient ya conectado
+    users: lista de tuplas (username, password, profile, limit_uptime)
+    on_progress: callback opcional (procesados, total) tras cada bloque
+    cancel_event: threading.Event opcional; se revisa entre bloques
+    Devuelve {usuario: (estado, detalle)} para todos los usuarios.
+    """
+    results = {}
+    total = len(users)
+    sftp = client.open_sftp()
+    try:
+        for chunk_start in range(0, total, chunk_size):
+            chunk = users[chunk_start:chunk_start + chunk_size]
+            if cancel_event is not None and cancel_event.is_set():
+                for user in users[chunk_start:]:
+                    results[user[0]] = (RESULT_ERROR, CANCELLED_DETAIL)
+                break
+            usernames = [user[0] for user in chunk]
+            remote_name = f"chpines_{int(time.time() * 1000)}_{next(_script_ids)}.rsc"
+
+            script = render_user_script(chunk).encode('utf-8')
+            sftp.putfo(io.BytesIO(script), remote_name)
+
+            try:
+                stdin, stdout, stderr = client.exec_command(f'/import file-name={remote_name}')
+                output = stdout.read().decode('utf-8', errors='ignore')
+                errors = stderr.read().decode('utf-8', errors='ignore').strip()
+            finally:
+                try:
+                    sftp.remove(remote_name)
+                except Exception:
+                    pass
+
+            results.update(parse_script_output(output, usernames, errors))
+
+            if on_progress:
+                on_progress(min(chunk_start + chunk_size, total), total)
+    finally:
+        sftp.close()
+
+    return results
+
+
+def open_ssh_client(host, port, username, password, timeout=10):
+    """Abre una conexión SSH con la misma política que la conexión manual"""
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect(host, port=port, username=username, password=password, timeout=timeout)
+    return client
+
+
+class SSHChannelPool:
+    """Pool de canales exec multiplexados sobre uno o varios Transport de paramiko
+
+    Cada comando abre su canal en el Transport que le toca (round-robin),
+    así hasta `concurrency` comandos viajan a la vez y el RTT de sitios
+    remotos se solapa en lugar de sumarse ticket a ticket.
+    """
+
+    def __init__(self, client, concurrency=DEFAULT_CONCURRENCY, connect_params=None, timeout=30):
+        """client: SSHClient ya conectado (se reutiliza, no se cierra)
+        connect_params: (host, port, username, password) para abrir Transports extra
+        cuando la concurrencia supera CHANNELS_PER_TRANSPORT
+        """
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = timeout
+        self._extra_clients = []
+        self.transports = [client.get_transport()]
+
+        wanted = (self.concurrency + CHANNELS_PER_TRANSPORT - 1) // CHANNELS_PER_TRANSPORT
+        if connect_params:
+            try:
+                for _ in range(wanted - 1):
+                    extra = open_ssh_client(*connect_params)
+                    self._extra_clients.append(extra)
+                    self.transports.append(extra.get_transport())
+            except Exception as e:
+                # Seguir con los Transports que sí se pudieron abrir
+                log.warning(f"⚠️ Solo {len(self.transports)} conexiones SSH para el pool: {e}")
+
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+
+    def _next_transport(self):
+        with self._counter_lock:
+            transport = self.transports[self._counter % len(self.transports)]
+            self._counter += 1
+        return transport
+
+    def run(self, command):
+        """Ejecuta un comando en un canal nuevo; devuelve (stdout, stderr)"""
+        channel = self._next_transport().open_session(timeout=self.timeout)
+        try:
+            channel.settimeout(self.timeout)
+            channel.exec_command(command)
+            output = channel.makefile('rb').read().decode('utf-8', errors='ignore')
+            errors = channel.makefile_stderr('rb').read().decode('utf-8', errors='ignore')
+            return output, errors.strip()
+        finally:
+            channel.close()
+
+    def _create_user(self, user, cancel_event=None):
+        if cancel_event is not None and cancel_event.is_set():
+            return user[0], (RESULT_ERROR, CANCELLED_DETAIL)
+        try:
+            output, errors = self.run(build_user_add_command(*user))
+        except Exception as e:
+            return user[0], (RESULT_ERROR, str(e))
+        if errors:
+            if is_duplicate_error(errors):
+                return user[0], (RESULT_DUP, '')
+            return user[0], (RESULT_ERROR, f"Error MikroTik: {errors}")
+        return user[0], (RESULT_OK, '')
+
+    def create_users(self, users, on_progress=None, cancel_event=None):
+        """Crea los usuarios repartidos entre los canales del pool
+
+        users: lista de tuplas (username, password, profile, limit_uptime)
+        cancel_event: threading.Event opcional; los usuarios aún no enviados
+        se marcan como cancelados
+        Devuelve {usuario: (estado, detalle)}.
+        """
+        results = {}
+        total = len(users)
+        create = lambda user: self._create_user(user, cancel_event)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for done, (username, result) in enumerate(executor.map(create, users), 1):
+                results[username] = result
+                if on_progress and (done % 100 == 0 or done == total):
+                    on_progress(done, total)
+        return results
+
+    def close(self):
+        """Cierra solo las conexiones extra abiertas por el pool"""
+        for client in self._extra_clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+        self._extra_clients = []
@@ -0,0 +1,193 @@
+"""
+CH Pines - Plan de páginas de impresión
+Dónde cae cada ticket (hoja, fila, par de columnas), calculado una sola
+vez por conjunto de tickets y compartido por la vista previa, el Excel y
+el PDF
+"""
+
+import threading
+from array import array
+from collections.abc import Mapping
+
+import app_log
+import ticket_store
+
+log = app_log.get_logger('page_layout')
+
+# Geometría de la plantilla: 40 filas por página, 4 pares (tiempo, PIN)
+TEMPLATE_ROWS = 40
+COLUMN_PAIRS = [(1, 2), (3, 4), (6, 7), (8, 9)]
+LAST_COLUMN = 9
+GROUP_GAP_ROWS = 4
+
+# Colores para diferentes tiempos (paleta pastel)
+TIME_COLORS = {
+    '1H': 'FFFF99',        # Amarillo pastel (1 hora)
+    '2H': 'FFE0B3',        # Naranja pastel (2 horas)
+    '3H': 'B3FFB3',        # Verde pastel (3 horas)
+    '4H': 'B3E0FF',        # Azul pastel (4 horas)
+    '5H': 'FFB3E0',        # Rosa pastel (5 horas)
+    '6H': 'E0B3FF',        # Morado pastel (6 horas)
+    'DÍA': 'FFD9B3',       # Durazno pastel (1 día)
+    'SEM': 'B3FFE0',       # Mint pastel (1 semana)
+    'MES': 'D9D9D9',       # Gris pastel (1 mes)
+}
+DEFAULT_TIME_COLOR = 'FFFFFF00'
+
+# Orden de los grupos en la hoja (1H, 2H, 3H, DÍA, SEM, MES, etc.)
+TIME_PRIORITY = {'1H': 1, '2H': 2, '3H': 3, '4H': 4, '5H': 5, '6H': 6,
+                 'DÍA': 10, 'SEM': 20, 'MES': 30, '15D': 25}
+
+# Casilla sin ticket (filas de separación y final de cada grupo)
+EMPTY = -1
+
+
+class LayoutPlan:
+    """Ubicación final de cada ticket en la hoja, en arreglos compactos
+
+    Los tickets se agrupan por tiempo mostrado (format_time se llama una
+    vez por valor distinto), los grupos van en orden TIME_PRIORITY, cada
+    grupo llena 4 tickets por fila y entre grupos quedan GROUP_GAP_ROWS
+    filas vacías. Cada bloque de TEMPLATE_ROWS filas es una página.
+
+    - slots[(fila - 1) * 4 + par]: índice del ticket en la lista o EMPTY.
+    - row_groups[fila - 1]: grupo de la fila (índice en labels) o EMPTY.
+    Los PIN se leen del ticket al consultarlos; solo se guardan aparte los
+    de tickets sin 'username' o con error. Con un TicketStore se agrupa
+    sobre los códigos de la columna de tiempo, sin crear vistas por ticket.
+    """
+
+    def __init__(self, tickets, format_time):
+        self.tickets = tickets
+        self.format_time = format_time
+        self.ticket_count = len(tickets)
+        # TicketStore.version cambia con cada extend; las listas no tienen versión
+        self.version = getattr(tickets, 'version', None)
+        self._pins = {}
+        if isinstance(tickets, ticket_store.TicketStore):
+            self._username = tickets.username
+            groups = self._group_store(tickets, format_time)
+        else:
+            self._username = lambda index: tickets[index]['username']
+            groups = self._group_tickets(tickets, format_time)
+
+        ordered = sorted(groups.items(), key=lambda item: TIME_PRIORITY.get(item[0], 99))
+        per_row = len(COLUMN_PAIRS)
+        self.labels = [label for label, _ in ordered]
+        self.groups = [(label, len(members)) for label, members in ordered]
+        self.slots = array('i')
+        self.row_groups = array('i')
+        for number, (_, members) in enumerate(ordered):
+            if number:
+                self.slots.extend(array('i', [EMPTY]) * (GROUP_GAP_ROWS * per_row))
+                self.row_groups.extend(array('i', [EMPTY]) * GROUP_GAP_ROWS)
+            rows = (len(members) + per_row - 1) // per_row
+            self.slots.extend(members)
+            self.slots.extend(array('i', [EMPTY]) * (rows * per_row - len(members)))
+            self.row_groups.extend(array('i', [number]) * rows)
+
+        self.rows = len(self.row_groups)
+        self.pages = (self.rows + TEMPLATE_ROWS - 1) // TEMPLATE_ROWS
+
+    def _group_tickets(self, tickets, format_time):
+        """Agrupa una lista de diccionarios: {etiqueta: índices en orden}"""
+        labels = {}
+        groups = {}
+        for i, ticket in enumerate(tickets):
+            try:
+                if isinstance(ticket, Mapping):
+                    raw_time = ticket.get('time_limit', '1h')
+                    if raw_time not in labels:
+                        labels[raw_time] = format_time(raw_time)
+                    time_display = labels[raw_time]
+                elif isinstance(ticket, str):
+                    # Si es string, asumir que es username
+                    self._pins[i] = ticket
+                    time_display = '1H'
+                else:
+                    time_display = '1H'
+            except Exception as e:
+                log.error("❌ Error procesando ticket %s: %s", i, e)
+                self._pins[i] = f'ERROR{i}'
+                time_display = '1H'
+            members = groups.setdefault(time_display, array('i'))
+            if i not in self._pins and not (isinstance(ticket, Mapping) and 'username' in ticket):
+                self._pins[i] = f'USER{len(members) + 1:03d}'
+            members.append(i)
+        return groups
+
+    def _group_store(self, store, format_time):
+        """Agrupa un TicketStore por código de tiempo (format_time una vez por valor)"""
+        codes, values = store.time_codes()
+        code_labels = []
+        for value in values:
+            try:
+                code_labels.append(format_time('1h' if value is None else value))
+            except Exception as e:
+                log.error("❌ Error procesando tiempo %s: %s", value, e)
+                code_labels.append('1H')
+        groups = {}
+        for i, code in enumerate(codes):
+            label = code_labels[code]
+            members = groups.get(label)
+            if members is None:
+                members = groups[label] = array('i')
+            members.append(i)
+        return groups
+
+    def matches(self, tickets, format_time):
+        """Indica si el plan sigue valiendo para esta lista de tickets"""
+        return (self.tickets is tickets and self.ticket_count == len(tickets)
+                and self.version == getattr(tickets, 'version', None)
+                and self.format_time == format_time)
+
+    def pin(self, index):
+        pin = self._pins.get(index)
+        return pin if pin is not None else self._username(index)
+
+    def row_cells(self, row):
+        """Celdas de una fila de la hoja (desde 1): [(col_tiempo, col_pin, tiempo, pin)]"""
+        group = self.row_groups[row - 1]
+        if group == EMPTY:
+            return []
+        label = self.labels[group]
+        base = (row - 1) * len(COLUMN_PAIRS)
+        cells = []
+        for pair, (col_time, col_pin) in enumerate(COLUMN_PAIRS):
+            index = self.slots[base + pair]
+            if index == EMPTY:
+                break
+            cells.append((col_time, col_pin, label, self.pin(index)))
+        return cells
+
+    def iter_rows(self):
+        """Recorre todas las filas en orden: (fila, celdas), separaciones incluidas"""
+        for row in range(1, self.rows + 1):
+            yield row, self.row_cells(row)
+
+    def page_rows(self, page):
+        """Filas de la hoja de la página indicada (desde 0)"""
+        start = page * TEMPLATE_ROWS
+        return range(start + 1, min(self.rows, start + TEMPLATE_ROWS) + 1)
+
+
+_plan_lock = threading.Lock()
+_last_plan = None
+
+
+def plan_for(tickets, format_time):
+    """Plan de la lista de tickets, reutilizado mientras la lista no cambie
+
+    Se reutiliza el último plan si es la misma lista (no una copia) con la
+    misma cantidad de tickets, la misma versión del TicketStore y el mismo
+    formato de tiempo; agregar, quitar o reemplazar la lista genera uno nuevo.
+    """
+    global _last_plan
+    with _plan_lock:
+        plan = _last_plan
+    if plan is not None and plan.matches(tickets, format_time):
+        return plan
+    plan = LayoutPlan(tickets, format_time)
+    with _plan_lock:
+        _last_plan = plan
+    return plan
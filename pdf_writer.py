@@ -0,0 +1,403 @@
+"""
+CH Pines - PDF de tickets sin Excel
+Dibuja el mismo diseño de Plantilla.xlsx (40 filas x 4 pares tiempo/PIN,
+colores por tiempo) directamente en PDF, una página a la vez: cada página
+se comprime y se escribe al disco en cuanto se completa
+"""
+
+import os
+import re
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+import page_layout
+import plantilla_export
+
+# Tamaños de papel de Excel (paperSize) en puntos; sin dato Excel usa Carta
+PAPER_SIZES = {
+    1: (612, 792),          # Carta
+    5: (612, 1008),         # Oficio (Legal)
+    9: (595.28, 841.89),    # A4
+    14: (612, 936),         # Folio 8.5 x 13
+}
+DEFAULT_PAPER = (612, 792)
+
+# Fuente estándar del PDF (no se incrusta) con codificación WinAnsi (cp1252)
+FONT_NAME = 'Helvetica-Bold'
+FONT_ENCODING = 'cp1252'
+DEFAULT_FONT_SIZE = 11
+
+# Anchos de Helvetica-Bold (1/1000 del tamaño) para los caracteres 32..126
+_ASCII_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+# Letras acentuadas del español: mismo ancho que la letra base
+_ACCENTED_BASE = {'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U', 'Ü': 'U', 'Ñ': 'N',
+                  'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u', 'ü': 'u', 'ñ': 'n'}
+DEFAULT_CHAR_WIDTH = 556
+
+
+def _build_width_table():
+    """Ancho de cada byte cp1252, calculado una sola vez"""
+    table = [DEFAULT_CHAR_WIDTH] * 256
+    for offset, width in enumerate(_ASCII_WIDTHS):
+        table[32 + offset] = width
+    for accented, base in _ACCENTED_BASE.items():
+        table[accented.encode(FONT_ENCODING)[0]] = table[ord(base)]
+    return table
+
+
+CHAR_WIDTHS = _build_width_table()
+
+# Grosor de línea por estilo de borde de Excel
+BORDER_WIDTHS = {'hair': 0.25, 'thin': 0.5, 'dotted': 0.5, 'dashed': 0.5, 'medium': 1.0,
+                 'mediumDashed': 1.0, 'double': 1.5, 'thick': 1.5}
+# Color para bordes y textos con color de tema (el PDF no conoce el tema del libro)
+DEFAULT_BORDER_COLOR = '4472C4'
+DEFAULT_TEXT_COLOR = '000000'
+
+# Distancia de la línea base bajo el centro de la celda (fracción del tamaño)
+BASELINE_OFFSET = 0.35
+
+_HEADER_CODE = re.compile(r'&(".*?"|\d+|K[0-9A-Fa-f]{6}|[A-Za-z])')
+
+
+def _excel_width_to_points(width):
+    """Ancho de columna de Excel (caracteres) a puntos, como lo imprime Excel"""
+    pixels = int(width * 7 + 0.5)
+    return pixels * 0.75
+
+
+def _rgb(color, default):
+    """Color de openpyxl ('AARRGGBB') a 'RRGGBB'; tema/indexado -> default"""
+    if color is not None and getattr(color, 'type', None) == 'rgb' and color.rgb:
+        return str(color.rgb)[-6:]
+    return default
+
+
+def _color_op(rgb, operator):
+    r, g, b = (int(rgb[i:i + 2], 16) / 255 for i in (0, 2, 4))
+    return f"{r:.3f} {g:.3f} {b:.3f} {operator}"
+
+
+def _escape(data):
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+@lru_cache(maxsize=4096)
+def measure_text(text, size):
+    """(bytes escapados para el PDF, ancho en puntos) de un texto en Helvetica-Bold"""
+    data = text.encode(FONT_ENCODING, errors='replace')
+    width = sum(CHAR_WIDTHS[byte] for byte in data) * size / 1000
+    return _escape(data).decode('latin-1'), width
+
+
+class PdfStreamWriter:
+    """Escritor PDF mínimo que vuelca cada página al disco
+
+    Objetos fijos: 1 catálogo, 2 árbol de páginas, 3 fuente. Las páginas
+    se escriben al llegar; el árbol de páginas, la tabla xref y el trailer
+    van al cerrar, así en memoria solo quedan los desplazamientos.
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+    FONT_ID = 3
+
+    def __init__(self, path, compress_level=6):
+        self.path = path
+        self.compress_level = compress_level
+        self._file = open(path, 'wb')
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = self.FONT_ID + 1
+        self._file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Un PDF a medias no sirve: se borra
+            self._file.close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def _write_object(self, obj_id, body):
+        self._offsets[obj_id] = self._file.tell()
+        self._file.write(f"{obj_id} 0 obj\n".encode('latin-1'))
+        self._file.write(body)
+        self._file.write(b"\nendobj\n")
+
+    def _new_id(self):
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def add_page(self, width, height, content):
+        """Agrega una página con su flujo de dibujo (str de operadores PDF)"""
+        data = zlib.compress(content.encode('latin-1'), self.compress_level)
+        content_id = self._new_id()
+        self._write_object(content_id, f"<< /Length {len(data)} /Filter /FlateDecode >>\nstream\n".encode('latin-1')
+                           + data + b"\nendstream")
+        page_id = self._new_id()
+        self._write_object(page_id, (
+            f"<< /Type /Page /Parent {self.PAGES_ID} 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] "
+            f"/Resources << /Font << /F1 {self.FONT_ID} 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode('latin-1'))
+        self._page_ids.append(page_id)
+
+    def close(self):
+        self._write_object(self.FONT_ID, (
+            f"<< /Type /Font /Subtype /Type1 /BaseFont /{FONT_NAME} /Encoding /WinAnsiEncoding >>"
+        ).encode('latin-1'))
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(self.PAGES_ID, (
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>"
+        ).encode('latin-1'))
+        self._write_object(self.CATALOG_ID, f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>".encode('latin-1'))
+
+        xref_offset = self._file.tell()
+        lines = [f"xref\n0 {self._next_id}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, self._next_id):
+            lines.append(f"{self._offsets[obj_id]:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {self._next_id} /Root {self.CATALOG_ID} 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n")
+        self._file.write(''.join(lines).encode('latin-1'))
+        self._file.close()
+
+
+class _PageLayout:
+    """Geometría de una página a partir de la plantilla compilada
+
+    Coordenadas de cada celda (fila de plantilla, columna) y el dibujo ya
+    resuelto por celda: relleno, bordes, tamaño y color de texto.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        orientation = template.orientation or 'portrait'
+        width, height = PAPER_SIZES.get(int(template.paper_size or 0), DEFAULT_PAPER)
+        if orientation == 'landscape':
+            width, height = height, width
+        self.width = width
+        self.height = height
+
+        margins = template.margins
+        self.left = (margins.left or 0) * 72
+        self.top = (margins.top or 0) * 72
+        self.header_margin = (margins.header or 0) * 72
+        self.footer_margin = (margins.footer or 0) * 72
+        usable_width = width - self.left - (margins.right or 0) * 72
+        usable_height = height - self.top - (margins.bottom or 0) * 72
+
+        # Columnas visibles (las ocultas, como la E, no ocupan espacio)
+        widths = {}
+        for letter, col_width, hidden in template.columns:
+            column = sum((ord(ch) - 64) * 26 ** i for i, ch in enumerate(reversed(letter)))
+            widths[column] = 0 if hidden else _excel_width_to_points(col_width or 8.43)
+        col_widths = [widths.get(col, _excel_width_to_points(8.43)) for col in range(1, plantilla_export.LAST_COLUMN + 1)]
+        row_heights = []
+        for row in range(1, plantilla_export.TEMPLATE_ROWS + 1):
+            hidden = template.rows.get(row, (None, False))[1]
+            row_heights.append(0 if hidden else template.row_height(row))
+
+        # Si la cuadrícula no cabe se reduce como "ajustar a la página"
+        self.scale = min(1.0, usable_width / (sum(col_widths) or 1), usable_height / (sum(row_heights) or 1))
+        self.col_x = [self.left]
+        for col_width in col_widths:
+            self.col_x.append(self.col_x[-1] + col_width * self.scale)
+        self.row_top = [height - self.top]
+        for row_height in row_heights:
+            self.row_top.append(self.row_top[-1] - row_height * self.scale)
+
+        self._cell_specs = {}
+
+    def cell_spec(self, template_row, col, time_type=None):
+        """Dibujo de una celda: (caja, relleno, bordes, tamaño, color de texto)
+
+        time_type: etiqueta de tiempo para las celdas de tiempo (su color de
+        relleno reemplaza el de la plantilla, igual que en el Excel).
+        """
+        key = (template_row, col, time_type)
+        spec = self._cell_specs.get(key)
+        if spec is not None:
+            return spec
+
+        x0, x1 = self.col_x[col - 1], self.col_x[col]
+        y_top, y_bottom = self.row_top[template_row - 1], self.row_top[template_row]
+        box = (x0, y_bottom, x1 - x0, y_top - y_bottom)
+
+        font = border = fill = None
+        source = self.template.cells.get((template_row, col))
+        if source:
+            font, border, fill = source[0], source[1], source[2]
+
+        if time_type is not None:
+            fill_rgb = plantilla_export.TIME_COLORS.get(time_type, plantilla_export.DEFAULT_TIME_COLOR)[-6:]
+        elif fill is not None and fill.fill_type == 'solid':
+            fill_rgb = _rgb(fill.fgColor, None)
+        else:
+            fill_rgb = None
+
+        borders = []
+        if border is not None:
+            sides = (('left', (x0, y_bottom, x0, y_top)), ('right', (x1, y_bottom, x1, y_top)),
+                     ('top', (x0, y_top, x1, y_top)), ('bottom', (x0, y_bottom, x1, y_bottom)))
+            for side_name, segment in sides:
+                side = getattr(border, side_name)
+                if side is not None and side.style:
+                    line_width = BORDER_WIDTHS.get(side.style, 0.5) * self.scale
+                    borders.append(((line_width, _rgb(side.color, DEFAULT_BORDER_COLOR)), segment))
+
+        size = (font.sz if font is not None and font.sz else DEFAULT_FONT_SIZE) * self.scale
+        text_rgb = _rgb(font.color, DEFAULT_TEXT_COLOR) if font is not None else DEFAULT_TEXT_COLOR
+        spec = self._cell_specs[key] = (box, fill_rgb, borders, size, text_rgb)
+        return spec
+
+
+class _PageCanvas:
+    """Operaciones de una página agrupadas por color para un flujo compacto"""
+
+    def __init__(self):
+        self.fills = {}
+        self.lines = {}
+        self.texts = {}
+        self.extra = []
+
+    def draw_cell(self, spec, text):
+        (x, y, width, height), fill_rgb, borders, size, text_rgb = spec
+        if fill_rgb:
+            self.fills.setdefault(fill_rgb, []).append(f"{x:.2f} {y:.2f} {width:.2f} {height:.2f} re")
+        for style, (x0, y0, x1, y1) in borders:
+            self.lines.setdefault(style, []).append(f"{x0:.2f} {y0:.2f} m {x1:.2f} {y1:.2f} l")
+        if text:
+            data, text_width = measure_text(text, size)
+            tx = x + (width - text_width) / 2
+            ty = y + height / 2 - size * BASELINE_OFFSET
+            self.texts.setdefault((size, text_rgb), []).append(f"1 0 0 1 {tx:.2f} {ty:.2f} Tm ({data}) Tj")
+
+    def draw_text(self, x, y, text, size, rgb, align='left', underline=False):
+        data, text_width = measure_text(text, size)
+        if align == 'center':
+            x -= text_width / 2
+        elif align == 'right':
+            x -= text_width
+        self.texts.setdefault((size, rgb), []).append(f"1 0 0 1 {x:.2f} {y:.2f} Tm ({data}) Tj")
+        if underline:
+            self.extra.append(f"{_color_op(rgb, 'RG')} {size / 18:.2f} w "
+                              f"{x:.2f} {y - size * 0.12:.2f} m {x + text_width:.2f} {y - size * 0.12:.2f} l S")
+
+    def render(self):
+        ops = []
+        for rgb, rects in self.fills.items():
+            ops.append(_color_op(rgb, 'rg'))
+            ops.extend(rects)
+            ops.append('f')
+        for (line_width, rgb), segments in self.lines.items():
+            ops.append(f"{line_width:.2f} w {_color_op(rgb, 'RG')}")
+            ops.extend(segments)
+            ops.append('S')
+        ops.extend(self.extra)
+        for (size, rgb), texts in self.texts.items():
+            ops.append(f"BT /F1 {size:.2f} Tf {_color_op(rgb, 'rg')}")
+            ops.extend(texts)
+            ops.append('ET')
+        return '\n'.join(ops)
+
+
+def _header_parts(item, page, pages, now):
+    """Textos (izquierda, centro, derecha) de un encabezado/pie de Excel ya resueltos"""
+    parts = []
+    for name in ('left', 'center', 'right'):
+        part = getattr(item, name, None) if item is not None else None
+        text = part.text if part is not None and part.text else ''
+        if not text:
+            parts.append(None)
+            continue
+        underline = '&U' in text
+        text = (text.replace('&&', '\0').replace('&P', str(page)).replace('&N', str(pages))
+                .replace('&D', now.strftime('%d/%m/%Y')).replace('&T', now.strftime('%H:%M')))
+        text = _HEADER_CODE.sub('', text).replace('\0', '&').strip()
+        size = float(part.size) if part.size else DEFAULT_FONT_SIZE
+        rgb = str(part.color)[-6:] if part.color else DEFAULT_TEXT_COLOR
+        parts.append((text, size, rgb, underline))
+    return parts
+
+
+def _draw_header_footer(canvas, layout, page, pages, now):
+    template = layout.template
+    right_x = layout.width - layout.left
+    positions = (('left', layout.left), ('center', layout.width / 2), ('right', right_x))
+    for item, is_header in ((template.odd_header, True), (template.odd_footer, False)):
+        for (align, x), part in zip(positions, _header_parts(item, page, pages, now)):
+            if not part:
+                continue
+            text, size, rgb, underline = part
+            if is_header:
+                y = layout.height - max(layout.header_margin, 4) - size
+            else:
+                y = max(layout.footer_margin, 4) + size * 0.25
+            canvas.draw_text(x, y, text, size, rgb, align, underline)
+
+
+def render_tickets_pdf(template_path, output_filename, tickets, format_time, on_progress=None, template=None,
+                       plan=None):
+    """Genera el PDF de tickets con el diseño de la plantilla, página por página
+
+    Usa el mismo page_layout.LayoutPlan que plantilla_export.export_tickets;
+    cada bloque de 40 filas es una página. on_progress(página, total) se
+    llama al escribir cada página. Devuelve {'tickets', 'rows', 'pages', 'groups'}.
+    """
+    if template is None:
+        template = plantilla_export.load_template(template_path)
+    if plan is None:
+        plan = page_layout.plan_for(tickets, format_time)
+    total_rows = plan.rows
+    rows_per_page = page_layout.TEMPLATE_ROWS
+    total_pages = max(1, plan.pages)
+    layout = _PageLayout(template)
+    now = datetime.now()
+
+    with PdfStreamWriter(output_filename) as pdf:
+        canvas = _PageCanvas()
+        page = 1
+        for row, cells in plan.iter_rows():
+            template_row = (row - 1) % rows_per_page + 1
+            for col_time, col_pin, time_type, pin in cells:
+                canvas.draw_cell(layout.cell_spec(template_row, col_time, time_type), time_type)
+                canvas.draw_cell(layout.cell_spec(template_row, col_pin), str(pin))
+            if template_row == rows_per_page:
+                _draw_header_footer(canvas, layout, page, total_pages, now)
+                pdf.add_page(layout.width, layout.height, canvas.render())
+                if on_progress:
+                    on_progress(page, total_pages)
+                canvas = _PageCanvas()
+                page += 1
+
+        if pdf.page_count < total_pages:
+            _draw_header_footer(canvas, layout, page, total_pages, now)
+            pdf.add_page(layout.width, layout.height, canvas.render())
+            if on_progress:
+                on_progress(page, total_pages)
+
+    return {
+        'tickets': plan.ticket_count,
+        'rows': total_rows,
+        'pages': total_pages,
+        'groups': list(plan.groups),
+    }
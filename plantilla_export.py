@@ -0,0 +1,341 @@
+"""
+CH Pines - Exportación a Excel con tu plantilla en modo streaming
+Hoja write-only de openpyxl: cada fila se escribe en cuanto se produce y
+los estilos de la plantilla se precalculan una sola vez por celda de
+plantilla, así la memoria no crece con la cantidad de tickets
+"""
+
+import hashlib
+import json
+import os
+import threading
+from copy import copy
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Protection
+from openpyxl.styles.fills import Fill
+from openpyxl.worksheet.header_footer import HeaderFooter
+from openpyxl.worksheet.page import PageMargins
+from openpyxl.xml.functions import fromstring, tostring
+
+import app_log
+import page_layout
+
+log = app_log.get_logger('plantilla_export')
+
+# Geometría y colores de la hoja (definidos junto al plan de páginas)
+TEMPLATE_ROWS = page_layout.TEMPLATE_ROWS
+COLUMN_PAIRS = page_layout.COLUMN_PAIRS
+LAST_COLUMN = page_layout.LAST_COLUMN
+TIME_COLORS = page_layout.TIME_COLORS
+DEFAULT_TIME_COLOR = page_layout.DEFAULT_TIME_COLOR
+DEFAULT_ROW_HEIGHT = 21.6
+
+# Filas entre avisos de progreso
+PROGRESS_EVERY_ROWS = 1000
+
+# Plantilla compilada guardada junto a la plantilla (Plantilla.xlsx -> Plantilla.compilada.json)
+CACHE_SUFFIX = '.compilada.json'
+CACHE_VERSION = 1
+
+# Clases para reconstruir los estilos guardados como XML, en el orden de CompiledTemplate.cells
+STYLE_CLASSES = (Font, Border, Fill, None, Protection, Alignment)
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _to_xml(obj):
+    return tostring(obj.to_tree()).decode('utf-8')
+
+
+class CompiledTemplate:
+    """Lo que la exportación necesita de Plantilla.xlsx, leído una sola vez
+
+    Dimensiones, configuración de página y los objetos de estilo de cada
+    celda de datos de las 40 filas de la plantilla. Se puede guardar como
+    JSON (to_dict/from_dict) para no volver a abrir la plantilla.
+    """
+
+    def __init__(self, template_path, source_hash=''):
+        self.template_path = template_path
+        self.source_hash = source_hash
+        template_wb = load_workbook(template_path)
+        try:
+            ws = template_wb.active
+            self.columns = [(letter, dim.width, dim.hidden) for letter, dim in ws.column_dimensions.items()]
+            self.rows = {row: (dim.height, dim.hidden) for row, dim in ws.row_dimensions.items()}
+            self.orientation = ws.page_setup.orientation
+            self.paper_size = ws.page_setup.paperSize
+            self.margins = copy(ws.page_margins)
+            header_footer = copy(ws.HeaderFooter)
+            self.odd_header = header_footer.oddHeader
+            self.odd_footer = header_footer.oddFooter
+
+            self.cells = {}
+            for row in range(1, TEMPLATE_ROWS + 1):
+                for col_time, col_pin in COLUMN_PAIRS:
+                    for col in (col_time, col_pin):
+                        cell = ws.cell(row=row, column=col)
+                        if cell.has_style:
+                            # Copias propias: los StyleProxy de la plantilla no se registran en otro libro
+                            self.cells[(row, col)] = (copy(cell.font), copy(cell.border), copy(cell.fill),
+                                                      cell.number_format, copy(cell.protection),
+                                                      copy(cell.alignment))
+        finally:
+            template_wb.close()
+
+    def to_dict(self):
+        """Forma serializable (los estilos van como XML de openpyxl)"""
+        header_footer = HeaderFooter(oddHeader=self.odd_header, oddFooter=self.odd_footer)
+        # Las celdas repiten pocos estilos: tabla de estilos únicos y celdas con índices
+        style_table = []
+        handles = {}
+        cells = []
+        for (row, col), styles in self.cells.items():
+            indexes = []
+            for style_cls, value in zip(STYLE_CLASSES, styles):
+                serialized = value if style_cls is None else _to_xml(value)
+                if serialized not in handles:
+                    handles[serialized] = len(style_table)
+                    style_table.append(serialized)
+                indexes.append(handles[serialized])
+            cells.append([row, col, indexes])
+        return {
+            'version': CACHE_VERSION,
+            'sha256': self.source_hash,
+            'columns': self.columns,
+            'rows': [[row, height, hidden] for row, (height, hidden) in self.rows.items()],
+            'orientation': self.orientation,
+            'paper_size': self.paper_size,
+            'margins': _to_xml(self.margins),
+            'header_footer': _to_xml(header_footer),
+            'styles': style_table,
+            'cells': cells,
+        }
+
+    @classmethod
+    def from_dict(cls, data, template_path):
+        """Reconstruye la plantilla compilada sin abrir el .xlsx"""
+        template = cls.__new__(cls)
+        template.template_path = template_path
+        template.source_hash = data['sha256']
+        template.columns = [tuple(column) for column in data['columns']]
+        template.rows = {row: (height, hidden) for row, height, hidden in data['rows']}
+        template.orientation = data['orientation']
+        template.paper_size = data['paper_size']
+        template.margins = PageMargins.from_tree(fromstring(data['margins']))
+        header_footer = HeaderFooter.from_tree(fromstring(data['header_footer']))
+        template.odd_header = header_footer.oddHeader
+        template.odd_footer = header_footer.oddFooter
+        # Cada estilo distinto se reconstruye una sola vez y las celdas lo comparten
+        style_table = data['styles']
+        parsed = {}
+        template.cells = {}
+        for row, col, indexes in data['cells']:
+            styles = []
+            for style_cls, index in zip(STYLE_CLASSES, indexes):
+                if style_cls is None:
+                    styles.append(style_table[index])
+                    continue
+                if (style_cls, index) not in parsed:
+                    parsed[(style_cls, index)] = style_cls.from_tree(fromstring(style_table[index]))
+                styles.append(parsed[(style_cls, index)])
+            template.cells[(row, col)] = tuple(styles)
+        return template
+
+    def row_height(self, template_row):
+        """Altura de una fila con datos (la de la plantilla o la de por defecto)"""
+        height = self.rows.get(template_row, (None, False))[0]
+        return height or DEFAULT_ROW_HEIGHT
+
+    def apply_sheet_setup(self, ws):
+        """Columnas, página, márgenes y encabezados (antes de escribir filas)"""
+        for letter, width, hidden in self.columns:
+            ws.column_dimensions[letter].width = width
+            ws.column_dimensions[letter].hidden = hidden
+        ws.page_setup.orientation = self.orientation
+        ws.page_setup.paperSize = self.paper_size
+        ws.page_margins = self.margins
+        ws.oddHeader = self.odd_header
+        ws.oddFooter = self.odd_footer
+
+    def bind(self, ws):
+        return _SheetStyles(self, ws)
+
+
+class _SheetStyles:
+    """Arreglos de estilo (ids ya registrados en el libro de salida)
+
+    Se calculan una vez por celda de plantilla y tipo de tiempo; cada celda
+    escrita solo recibe una referencia al arreglo ya resuelto.
+    """
+
+    def __init__(self, template, ws):
+        self.template = template
+        self.ws = ws
+        self._time_styles = {}
+        self._pin_styles = {}
+
+    def time_style(self, template_row, col, time_type):
+        key = (template_row, col, time_type)
+        style = self._time_styles.get(key)
+        if style is None:
+            proto = WriteOnlyCell(self.ws)
+            source = self.template.cells.get((template_row, col))
+            if source:
+                font, border, _, number_format, protection, alignment = source
+                proto.font = font
+                proto.border = border
+                proto.number_format = number_format
+                proto.protection = protection
+                proto.alignment = alignment
+            # Color según tiempo (reemplaza el relleno de la plantilla)
+            color = TIME_COLORS.get(time_type, DEFAULT_TIME_COLOR)
+            proto.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+            style = self._time_styles[key] = proto._style
+        return style
+
+    def pin_style(self, template_row, col):
+        key = (template_row, col)
+        if key not in self._pin_styles:
+            source = self.template.cells.get(key)
+            style = None
+            if source:
+                proto = WriteOnlyCell(self.ws)
+                (proto.font, proto.border, proto.fill, proto.number_format,
+                 proto.protection, proto.alignment) = source
+                style = proto._style
+            self._pin_styles[key] = style
+        return self._pin_styles[key]
+
+
+_compiled_cache = {}
+_compiled_lock = threading.Lock()
+
+
+def cache_path_for(template_path):
+    return os.path.splitext(template_path)[0] + CACHE_SUFFIX
+
+
+def _read_cache_file(cache_path, source_hash, template_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') == CACHE_VERSION and data.get('sha256') == source_hash:
+            return CompiledTemplate.from_dict(data, template_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.warning(f"⚠️ Plantilla compilada inválida, se vuelve a compilar: {e}")
+    return None
+
+
+def _write_cache_file(cache_path, template):
+    try:
+        temp_path = cache_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(template.to_dict(), f)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        # Carpeta de solo lectura: se sigue usando la copia en memoria
+        log.warning(f"⚠️ No se pudo guardar la plantilla compilada: {e}")
+
+
+def load_template(template_path):
+    """Plantilla compilada para template_path, sin releer el .xlsx si no cambió
+
+    En memoria se reconoce por ruta, fecha de modificación y tamaño; en
+    disco (Plantilla.compilada.json) por el sha256 del .xlsx. Solo si
+    ninguna coincide se abre la plantilla y se vuelve a compilar.
+    """
+    path = os.path.abspath(template_path)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _compiled_lock:
+        cached = _compiled_cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        source_hash = _file_hash(path)
+        cache_path = cache_path_for(path)
+        template = _read_cache_file(cache_path, source_hash, path)
+        if template is None:
+            template = CompiledTemplate(path, source_hash)
+            _write_cache_file(cache_path, template)
+        _compiled_cache[path] = (key, template)
+        return template
+
+
+def export_tickets(template_path, output_filename, tickets, format_time, on_progress=None, template=None,
+                   plan=None):
+    """Exporta los tickets con el formato de la plantilla escribiendo fila a fila
+
+    template: CompiledTemplate ya cargada (por defecto la de load_template)
+    plan: page_layout.LayoutPlan de estos tickets (por defecto page_layout.plan_for)
+    on_progress(filas_escritas): se llama cada PROGRESS_EVERY_ROWS filas
+    Devuelve {'tickets', 'rows', 'pages', 'groups'}.
+    """
+    if template is None:
+        template = load_template(template_path)
+    if plan is None:
+        plan = page_layout.plan_for(tickets, format_time)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet')
+    template.apply_sheet_setup(ws)
+    styles = template.bind(ws)
+
+    last_row = 0
+    for row, cells in plan.iter_rows():
+        template_row = (row - 1) % TEMPLATE_ROWS + 1
+        # La dimensión de la fila solo vive mientras se escribe esa fila
+        dims = ws.row_dimensions[row]
+        dims.height = template.row_height(template_row)
+        if row <= TEMPLATE_ROWS and template.rows.get(row, (None, False))[1]:
+            dims.hidden = True
+
+        values = [None] * LAST_COLUMN
+        for col_time, col_pin, time_type, pin in cells:
+            time_cell = WriteOnlyCell(ws, time_type)
+            time_cell._style = styles.time_style(template_row, col_time, time_type)
+            pin_cell = WriteOnlyCell(ws, pin)
+            pin_style = styles.pin_style(template_row, col_pin)
+            if pin_style is not None:
+                pin_cell._style = pin_style
+            values[col_time - 1] = time_cell
+            values[col_pin - 1] = pin_cell
+
+        ws.append(values)
+        del ws.row_dimensions[row]
+        last_row = row
+        if on_progress and row % PROGRESS_EVERY_ROWS == 0:
+            on_progress(row)
+
+    # Filas restantes de la primera página con las dimensiones de la plantilla
+    for row in range(last_row + 1, max(template.rows, default=0) + 1):
+        height, hidden = template.rows[row] if row in template.rows else (None, False)
+        if height:
+            ws.row_dimensions[row].height = height
+        if hidden:
+            ws.row_dimensions[row].hidden = True
+        ws.append([])
+        ws.row_dimensions.pop(row, None)
+
+    if last_row:
+        # Solo las filas realmente usadas, no páginas completas
+        ws.print_area = f"A1:I{last_row}"
+
+    wb.save(output_filename)
+    return {
+        'tickets': plan.ticket_count,
+        'rows': last_row,
+        'pages': plan.pages,
+        'groups': list(plan.groups),
+    }
@@ -0,0 +1,219 @@
+"""
+CH Pines - Vista previa de impresión virtual
+Un solo Canvas con la altura de todas las hojas; cada hoja se dibuja solo
+al entrar en pantalla y se guardan las últimas en un LRU
+"""
+
+import tkinter as tk
+from collections import OrderedDict
+
+import page_layout
+
+# Geometría de la hoja impresa (la del plan de páginas: 40 filas, columnas A-I)
+ROWS_PER_PAGE = page_layout.TEMPLATE_ROWS
+SEPARATOR_COLUMN = 4
+TIME_COLUMNS = tuple(col_time - 1 for col_time, _ in page_layout.COLUMN_PAIRS)
+COLUMN_WIDTHS = (60, 120, 60, 120, 80, 60, 120, 60, 120)
+COLUMN_HEADERS = ('Tiempo', 'PIN', 'Tiempo', 'PIN', '', 'Tiempo', 'PIN', 'Tiempo', 'PIN')
+
+# Medidas en píxeles de cada hoja dentro del Canvas
+MARGIN_X = 20
+SHEET_PADDING = 20
+TITLE_HEIGHT = 40
+HEADER_HEIGHT = 20
+ROW_HEIGHT = 24
+PAGE_GAP = 35
+SHEET_HEIGHT = TITLE_HEIGHT + 5 + HEADER_HEIGHT + 2 + ROWS_PER_PAGE * ROW_HEIGHT + SHEET_PADDING
+PAGE_STRIDE = SHEET_HEIGHT + PAGE_GAP
+SHEET_WIDTH = sum(COLUMN_WIDTHS) + 2 * SHEET_PADDING
+
+# Hojas dibujadas que se conservan (las visibles nunca se descartan)
+PAGE_CACHE_SIZE = 6
+
+# Colores (mismos que la vista previa con etiquetas)
+BACKGROUND = '#ffffff'
+GAP_BG = '#f0f0f0'
+TITLE_BG = '#f8f9fa'
+TITLE_FG = '#2c3e50'
+HEADER_BG = '#dee2e6'
+GRID_LINE = '#adb5bd'
+TITLE_FONT = ('Arial', 12, 'bold')
+HEADER_FONT = ('Arial', 8, 'bold')
+TIME_FONT = ('Arial', 9, 'bold')
+PIN_FONT = ('Arial', 10, 'bold')
+
+
+def preview_page_rows(plan, page):
+    """Filas de una hoja según el plan: listas de 9 textos (columnas A-I)
+
+    Las filas de separación entre grupos salen vacías, igual que al imprimir.
+    """
+    rows = []
+    for row in plan.page_rows(page):
+        values = [''] * page_layout.LAST_COLUMN
+        for col_time, col_pin, time_type, pin in plan.row_cells(row):
+            values[col_time - 1] = time_type
+            values[col_pin - 1] = str(pin)
+        rows.append(values)
+    return rows
+
+
+def time_background(time_type):
+    """Color de la celda de tiempo, el mismo del Excel y del PDF"""
+    if not time_type:
+        return BACKGROUND
+    return '#' + page_layout.TIME_COLORS.get(time_type, page_layout.DEFAULT_TIME_COLOR)[-6:]
+
+
+class LazyPagePreview(tk.Frame):
+    """Hojas de impresión sobre un Canvas que dibuja solo las visibles
+
+    get_rows(hoja) devuelve las filas de una hoja (ver preview_page_rows) y
+    se consulta al dibujarla, así la vista previa muestra el mismo plan de
+    páginas que el Excel y el PDF. Abrir la vista cuesta lo mismo con 10 o con
+    100k tickets: solo se fija la altura total y se pintan 1-2 hojas.
+    Los elementos de cada hoja llevan la etiqueta 'page<n>' y salen del
+    Canvas juntos cuando la hoja cae del LRU.
+    Con scheduler (job_engine.IdleScheduler) la hoja anterior y la
+    siguiente a las visibles se dibujan por adelantado, una por unidad de
+    trabajo dentro del presupuesto por cuadro.
+    """
+
+    def __init__(self, parent, page_count, get_rows, cache_size=PAGE_CACHE_SIZE, scheduler=None,
+                 **kwargs):
+        kwargs.setdefault('bg', BACKGROUND)
+        super().__init__(parent, **kwargs)
+        self.page_count = page_count
+        self.get_rows = get_rows
+        self.cache_size = max(1, cache_size)
+        self.scheduler = scheduler
+        self._rendered = OrderedDict()  # hoja → etiqueta, de menos a más reciente
+
+        self.canvas = tk.Canvas(self, bg=GAP_BG, highlightthickness=0, takefocus=1)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_yscroll, yscrollincrement=ROW_HEIGHT,
+                              scrollregion=(0, 0, SHEET_WIDTH + 2 * MARGIN_X,
+                                            max(1, page_count * PAGE_STRIDE - PAGE_GAP)))
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind('<Configure>', lambda e: self.render_visible())
+        self.canvas.bind('<Enter>', lambda e: self.canvas.focus_set())
+        # 'break' evita que los bind_all de la ventana principal también se muevan
+        self.canvas.bind('<MouseWheel>', lambda e: self._scroll(-3 if e.delta > 0 else 3, 'units'))
+        self.canvas.bind('<Button-4>', lambda e: self._scroll(-3, 'units'))
+        self.canvas.bind('<Button-5>', lambda e: self._scroll(3, 'units'))
+        self.canvas.bind('<Prior>', lambda e: self._scroll(-1, 'pages'))
+        self.canvas.bind('<Next>', lambda e: self._scroll(1, 'pages'))
+        self.canvas.bind('<Up>', lambda e: self._scroll(-1, 'units'))
+        self.canvas.bind('<Down>', lambda e: self._scroll(1, 'units'))
+        self.canvas.bind('<Home>', lambda e: self._moveto(0))
+        self.canvas.bind('<End>', lambda e: self._moveto(1))
+
+    # Scroll
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.render_visible()
+
+    def _scroll(self, amount, what):
+        self.canvas.yview_scroll(amount, what)
+        return 'break'
+
+    def _moveto(self, fraction):
+        self.canvas.yview_moveto(fraction)
+        return 'break'
+
+    def show_page(self, page):
+        """Lleva la hoja indicada (desde 0) al borde superior"""
+        total = max(1, self.page_count * PAGE_STRIDE - PAGE_GAP)
+        self.canvas.yview_moveto(min(max(0, page), self.page_count - 1) * PAGE_STRIDE / total)
+
+    # Dibujo
+
+    def visible_pages(self):
+        if self.page_count <= 0:
+            return range(0)
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(max(1, self.canvas.winfo_height()))
+        first = max(0, int(top // PAGE_STRIDE))
+        last = min(self.page_count - 1, int(bottom // PAGE_STRIDE))
+        return range(first, last + 1)
+
+    def render_visible(self):
+        """Dibuja las hojas en pantalla que falten y recorta el LRU"""
+        visible = self.visible_pages()
+        for page in visible:
+            if page in self._rendered:
+                self._rendered.move_to_end(page)
+            else:
+                self._rendered[page] = self._draw_page(page)
+
+        keep = max(self.cache_size, len(visible))
+        while len(self._rendered) > keep:
+            page, tag = next(iter(self._rendered.items()))
+            if page in visible:
+                break
+            del self._rendered[page]
+            self.canvas.delete(tag)
+
+        if self.scheduler is not None and visible:
+            self.scheduler.submit(self._prefetch_units(visible), key=self._prefetch_key())
+
+    def _prefetch_key(self):
+        return f"{self}:prefetch"
+
+    def _prefetch_units(self, visible):
+        """Dibuja la hoja siguiente y la anterior a las visibles, una por unidad"""
+        for page in (visible[-1] + 1, visible[0] - 1):
+            if 0 <= page < self.page_count and page not in self._rendered:
+                self._rendered[page] = self._draw_page(page)
+                yield
+
+    def destroy(self):
+        if self.scheduler is not None:
+            self.scheduler.cancel(self._prefetch_key())
+        super().destroy()
+
+    def _draw_page(self, page):
+        canvas = self.canvas
+        tag = f'page{page}'
+        left = MARGIN_X
+        top = page * PAGE_STRIDE
+
+        canvas.create_rectangle(left, top, left + SHEET_WIDTH, top + SHEET_HEIGHT,
+                                fill=BACKGROUND, outline=BACKGROUND, tags=tag)
+        canvas.create_rectangle(left, top, left + SHEET_WIDTH, top + TITLE_HEIGHT,
+                                fill=TITLE_BG, outline=TITLE_BG, tags=tag)
+        canvas.create_text(left + SHEET_WIDTH / 2, top + TITLE_HEIGHT / 2,
+                           text=f"Hoja {page + 1} - CH Pines", font=TITLE_FONT,
+                           fill=TITLE_FG, tags=tag)
+
+        edges = [left + SHEET_PADDING]
+        for width in COLUMN_WIDTHS:
+            edges.append(edges[-1] + width)
+
+        y = top + TITLE_HEIGHT + 5
+        for col, header in enumerate(COLUMN_HEADERS):
+            if col != SEPARATOR_COLUMN:
+                canvas.create_rectangle(edges[col] + 1, y, edges[col + 1] - 1, y + HEADER_HEIGHT,
+                                        fill=HEADER_BG, outline=GRID_LINE, tags=tag)
+                canvas.create_text((edges[col] + edges[col + 1]) / 2, y + HEADER_HEIGHT / 2,
+                                   text=header, font=HEADER_FONT, tags=tag)
+
+        y += HEADER_HEIGHT + 2
+        for values in self.get_rows(page):
+            for col, value in enumerate(values):
+                if col == SEPARATOR_COLUMN:
+                    continue
+                if col in TIME_COLUMNS:
+                    fill, font = time_background(value), TIME_FONT
+                else:
+                    fill, font = BACKGROUND, PIN_FONT
+                canvas.create_rectangle(edges[col] + 1, y + 1, edges[col + 1] - 1, y + ROW_HEIGHT - 1,
+                                        fill=fill, outline=GRID_LINE, tags=tag)
+                if value:
+                    canvas.create_text((edges[col] + edges[col + 1]) / 2, y + ROW_HEIGHT / 2,
+                                       text=value, font=font, tags=tag)
+            y += ROW_HEIGHT
+        return tag
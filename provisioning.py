@@ -0,0 +1,425 @@
+"""
+CH Pines - Subida de usuarios a uno o varios MikroTik
+Conexión por SSH o API, modos de subida y grupos de routers en paralelo
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import mikrotik_ssh
+import routeros_api
+
+# Transportes
+TRANSPORT_SSH = 'ssh'
+TRANSPORT_API = 'api'
+TRANSPORT_API_SSL = 'api-ssl'
+DEFAULT_PORTS = {
+    TRANSPORT_SSH: 22,
+    TRANSPORT_API: routeros_api.API_PORT,
+    TRANSPORT_API_SSL: routeros_api.API_SSL_PORT,
+}
+
+# Modos de subida por SSH (con la API siempre se usa pipeline)
+MODE_SCRIPT = 'rsc'
+MODE_PARALLEL = 'paralelo'
+MODE_SINGLE = 'individual'
+
+RESULT_OK = mikrotik_ssh.RESULT_OK
+RESULT_DUP = mikrotik_ssh.RESULT_DUP
+RESULT_ERROR = mikrotik_ssh.RESULT_ERROR
+
+# Bloques que se suben a la vez a cada router durante un lote
+UPLOAD_WINDOW = 2
+
+
+def make_device(host, username, password='', port=None, transport=TRANSPORT_SSH, name=None):
+    """Crea la descripción de un router (diccionario simple)"""
+    return {
+        'name': name or host,
+        'host': host,
+        'port': int(port) if port else DEFAULT_PORTS[transport],
+        'username': username,
+        'password': password,
+        'transport': transport,
+    }
+
+
+def open_connection(device, timeout=10):
+    """Abre la conexión de un router: SSHClient de paramiko o RouterOSApiClient"""
+    if device['transport'] == TRANSPORT_SSH:
+        return mikrotik_ssh.open_ssh_client(device['host'], device['port'], device['username'],
+                                            device['password'], timeout=timeout)
+    client = routeros_api.RouterOSApiClient(device['host'], device['port'],
+                                            use_ssl=device['transport'] == TRANSPORT_API_SSL,
+                                            timeout=timeout)
+    return client.connect(device['username'], device['password'])
+
+
+def is_api_connection(connection):
+    """Indica si la conexión es de la API de RouterOS"""
+    return isinstance(connection, routeros_api.RouterOSApiClient)
+
+
+def device_connect_params(device):
+    """(host, puerto, usuario, contraseña) para abrir Transports SSH extra, o None"""
+    if device is None or device['transport'] != TRANSPORT_SSH:
+        return None
+    return (device['host'], device['port'], device['username'], device['password'])
+
+
+def upload_users(connection, users, mode=MODE_SCRIPT, concurrency=mikrotik_ssh.DEFAULT_CONCURRENCY,
+                 connect_params=None, on_progress=None, cancel_event=None, channel_pool=None):
+    """Sube usuarios por la conexión dada con el modo indicado
+
+    users: lista de tuplas (username, password, profile, limit_uptime)
+    connect_params: (host, puerto, usuario, contraseña) para Transports extra del pool
+    cancel_event: threading.Event opcional; lo no enviado queda como cancelado
+    channel_pool: SSHChannelPool ya abierto para el modo paralelo (no se cierra)
+    Devuelve {usuario: (estado, detalle)}.
+    """
+    if is_api_connection(connection):
+        # API nativa: todas las sentencias en pipeline sobre un solo socket
+        return connection.add_hotspot_users(users, on_progress=on_progress, cancel_event=cancel_event)
+
+    if mode == MODE_SCRIPT:
+        # Un único /import por bloque en lugar de un exec_command por usuario
+        return mikrotik_ssh.upload_users_script(connection, users, on_progress=on_progress,
+                                                cancel_event=cancel_event)
+
+    if mode == MODE_PARALLEL:
+        # Canales exec simultáneos para ocultar el RTT de sitios remotos
+        if channel_pool is not None:
+            return channel_pool.create_users(users, on_progress=on_progress, cancel_event=cancel_event)
+        pool = mikrotik_ssh.SSHChannelPool(connection, concurrency, connect_params=connect_params)
+        try:
+            return pool.create_users(users, on_progress=on_progress, cancel_event=cancel_event)
+        finally:
+            pool.close()
+
+    results = {}
+    total = len(users)
+    for i, user in enumerate(users):
+        if cancel_event is not None and cancel_event.is_set():
+            results[user[0]] = (RESULT_ERROR, mikrotik_ssh.CANCELLED_DETAIL)
+            continue
+        try:
+            results[user[0]] = (mikrotik_ssh.create_hotspot_user(connection, *user), '')
+        except Exception as e:
+            results[user[0]] = (RESULT_ERROR, str(e))
+        if on_progress and ((i + 1) % 100 == 0 or i + 1 == total):
+            on_progress(i + 1, total)
+    return results
+
+
+def fetch_existing_usernames(connection):
+    """Carga en un set los usuarios hotspot que ya existen en el router"""
+    if is_api_connection(connection):
+        return set(connection.get_hotspot_usernames())
+    return set(mikrotik_ssh.iter_existing_usernames(connection))
+
+
+def fetch_used_usernames(connection):
+    """Usuarios hotspot del router que ya se usaron (con tiempo o tráfico acumulado)"""
+    if is_api_connection(connection):
+        usage = connection.get_hotspot_user_usage()
+    else:
+        usage = mikrotik_ssh.iter_hotspot_user_usage(connection)
+    return {username for username, uptime, bytes_in in usage
+            if mikrotik_ssh.hotspot_user_used(uptime, bytes_in)}
+
+
+def count_results(results):
+    """Resume {usuario: (estado, detalle)} en {'ok': n, 'dup': n, 'error': n}"""
+    counts = {RESULT_OK: 0, RESULT_DUP: 0, RESULT_ERROR: 0}
+    for state, _ in results.values():
+        counts[state] += 1
+    return counts
+
+
+def status_for_result(state, detail):
+    """Texto de estado del ticket para un resultado de subida"""
+    if state == RESULT_OK:
+        return 'Creado en MikroTik'
+    if state == RESULT_DUP:
+        return 'Ya existe en MikroTik'
+    return f'Error: {detail[:50]}'
+
+
+class ConnectionPool:
+    """Conexiones a un router que se reutilizan durante todo un lote
+
+    acquire() entrega una conexión libre o abre otra mientras haya menos de
+    `size`; si no, espera a que otro hilo devuelva la suya. Con `connection`
+    (la conexión ya abierta de la ventana) esa se presta pero no se cierra;
+    sin `device` no se abren conexiones nuevas. El SSHChannelPool del modo
+    paralelo se crea una vez por conexión y dura lo mismo que ella.
+    """
+
+    def __init__(self, device=None, size=UPLOAD_WINDOW, connection=None):
+        self.device = device
+        self.size = max(1, int(size))
+        self._cond = threading.Condition()
+        self._idle = []
+        self._owned = []
+        self._channel_pools = {}  # id(conexión) → SSHChannelPool
+        self._opened = 0
+        if connection is not None:
+            self._idle.append(connection)
+            self._opened = 1
+
+    def acquire(self):
+        with self._cond:
+            while not self._idle:
+                if self.device is not None and self._opened < self.size:
+                    self._opened += 1
+                    break
+                if self._opened == 0:
+                    raise Exception("No hay conexión al MikroTik")
+                self._cond.wait()
+            else:
+                return self._idle.pop()
+        try:
+            connection = open_connection(self.device)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._owned.append(connection)
+        return connection
+
+    def release(self, connection, broken=False):
+        """Devuelve la conexión; si quedó rota y es propia, se cierra y se abrirá otra"""
+        channel_pool = None
+        with self._cond:
+            if broken and connection in self._owned:
+                self._owned.remove(connection)
+                self._opened -= 1
+                channel_pool = self._channel_pools.pop(id(connection), None)
+            else:
+                self._idle.append(connection)
+                connection = None
+            self._cond.notify()
+        if connection is not None:
+            self._close(connection, channel_pool)
+
+    def upload(self, users, mode=MODE_SCRIPT, concurrency=mikrotik_ssh.DEFAULT_CONCURRENCY,
+               on_progress=None, cancel_event=None):
+        """upload_users con una conexión del pool (se devuelve al terminar)"""
+        connection = self.acquire()
+        broken = False
+        try:
+            channel_pool = None
+            if mode == MODE_PARALLEL and not is_api_connection(connection):
+                channel_pool = self._channel_pools.get(id(connection))
+                if channel_pool is None:
+                    channel_pool = self._channel_pools[id(connection)] = mikrotik_ssh.SSHChannelPool(
+                        connection, concurrency, connect_params=device_connect_params(self.device))
+            return upload_users(connection, users, mode, concurrency, on_progress=on_progress,
+                                cancel_event=cancel_event, channel_pool=channel_pool)
+        except Exception:
+            broken = True
+            raise
+        finally:
+            self.release(connection, broken)
+
+    def close(self):
+        """Cierra las conexiones propias y los pools de canales (la prestada queda abierta)"""
+        with self._cond:
+            owned, self._owned = self._owned, []
+            channel_pools, self._channel_pools = self._channel_pools, {}
+            self._idle = [connection for connection in self._idle if connection not in owned]
+            self._opened = len(self._idle)
+        for channel_pool in channel_pools.values():
+            channel_pool.close()
+        for connection in owned:
+            self._close(connection)
+
+    @staticmethod
+    def _close(connection, channel_pool=None):
+        try:
+            if channel_pool is not None:
+                channel_pool.close()
+            connection.close()
+        except Exception:
+            pass
+
+
+class DeviceGroup:
+    """Grupo de routers que reciben el mismo lote de tickets en paralelo
+
+    Cada router usa su propia conexión, su propio progreso y su propio
+    conteo de fallos; un router lento o caído no frena a los demás. Un
+    router es su host y puerto; el nombre es único dentro del grupo porque
+    pools, progreso y reportes van por nombre.
+    """
+
+    def __init__(self, name="Grupo", devices=None):
+        self.name = name
+        self.devices = []
+        self._lock = threading.Lock()
+        for device in devices or []:
+            self.add(device)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(list(self.devices))
+
+    def add(self, device):
+        """Agrega un router (reemplaza el existente con el mismo host y puerto)
+
+        Si otro router ya usa el nombre (p. ej. la misma IP con otro puerto
+        reenviado), se le agrega ':puerto' y, si hace falta, un número.
+        Devuelve el router tal como quedó en el grupo.
+        """
+        with self._lock:
+            self.devices = [d for d in self.devices
+                            if (d['host'], d['port']) != (device['host'], device['port'])]
+            names = {d['name'] for d in self.devices}
+            name = device['name']
+            if name in names:
+                name = base = f"{device['name']}:{device['port']}"
+                number = 2
+                while name in names:
+                    name = f"{base} ({number})"
+                    number += 1
+                device = dict(device, name=name)
+            self.devices.append(device)
+            return device
+
+    def remove(self, name):
+        """Quita un router por nombre"""
+        with self._lock:
+            self.devices = [d for d in self.devices if d['name'] != name]
+
+    def clear(self):
+        with self._lock:
+            self.devices = []
+
+    def _fetch_from_device(self, device, fetch):
+        connection = open_connection(device)
+        try:
+            return fetch(connection)
+        finally:
+            connection.close()
+
+    def fetch_existing_usernames(self):
+        """Une los usuarios existentes de todos los routers (consultas en paralelo)
+
+        Devuelve (set de nombres, {router: error}) para los routers que fallaron.
+        """
+        return self._fetch_all(fetch_existing_usernames)
+
+    def fetch_used_usernames(self):
+        """Une los usuarios ya usados en cualquiera de los routers; igual que fetch_existing_usernames"""
+        return self._fetch_all(fetch_used_usernames)
+
+    def _fetch_all(self, fetch):
+        existing = set()
+        errors = {}
+        devices = list(self.devices)
+        if not devices:
+            return existing, errors
+
+        with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+            futures = {executor.submit(self._fetch_from_device, device, fetch): device
+                       for device in devices}
+            for future in as_completed(futures):
+                try:
+                    existing.update(future.result())
+                except Exception as e:
+                    errors[futures[future]['name']] = str(e)
+        return existing, errors
+
+    def open_pools(self, size=UPLOAD_WINDOW):
+        """Un ConnectionPool por router, para reutilizar las conexiones en todo un lote"""
+        return {device['name']: ConnectionPool(device, size) for device in self.devices}
+
+    @staticmethod
+    def close_pools(pools):
+        for pool in pools.values():
+            pool.close()
+
+    def _provision_device(self, device, pool, users, mode, concurrency, on_progress, cancel_event=None):
+        report = {
+            'device': device['name'],
+            'state': 'ok',
+            'error': '',
+            'counts': {RESULT_OK: 0, RESULT_DUP: 0, RESULT_ERROR: 0},
+            'failed': [],
+            'results': {},
+            'elapsed': 0.0,
+        }
+        start = time.perf_counter()
+        try:
+            progress = None
+            if on_progress:
+                progress = lambda done, total: on_progress(device['name'], done, total)
+            results = pool.upload(users, mode, concurrency, on_progress=progress, cancel_event=cancel_event)
+            report['results'] = results
+            report['counts'] = count_results(results)
+            report['failed'] = [name for name, (state, _) in results.items() if state == RESULT_ERROR]
+            if report['failed']:
+                report['state'] = 'parcial'
+        except Exception as e:
+            # Fallo de conexión: todo el lote queda pendiente en este router
+            report['state'] = 'error'
+            report['error'] = str(e)
+            report['counts'][RESULT_ERROR] = len(users)
+            report['failed'] = [user[0] for user in users]
+        finally:
+            report['elapsed'] = time.perf_counter() - start
+        return report
+
+    def provision(self, users, mode=MODE_SCRIPT, concurrency=mikrotik_ssh.DEFAULT_CONCURRENCY,
+                  on_progress=None, on_device_done=None, cancel_event=None, pools=None):
+        """Sube el lote a todos los routers a la vez
+
+        on_progress(router, procesados, total) y on_device_done(reporte) se
+        llaman desde los hilos de trabajo; cancel_event detiene todos los routers.
+        pools: los de open_pools() para reutilizar conexiones entre bloques;
+        sin ellos se abre y se cierra una conexión por router.
+        Devuelve {router: reporte} con estado, conteos y usuarios fallidos.
+        """
+        devices = list(self.devices)
+        reports = {}
+        if not devices:
+            return reports
+
+        own_pools = pools is None
+        if own_pools:
+            pools = self.open_pools(size=1)
+        try:
+            with ThreadPoolExecutor(max_workers=len(devices)) as executor:
+                futures = [executor.submit(self._provision_device, device, pools[device['name']], users,
+                                           mode, concurrency, on_progress, cancel_event)
+                           for device in devices]
+                for future in as_completed(futures):
+                    report = future.result()
+                    reports[report['device']] = report
+                    if on_device_done:
+                        on_device_done(report)
+        finally:
+            if own_pools:
+                self.close_pools(pools)
+        return reports
+
+
+def apply_group_results(tickets, reports):
+    """Combina los resultados de todos los routers en el estado de cada ticket"""
+    total_routers = len(reports)
+    failures = {}
+    for report in reports.values():
+        for username in report['failed']:
+            failures[username] = failures.get(username, 0) + 1
+
+    for ticket in tickets:
+        failed = failures.get(ticket.get('username', ''), 0)
+        if failed:
+            ticket['status'] = f'Error en {failed}/{total_routers} routers'
+        else:
+            ticket['status'] = f'Creado en {total_routers} routers'
@@ -0,0 +1,501 @@
+"""
+CH Pines - Cliente de la API nativa de RouterOS (puertos 8728/8729)
+Incluye un servidor local que imita la API para pruebas y benchmarks sin router
+"""
+
+import binascii
+import hashlib
+import heapq
+import socket
+import socketserver
+import ssl
+import threading
+import time
+
+API_PORT = 8728
+API_SSL_PORT = 8729
+
+# Estados por usuario (mismos valores que mikrotik_ssh)
+RESULT_OK = 'ok'
+RESULT_DUP = 'dup'
+RESULT_ERROR = 'error'
+CANCELLED_DETAIL = 'Cancelado'
+
+# Sentencias en vuelo por defecto durante la subida en pipeline
+PIPELINE_WINDOW = 512
+
+
+class RouterOSApiError(Exception):
+    """Error devuelto por el router (!trap / !fatal) o de protocolo"""
+
+    def __init__(self, message, category=None):
+        super().__init__(message)
+        self.message = message
+        self.category = category
+
+
+def encode_length(length):
+    """Codifica la longitud de una palabra según el protocolo de la API"""
+    if length < 0x80:
+        return bytes([length])
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, 'big')
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, 'big')
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, 'big')
+    return b'\xf0' + length.to_bytes(4, 'big')
+
+
+def encode_sentence(words):
+    """Codifica una sentencia (lista de palabras) terminada en palabra vacía"""
+    data = bytearray()
+    for word in words:
+        raw = word.encode('utf-8')
+        data += encode_length(len(raw))
+        data += raw
+    data += b'\x00'
+    return bytes(data)
+
+
+def read_length(stream):
+    """Lee la longitud de la siguiente palabra desde un stream binario"""
+    first = _read_exactly(stream, 1)[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        return ((first & 0x3F) << 8) | _read_exactly(stream, 1)[0]
+    if first < 0xE0:
+        return ((first & 0x1F) << 16) | int.from_bytes(_read_exactly(stream, 2), 'big')
+    if first < 0xF0:
+        return ((first & 0x0F) << 24) | int.from_bytes(_read_exactly(stream, 3), 'big')
+    if first == 0xF0:
+        return int.from_bytes(_read_exactly(stream, 4), 'big')
+    raise RouterOSApiError(f"Byte de control no soportado: {first:#x}")
+
+
+def read_sentence(stream):
+    """Lee una sentencia completa (hasta la palabra vacía)"""
+    words = []
+    while True:
+        length = read_length(stream)
+        if length == 0:
+            return words
+        words.append(_read_exactly(stream, length).decode('utf-8', errors='replace'))
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise RouterOSApiError("Conexión cerrada por el router", 'fatal')
+    return data
+
+
+def parse_attributes(words):
+    """Convierte palabras '=clave=valor' y '.tag=x' en diccionario"""
+    attrs = {}
+    for word in words:
+        if word.startswith('='):
+            key, _, value = word[1:].partition('=')
+            attrs[key] = value
+        elif word.startswith('.tag='):
+            attrs['.tag'] = word[5:]
+    return attrs
+
+
+def user_add_words(username, password, profile, limit_uptime):
+    """Palabras de /ip/hotspot/user/add para un usuario"""
+    words = ['/ip/hotspot/user/add', f'=name={username}']
+    if password and password.strip():
+        words.append(f'=password={password}')
+    words.append(f'=profile={profile}')
+    if limit_uptime and limit_uptime.strip():
+        words.append(f'=limit-uptime={limit_uptime}')
+    return words
+
+
+def is_duplicate_error(message):
+    """Indica si el !trap corresponde a un usuario ya existente"""
+    lowered = message.lower()
+    return "already have" in lowered or "already exists" in lowered
+
+
+class RouterOSApiClient:
+    """Conexión a la API de RouterOS con soporte de sentencias en pipeline"""
+
+    def __init__(self, host, port=API_PORT, use_ssl=False, timeout=10):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.sock = None
+        self.stream = None
+        self._lock = threading.Lock()
+        self._next_tag = 0
+
+    def connect(self, username, password):
+        """Abre el socket (TLS opcional) e inicia sesión"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.use_ssl:
+            context = ssl.create_default_context()
+            # Los routers suelen usar certificados autofirmados
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            try:
+                context.set_ciphers('ALL:@SECLEVEL=0')
+            except ssl.SSLError:
+                pass
+            sock = context.wrap_socket(sock, server_hostname=self.host)
+        self.sock = sock
+        self.stream = sock.makefile('rb', buffering=65536)
+        self.login(username, password)
+        return self
+
+    def close(self):
+        """Cierra la conexión"""
+        try:
+            if self.stream:
+                self.stream.close()
+            if self.sock:
+                self.sock.close()
+        finally:
+            self.stream = None
+            self.sock = None
+
+    def login(self, username, password):
+        """Login moderno (6.43+) con respaldo al método challenge MD5"""
+        replies = self.talk(['/login', f'=name={username}', f'=password={password}'])
+        challenge = replies[-1][1].get('ret') if replies else None
+        if challenge:
+            digest = hashlib.md5(b'\x00' + password.encode('utf-8') +
+                                 binascii.unhexlify(challenge)).hexdigest()
+            self.talk(['/login', f'=name={username}', f'=response=00{digest}'])
+
+    def _send(self, data):
+        if not self.sock:
+            raise RouterOSApiError("No hay conexión con la API", 'fatal')
+        self.sock.sendall(data)
+
+    def _read_reply(self):
+        """Lee una respuesta: (tipo, atributos)"""
+        words = read_sentence(self.stream)
+        if not words:
+            return self._read_reply()
+        reply_type = words[0]
+        attrs = parse_attributes(words[1:])
+        if reply_type == '!fatal':
+            self.close()
+            raise RouterOSApiError(' '.join(words[1:]) or "Error fatal de la API", 'fatal')
+        return reply_type, attrs
+
+    def talk(self, words):
+        """Envía un comando y espera su !done; devuelve las respuestas (tipo, attrs)
+
+        Lanza RouterOSApiError si el router responde con !trap.
+        """
+        with self._lock:
+            self._send(encode_sentence(words))
+            replies = []
+            trap = None
+            while True:
+                reply_type, attrs = self._read_reply()
+                if reply_type == '!trap':
+                    trap = attrs
+                elif reply_type == '!done':
+                    replies.append((reply_type, attrs))
+                    break
+                else:
+                    replies.append((reply_type, attrs))
+            if trap is not None:
+                raise RouterOSApiError(trap.get('message', 'Error desconocido'), trap.get('category'))
+            return replies
+
+    def print_items(self, path, proplist=None):
+        """Ejecuta <path>/print y devuelve la lista de registros (!re)"""
+        words = [f'{path}/print']
+        if proplist:
+            words.append('=.proplist=' + ','.join(proplist))
+        return [attrs for reply_type, attrs in self.talk(words) if reply_type == '!re']
+
+    def get_identity(self):
+        """Nombre del router (/system/identity)"""
+        items = self.print_items('/system/identity')
+        return items[0].get('name', 'MikroTik') if items else 'MikroTik'
+
+    def get_hotspot_profiles(self):
+        """Nombres de perfiles de usuario hotspot"""
+        items = self.print_items('/ip/hotspot/user/profile', ['name'])
+        return [item['name'] for item in items if item.get('name')]
+
+    def add_hotspot_profile(self, name, rate_limit, keepalive_timeout):
+        """Crea un perfil de usuario hotspot"""
+        self.talk(['/ip/hotspot/user/profile/add', f'=name={name}',
+                   f'=rate-limit={rate_limit}', f'=keepalive-timeout={keepalive_timeout}'])
+
+    def get_hotspot_usernames(self):
+        """Nombres de todos los usuarios hotspot en una sola consulta"""
+        items = self.print_items('/ip/hotspot/user', ['name'])
+        return [item['name'] for item in items if 'name' in item]
+
+    def get_hotspot_user_usage(self):
+        """(usuario, uptime, bytes-in) de todos los usuarios hotspot en una sola consulta"""
+        items = self.print_items('/ip/hotspot/user', ['name', 'uptime', 'bytes-in'])
+        return [(item['name'], item.get('uptime', ''), item.get('bytes-in', ''))
+                for item in items if 'name' in item]
+
+    def add_hotspot_user(self, username, password, profile, limit_uptime):
+        """Crea un usuario; devuelve RESULT_OK o RESULT_DUP"""
+        try:
+            self.talk(user_add_words(username, password, profile, limit_uptime))
+        except RouterOSApiError as e:
+            if e.category != 'fatal' and is_duplicate_error(e.message):
+                return RESULT_DUP
+            raise
+        return RESULT_OK
+
+    def add_hotspot_users(self, users, window=PIPELINE_WINDOW, on_progress=None, cancel_event=None):
+        """Crea muchos usuarios en pipeline sobre el mismo socket
+
+        users: lista de tuplas (username, password, profile, limit_uptime)
+        Se mantienen hasta `window` sentencias en vuelo sin esperar cada !done;
+        las respuestas se emparejan con su usuario mediante .tag.
+        cancel_event: threading.Event opcional; al activarse no se envían más
+        sentencias, se esperan las que están en vuelo y el resto queda cancelado.
+        Devuelve {usuario: (estado, detalle)}.
+        """
+        results = {}
+        pending = {}
+        total = len(users)
+        position = 0
+        completed = 0
+        refill_at = max(1, window // 2)
+
+        with self._lock:
+            while position < total or pending:
+                if cancel_event is not None and cancel_event.is_set() and position < total:
+                    # Dejar el socket limpio: solo se drenan las respuestas pendientes
+                    for user in users[position:]:
+                        results[user[0]] = (RESULT_ERROR, CANCELLED_DETAIL)
+                    total = position
+                    if not pending:
+                        break
+
+                # Rellenar la ventana en una sola escritura
+                if position < total and len(pending) <= refill_at:
+                    buffer = bytearray()
+                    while position < total and len(pending) < window:
+                        user = users[position]
+                        tag = str(self._next_tag)
+                        self._next_tag += 1
+                        buffer += encode_sentence(user_add_words(*user) + [f'.tag={tag}'])
+                        pending[tag] = user[0]
+                        position += 1
+                    self._send(bytes(buffer))
+
+                reply_type, attrs = self._read_reply()
+                username = pending.get(attrs.get('.tag'))
+                if username is None:
+                    continue
+
+                if reply_type == '!trap':
+                    message = attrs.get('message', 'Error desconocido')
+                    if is_duplicate_error(message):
+                        results[username] = (RESULT_DUP, '')
+                    else:
+                        results[username] = (RESULT_ERROR, message)
+                elif reply_type == '!done':
+                    del pending[attrs['.tag']]
+                    results.setdefault(username, (RESULT_OK, ''))
+                    completed += 1
+                    if on_progress and (completed % 500 == 0 or completed == total):
+                        on_progress(completed, total)
+
+        return results
+
+
+class RouterOSApiStandIn:
+    """Servidor local que imita la API de RouterOS (pruebas y benchmarks offline)
+
+    Implementa login, identidad, perfiles y usuarios hotspot en memoria.
+    `latency` simula el retardo de red: cada respuesta sale `latency`
+    segundos después de recibir su sentencia, sin bloquear las siguientes,
+    igual que un enlace real con RTT.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, username='admin', password='',
+                 identity='CH-Pines-StandIn', latency=0.0):
+        self.username = username
+        self.password = password
+        self.identity = identity
+        self.latency = latency
+        self.users = {}
+        self.profiles = ['default']
+        self.lock = threading.Lock()
+        self._server = _StandInServer((host, port), _StandInHandler)
+        self._server.stand_in = self
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address[:2]
+
+    def start(self):
+        """Arranca el servidor en un hilo de fondo; devuelve (host, puerto)"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.address
+
+    def stop(self):
+        """Detiene el servidor"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle_command(self, words):
+        """Procesa una sentencia y devuelve la lista de respuestas (palabras)"""
+        command = words[0]
+        attrs = parse_attributes(words[1:])
+        tag = [f".tag={attrs['.tag']}"] if '.tag' in attrs else []
+
+        def trap(message):
+            return [['!trap', f'=message={message}'] + tag, ['!done'] + tag]
+
+        if command == '/login':
+            if attrs.get('name') != self.username or attrs.get('password', '') != self.password:
+                return trap('invalid user name or password (6)')
+            return [['!done'] + tag]
+
+        if command == '/system/identity/print':
+            return [['!re', f'=name={self.identity}'] + tag, ['!done'] + tag]
+
+        if command == '/ip/hotspot/user/profile/print':
+            with self.lock:
+                profiles = list(self.profiles)
+            return [['!re', f'=name={name}'] + tag for name in profiles] + [['!done'] + tag]
+
+        if command == '/ip/hotspot/user/profile/add':
+            with self.lock:
+                if attrs.get('name') in self.profiles:
+                    return trap('failure: already have profile with this name')
+                self.profiles.append(attrs.get('name', ''))
+            return [['!done', '=ret=*1'] + tag]
+
+        if command == '/ip/hotspot/user/add':
+            name = attrs.get('name', '')
+            with self.lock:
+                if not name:
+                    return trap('failure: name is required')
+                if attrs.get('profile', 'default') not in self.profiles:
+                    return trap('input does not match any value of profile')
+                if name in self.users:
+                    return trap('failure: already have user with this name for this server')
+                self.users[name] = attrs
+                ret = f'=ret=*{len(self.users):X}'
+            return [['!done', ret] + tag]
+
+        if command == '/ip/hotspot/user/print':
+            # uptime y bytes-in se pueden fijar en users[nombre] para simular tickets usados
+            with self.lock:
+                users = [(name, user.get('uptime', '0s'), user.get('bytes-in', '0'))
+                         for name, user in self.users.items()]
+            return ([['!re', f'=name={name}', f'=uptime={uptime}', f'=bytes-in={bytes_in}'] + tag
+                     for name, uptime, bytes_in in users] + [['!done'] + tag])
+
+        return trap('no such command')
+
+
+class _StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    """Lee sentencias y entrega las respuestas con el retardo simulado"""
+
+    def handle(self):
+        stand_in = self.server.stand_in
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        outbox = []
+        condition = threading.Condition()
+        closed = [False]
+
+        writer = threading.Thread(target=self._writer, args=(outbox, condition, closed), daemon=True)
+        writer.start()
+        sequence = 0
+        try:
+            while True:
+                try:
+                    words = read_sentence(self.rfile)
+                except (RouterOSApiError, OSError):
+                    break
+                if not words:
+                    continue
+                data = b''.join(encode_sentence(reply) for reply in stand_in.handle_command(words))
+                with condition:
+                    sequence += 1
+                    heapq.heappush(outbox, (time.monotonic() + stand_in.latency, sequence, data))
+                    condition.notify()
+        finally:
+            with condition:
+                closed[0] = True
+                condition.notify()
+            writer.join(timeout=5)
+
+    def _writer(self, outbox, condition, closed):
+        while True:
+            with condition:
+                while not outbox and not closed[0]:
+                    condition.wait()
+                if not outbox:
+                    return
+                due = outbox[0][0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    condition.wait(delay)
+                    continue
+                # Enviar juntas todas las respuestas ya vencidas
+                now = time.monotonic()
+                chunks = []
+                while outbox and outbox[0][0] <= now:
+                    chunks.append(heapq.heappop(outbox)[2])
+            try:
+                self.request.sendall(b''.join(chunks))
+            except OSError:
+                return
+
+
+def _benchmark(count, latency, window):
+    """Compara subida secuencial vs pipeline contra el servidor local"""
+    stand_in = RouterOSApiStandIn(latency=latency)
+    host, port = stand_in.start()
+    try:
+        client = RouterOSApiClient(host, port).connect('admin', '')
+        sequential = min(count, 200)
+        start = time.perf_counter()
+        for i in range(sequential):
+            client.add_hotspot_user(f'S{i:06d}', '', 'default', '01:00:00')
+        elapsed = time.perf_counter() - start
+        print(f"Secuencial: {sequential} usuarios en {elapsed:.2f}s "
+              f"({sequential / elapsed:.0f} usuarios/s)")
+
+        users = [(f'P{i:06d}', '', 'default', '01:00:00') for i in range(count)]
+        start = time.perf_counter()
+        results = client.add_hotspot_users(users, window=window)
+        elapsed = time.perf_counter() - start
+        created = sum(1 for state, _ in results.values() if state == RESULT_OK)
+        print(f"Pipeline:   {created}/{count} usuarios en {elapsed:.2f}s "
+              f"({count / elapsed:.0f} usuarios/s, ventana {window})")
+        client.close()
+    finally:
+        stand_in.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark de la API RouterOS con servidor local")
+    parser.add_argument('--cantidad', type=int, default=10000, help="usuarios a crear en pipeline")
+    parser.add_argument('--latencia', type=float, default=0.02, help="retardo simulado en segundos")
+    parser.add_argument('--ventana', type=int, default=PIPELINE_WINDOW, help="sentencias en vuelo")
+    args = parser.parse_args()
+    _benchmark(args.cantidad, args.latencia, args.ventana)
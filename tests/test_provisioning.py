@@ -0,0 +1,35 @@
+import provisioning
+
+
+class FakeConnection:
+    def __init__(self, device):
+        self.device = device
+
+    def close(self):
+        pass
+
+
+def test_group_keeps_routers_behind_the_same_ip_apart(monkeypatch):
+    uploads = []
+
+    def fake_upload_users(connection, users, mode, concurrency, **kwargs):
+        uploads.append((connection.device['host'], connection.device['port']))
+        return {user[0]: (provisioning.RESULT_OK, '') for user in users}
+
+    monkeypatch.setattr(provisioning, 'open_connection', FakeConnection)
+    monkeypatch.setattr(provisioning, 'upload_users', fake_upload_users)
+    group = provisioning.DeviceGroup('Sitio', [
+        provisioning.make_device('10.0.0.1', 'admin', port=2201),
+        provisioning.make_device('10.0.0.1', 'admin', port=2202),
+    ])
+    group.add(provisioning.make_device('10.0.0.1', 'admin', port=2203))
+    # Mismo host y puerto: reemplaza al existente
+    group.add(provisioning.make_device('10.0.0.1', 'otro', port=2202))
+
+    assert len(group) == 3
+    assert len({device['name'] for device in group}) == 3
+
+    reports = group.provision([('ch100001', '', 'default', '')])
+    assert sorted(uploads) == [('10.0.0.1', 2201), ('10.0.0.1', 2202), ('10.0.0.1', 2203)]
+    assert len(reports) == 3
+    assert all(report['state'] == 'ok' for report in reports.values())
@@ -0,0 +1,39 @@
+import provisioning
+import ticket_batch
+import ticket_codes
+import ticket_ledger
+
+
+class FakeConnection:
+    def close(self):
+        pass
+
+
+def test_failed_chunk_upload_still_reaches_table_and_ledger(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_upload_users(connection, users, mode, concurrency, **kwargs):
+        calls.append(users[0][0])
+        if len(calls) == 2:
+            raise Exception("Conexión perdida")
+        return {user[0]: (provisioning.RESULT_OK, '') for user in users}
+
+    monkeypatch.setattr(provisioning, 'upload_users', fake_upload_users)
+    generator = ticket_codes.CodeGenerator(str(tmp_path / 'codes.json'))
+    ledger = ticket_ledger.TicketLedger(str(tmp_path / 'ledger.db'))
+    runner = ticket_batch.BatchRunner(generator, ledger, connection=FakeConnection(), log=lambda message: None)
+
+    chunks = []
+    stats = runner.generate('ch', 5500, 'default', '1H', on_chunk=chunks.append, chunk_size=1000)
+
+    shown = [ticket['username'] for chunk in chunks for ticket in chunk]
+    recorded = ledger.tickets_by_batch(stats['batch_id'])
+    assert len(shown) == 5500
+    assert shown == [row['username'] for row in recorded]
+    assert [chunk[0]['number'] for chunk in chunks] == [1, 1001, 2001, 3001, 4001, 5001]
+    assert stats['counts'] == {'ok': 4500, 'dup': 0, 'error': 1000}
+
+    failed = [row for row in recorded if row['status'].startswith('Error')]
+    assert len(failed) == 1000
+    assert not [row for row in recorded if row['status'] == ticket_batch.STATUS_GENERATED]
+    ledger.close()
@@ -0,0 +1,53 @@
+import pytest
+
+import ticket_codes
+
+
+@pytest.mark.parametrize('domain, half_bits', [(256, 4), (200, 4), (1000, 5), (513, 5)])
+@pytest.mark.parametrize('tweak', ['ch', 'vip'])
+def test_permutation_is_a_bijection_on_small_domains(domain, half_bits, tweak):
+    permutation = ticket_codes.FeistelPermutation(bytes(32), tweak, domain=domain, half_bits=half_bits)
+    codes = [permutation.permute(index) for index in range(domain)]
+    assert sorted(codes) == list(range(domain))
+
+
+def test_permutation_rejects_a_domain_larger_than_the_network():
+    with pytest.raises(ValueError):
+        ticket_codes.FeistelPermutation(bytes(32), domain=257, half_bits=4)
+
+
+def test_take_never_repeats_a_code_across_calls_and_reloads(tmp_path):
+    state_path = str(tmp_path / 'codes.json')
+    generator = ticket_codes.CodeGenerator(state_path)
+    issued = []
+    for count in (1, 500, 1234):
+        usernames, skipped = generator.take('ch', count)
+        assert len(usernames) == count and skipped == 0
+        issued.extend(usernames)
+
+    # Otra ejecución del programa: misma clave y el cursor guardado
+    reloaded = ticket_codes.CodeGenerator(state_path)
+    assert reloaded.key == generator.key
+    usernames, _ = reloaded.take('ch', 2000)
+    issued.extend(usernames)
+
+    assert len(set(issued)) == len(issued)
+    assert all(name.startswith('ch') and len(name) == 8 for name in issued)
+    assert reloaded.remaining('ch') == ticket_codes.CODE_SPACE - len(issued)
+
+
+def test_take_skips_taken_names(tmp_path):
+    state_path = tmp_path / 'codes.json'
+    generator = ticket_codes.CodeGenerator(str(state_path))
+    # Copia del estado con el cursor en cero para ver los códigos que vienen
+    copy_path = tmp_path / 'copy.json'
+    copy_path.write_text(state_path.read_text())
+    upcoming, _ = ticket_codes.CodeGenerator(str(copy_path)).take('ch', 10)
+
+    taken = set(upcoming[2:5])
+    usernames, skipped = generator.take('ch', 7, taken)
+
+    assert skipped == 3
+    assert usernames == upcoming[:2] + upcoming[5:10]
+    # Los entregados quedan ocupados para el siguiente take
+    assert set(usernames) <= taken
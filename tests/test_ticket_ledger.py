@@ -0,0 +1,66 @@
+import io
+
+import mikrotik_ssh
+import provisioning
+import routeros_api
+import ticket_batch
+import ticket_codes
+import ticket_ledger
+
+
+def tickets(usernames, status='Creado en MikroTik'):
+    return [{'username': username, 'profile': 'default', 'uptime_limit': '1h', 'status': status}
+            for username in usernames]
+
+
+def test_mark_used_is_keyed_by_username_and_batch(tmp_path):
+    ledger = ticket_ledger.TicketLedger(str(tmp_path / 'ledger.db'))
+    ledger.record_tickets(tickets(['ch1', 'ch2', 'ch3']), 'viernes')
+    # El mismo nombre reimportado en otro lote
+    ledger.record_tickets(tickets(['ch1']), 'sabado')
+    ledger.update_statuses([{'username': 'ch3', 'status': 'Error: Rechazado'}], 'viernes')
+
+    assert ledger.mark_used(['ch1'], 'viernes') == 1
+    assert ledger.mark_used(['ch1'], 'viernes') == 0
+
+    assert [row['username'] for row in ledger.unused_tickets('viernes')] == ['ch2']
+    assert [row['username'] for row in ledger.unused_tickets('sabado')] == ['ch1']
+    ledger.close()
+
+
+def test_sync_used_reads_usage_from_the_router(tmp_path):
+    stand_in = routeros_api.RouterOSApiStandIn()
+    host, port = stand_in.start()
+    connection = routeros_api.RouterOSApiClient(host, port).connect('admin', '')
+    ledger = ticket_ledger.TicketLedger(str(tmp_path / 'ledger.db'))
+    try:
+        generator = ticket_codes.CodeGenerator(str(tmp_path / 'codes.json'))
+        runner = ticket_batch.BatchRunner(generator, ledger, connection=connection,
+                                          upload_mode=provisioning.MODE_SINGLE, log=lambda message: None)
+        stats = runner.generate('ch', 10, 'default', '1H')
+        usernames = [row['username'] for row in ledger.tickets_by_batch(stats['batch_id'])]
+        stand_in.users[usernames[0]]['uptime'] = '12m5s'
+        stand_in.users[usernames[1]]['bytes-in'] = '2048'
+
+        assert runner.sync_used(stats['batch_id']) == 2
+        unused = [row['username'] for row in ledger.unused_tickets(stats['batch_id'])]
+        assert unused == usernames[2:]
+    finally:
+        connection.close()
+        ledger.close()
+        stand_in.stop()
+
+
+def test_ssh_usage_parses_terse_output():
+    output = (' 0   server=all name="ch 100001" profile=default uptime=0s bytes-in=0 bytes-out=0\n'
+              ' 1   name=ch100002 uptime=1h2m bytes-in=5120 comment="a b"\n'
+              ' 2 D name=ch100003 uptime=0s bytes-in=77\n')
+
+    class FakeClient:
+        def exec_command(self, command):
+            return None, io.StringIO(output), io.StringIO('')
+
+    usage = list(mikrotik_ssh.iter_hotspot_user_usage(FakeClient()))
+    assert usage == [('ch 100001', '0s', '0'), ('ch100002', '1h2m', '5120'), ('ch100003', '0s', '77')]
+    used = [name for name, uptime, bytes_in in usage if mikrotik_ssh.hotspot_user_used(uptime, bytes_in)]
+    assert used == ['ch100002', 'ch100003']
@@ -0,0 +1,356 @@
+"""
+CH Pines - Generación y subida de lotes sin interfaz
+Lo que comparten la ventana y la línea de comandos: armar los tickets,
+subirlos al router o al grupo, guardarlos en el registro y formatear tiempos
+"""
+
+import threading
+
+import app_log
+import job_engine
+import mikrotik_ssh
+import provisioning
+import time_spec
+
+# Tickets por bloque en el pipeline generar → subir → tabla
+PIPELINE_CHUNK_SIZE = 1000
+
+STATUS_GENERATED = 'Generado'
+STATUS_LOCAL = 'Solo local (sin conexión)'
+
+log = app_log.get_logger('ticket_batch')
+
+
+def convert_time_format(time_str):
+    """Convierte formato DD:HH:MM:SS a formato MikroTik (una vez por valor distinto)"""
+    return time_spec.uptime(time_str)
+
+
+def format_time_display(time_limit):
+    """Convierte el formato de tiempo al formato simple solicitado (una vez por valor distinto)"""
+    return time_spec.display_label(time_limit)
+
+
+def ticket_upload_tuple(ticket):
+    """Prepara (usuario, contraseña, perfil, limit-uptime) de un ticket para subirlo"""
+    uptime_limit = ticket.get('uptime_limit', '')
+    mikrotik_time = ''
+    if uptime_limit and uptime_limit.strip():
+        mikrotik_time = convert_time_format(uptime_limit)
+    return (ticket.get('username', ''), ticket.get('password', ''),
+            ticket.get('profile', 'default'), mikrotik_time)
+
+
+def apply_upload_results(tickets, results):
+    """Aplica los resultados por usuario al estado de cada ticket"""
+    counts = {provisioning.RESULT_OK: 0, provisioning.RESULT_DUP: 0, provisioning.RESULT_ERROR: 0}
+    for ticket in tickets:
+        state, detail = results.get(ticket.get('username', ''),
+                                    (provisioning.RESULT_ERROR, 'Sin resultado'))
+        counts[state] += 1
+        ticket['status'] = provisioning.status_for_result(state, detail)
+    return counts
+
+
+def format_upload_summary(counts):
+    """Texto de resumen de una subida para el log"""
+    return (f"📊 Resultado: {counts['ok']} creados, {counts['dup']} ya existían, "
+            f"{counts['error']} con error")
+
+
+def make_tickets(usernames, profile, uptime_limit, status, first_number=1):
+    """Tickets (diccionarios) para una lista de nombres ya reservados"""
+    return [{
+        'number': first_number + i,
+        'username': username,
+        'password': "",  # Solo usuarios - sin contraseña
+        'profile': profile,
+        'uptime_limit': uptime_limit,
+        'time_limit': uptime_limit,  # Para compatibilidad con vista previa
+        'status': status,
+    } for i, username in enumerate(usernames)]
+
+
+class BatchRunner:
+    """Genera, sube y registra lotes de tickets para un destino
+
+    Destino: una conexión abierta (SSH o API), un DeviceGroup o nada (solo
+    local). No depende de la interfaz: los mensajes salen por log(texto),
+    que puede ser print, el canal de un Job o el log de la ventana.
+    """
+
+    def __init__(self, code_generator, ledger, connection=None, group=None, connect_params=None,
+                 upload_mode=provisioning.MODE_SCRIPT, concurrency=mikrotik_ssh.DEFAULT_CONCURRENCY,
+                 router_name='MikroTik', log=print):
+        self.code_generator = code_generator
+        self.ledger = ledger
+        self.connection = connection
+        self.group = group if group is not None and len(group) > 0 else None
+        self.connect_params = connect_params
+        self.upload_mode = upload_mode
+        self.concurrency = concurrency
+        self.router_name = router_name
+        self.log = log
+
+    @property
+    def uploads(self):
+        """Indica si los tickets se suben (a un router o a un grupo)"""
+        return self.group is not None or bool(self.connection)
+
+    @property
+    def ledger_router_name(self):
+        """Destino de los tickets tal como se guarda en el registro"""
+        if self.group is not None:
+            return f"{self.group.name} ({len(self.group)} routers)"
+        if self.connection:
+            return self.router_name or 'MikroTik'
+        return 'local'
+
+    def upload_method(self):
+        """Descripción del método de subida para el log"""
+        if provisioning.is_api_connection(self.connection):
+            return "API en pipeline"
+        if self.upload_mode == provisioning.MODE_PARALLEL:
+            return f"{self.concurrency} canales SSH en paralelo"
+        if self.upload_mode == provisioning.MODE_SCRIPT:
+            return "script .rsc"
+        return "un comando por ticket"
+
+    # Registro
+
+    def record(self, tickets, prefix, batch_id=None):
+        """Guarda un lote en el registro SQLite y marca cada ticket con su lote"""
+        if self.ledger is None:
+            return None
+        try:
+            if batch_id is None:
+                batch_id = self.ledger.new_batch_id(prefix)
+            for ticket in tickets:
+                ticket['batch_id'] = batch_id
+            self.ledger.record_tickets(tickets, batch_id, prefix, self.ledger_router_name)
+            return batch_id
+        except Exception as e:
+            log.warning(f"⚠️ Error guardando tickets en el registro: {e}")
+            return None
+
+    def update_ledger(self, tickets):
+        """Copia al registro el estado final de los tickets tras una subida"""
+        if self.ledger is None:
+            return
+        by_batch = {}
+        for ticket in tickets:
+            by_batch.setdefault(ticket.get('batch_id'), []).append(ticket)
+        try:
+            for batch_id, batch_tickets in by_batch.items():
+                if batch_id:
+                    self.ledger.update_statuses(batch_tickets, batch_id)
+        except Exception as e:
+            log.warning(f"⚠️ Error actualizando el registro de tickets: {e}")
+
+    def sync_used(self, batch=None):
+        """Marca en el registro los tickets que el router ya muestra como usados
+
+        Una consulta por router (uptime y bytes-in de cada usuario hotspot);
+        con batch solo se actualiza ese lote. Devuelve cuántos tickets
+        pasaron a usados.
+        """
+        if self.ledger is None:
+            return 0
+        if self.group is not None:
+            used, errors = self.group.fetch_used_usernames()
+            for router, error in errors.items():
+                self.log(f"⚠️ {router}: no se pudo leer el uso de los tickets ({error})")
+        elif self.connection:
+            used = provisioning.fetch_used_usernames(self.connection)
+        else:
+            return 0
+        return self.ledger.mark_used(used, batch)
+
+    # Router
+
+    def load_existing_usernames(self):
+        """Carga en memoria los usuarios que ya existen en el router (o en el grupo)
+
+        Una sola consulta 'print terse' por router.
+        """
+        try:
+            if self.group is not None:
+                existing, errors = self.group.fetch_existing_usernames()
+                for router, error in errors.items():
+                    self.log(f"⚠️ {router}: no se pudieron leer usuarios existentes ({error})")
+            elif self.connection:
+                existing = provisioning.fetch_existing_usernames(self.connection)
+            else:
+                return set()
+        except Exception as e:
+            self.log(f"⚠️ No se pudieron leer usuarios existentes: {str(e)}")
+            return set()
+
+        self.log(f"🔎 {len(existing)} usuarios existentes cargados para evitar duplicados")
+        return existing
+
+    def open_pool(self, size=provisioning.UPLOAD_WINDOW):
+        """ConnectionPool del router: la conexión abierta más, en SSH, hasta size - 1 extra"""
+        device = None
+        if self.connect_params:
+            host, port, username, password = self.connect_params
+            device = provisioning.make_device(host, username, password, port, provisioning.TRANSPORT_SSH,
+                                              name=self.router_name)
+        return provisioning.ConnectionPool(device, size, connection=self.connection)
+
+    def upload(self, tickets, on_progress=None, cancel_event=None, pool=None):
+        """Sube una lista de tickets al router y actualiza su estado
+
+        pool: el de open_pool() para reutilizar conexiones entre bloques.
+        Devuelve un resumen {'ok': n, 'dup': n, 'error': n}.
+        """
+        if not self.connection:
+            raise Exception("No hay conexión al MikroTik")
+
+        users = [ticket_upload_tuple(ticket) for ticket in tickets]
+        own_pool = pool is None
+        if own_pool:
+            pool = self.open_pool(size=1)
+        try:
+            results = pool.upload(users, self.upload_mode, self.concurrency,
+                                  on_progress=on_progress, cancel_event=cancel_event)
+        finally:
+            if own_pool:
+                pool.close()
+        counts = apply_upload_results(tickets, results)
+        self.update_ledger(tickets)
+        return counts
+
+    def provision_group(self, tickets, cancel_event=None, pools=None):
+        """Envía los tickets a todos los routers del grupo en paralelo
+
+        pools: los de group.open_pools() para reutilizar conexiones entre bloques.
+        """
+        log = self.log
+        users = [ticket_upload_tuple(ticket) for ticket in tickets]
+        log(f"🌐 Enviando {len(users)} tickets a {len(self.group)} routers en paralelo...")
+
+        def on_progress(router, done, total):
+            log(f"📡 {router}: {done}/{total} tickets")
+
+        def on_device_done(report):
+            counts = report['counts']
+            if report['state'] == 'error':
+                message = f"❌ {report['device']}: sin subir ({report['error']})"
+            else:
+                icon = "✅" if report['state'] == 'ok' else "⚠️"
+                message = (f"{icon} {report['device']}: {counts['ok']} creados, {counts['dup']} ya existían, "
+                           f"{counts['error']} con error ({report['elapsed']:.1f}s)")
+            log(message)
+
+        reports = self.group.provision(users, self.upload_mode, self.concurrency,
+                                       on_progress=on_progress, on_device_done=on_device_done,
+                                       cancel_event=cancel_event, pools=pools)
+        provisioning.apply_group_results(tickets, reports)
+        self.update_ledger(tickets)
+        return reports
+
+    # Lote completo
+
+    def generate(self, prefix, quantity, profile, uptime_limit, on_chunk=None, cancel_event=None,
+                 chunk_size=PIPELINE_CHUNK_SIZE, on_progress=None):
+        """Genera y sube un lote en pipeline: generar → subir → tabla
+
+        Cada bloque pasa por las etapas a su ritmo con colas acotadas entre
+        ellas. Las conexiones a cada router se abren una vez para todo el lote
+        y hasta UPLOAD_WINDOW bloques se suben a la vez; la tabla los recibe
+        de nuevo en orden de generación. Cada bloque se guarda en el registro
+        apenas se generan sus códigos (el cursor ya avanzó) y la subida solo
+        actualiza su estado. on_chunk(tickets) recibe cada bloque terminado
+        (con su estado final) y on_progress(hechos, total) el avance. Al
+        cancelar se deja de generar y lo ya generado termina de pasar por las
+        etapas. Devuelve {'done', 'skipped', 'counts', 'batch_id'}.
+        """
+        log = self.log
+        # 🔎 Pre-verificación: ningún comando de subida se gasta en un nombre repetido
+        taken = self.load_existing_usernames()
+
+        upload = self.uploads
+        batch_id = self.ledger.new_batch_id(prefix) if self.ledger is not None else None
+        stats = {'done': 0, 'skipped': 0, 'batch_id': batch_id,
+                 'counts': {provisioning.RESULT_OK: 0, provisioning.RESULT_DUP: 0, provisioning.RESULT_ERROR: 0}}
+        stats_lock = threading.Lock()
+        pipeline = job_engine.Pipeline(cancel_event)
+
+        def generate_chunks():
+            for sequence, chunk_start in enumerate(range(0, quantity, chunk_size)):
+                if pipeline.cancel_event.is_set():
+                    return
+                count = min(chunk_size, quantity - chunk_start)
+                # Códigos únicos sin reintentos (permutación con cursor persistente)
+                usernames, skipped = self.code_generator.take(prefix, count, taken)
+                stats['skipped'] += skipped
+                chunk = make_tickets(usernames, profile, uptime_limit,
+                                     STATUS_GENERATED if upload else STATUS_LOCAL, chunk_start + 1)
+                # 📒 Al registro antes de subir: un corte a mitad de subida no pierde códigos
+                self.record(chunk, prefix, batch_id=batch_id)
+                yield sequence, chunk
+
+        def upload_chunk(item):
+            _, chunk = item
+            counts = None
+            try:
+                if self.group is not None:
+                    self.provision_group(chunk, cancel_event=pipeline.cancel_event, pools=pools)
+                else:
+                    counts = self.upload(chunk, cancel_event=pipeline.cancel_event, pool=pools)
+            except Exception as e:
+                # El bloque sigue hacia la tabla con el error; los siguientes se intentan igual
+                log(f"❌ Error subiendo el bloque de {len(chunk)} tickets: {str(e)}")
+                status = provisioning.status_for_result(provisioning.RESULT_ERROR, str(e))
+                for ticket in chunk:
+                    ticket['status'] = status
+                self.update_ledger(chunk)
+                if self.group is None:
+                    counts = {provisioning.RESULT_ERROR: len(chunk)}
+            if counts:
+                with stats_lock:
+                    for state, total in counts.items():
+                        stats['counts'][state] += total
+            return item
+
+        # Bloques que terminaron de subir antes que uno anterior
+        pending = {}
+        next_sequence = [0]
+
+        def sink(item):
+            sequence, chunk = item
+            pending[sequence] = chunk
+            while next_sequence[0] in pending:
+                write_chunk(pending.pop(next_sequence[0]))
+                next_sequence[0] += 1
+
+        def write_chunk(chunk):
+            if on_chunk:
+                on_chunk(chunk)
+            stats['done'] += len(chunk)
+            if on_progress:
+                on_progress(stats['done'], quantity)
+            log(f"📊 Progreso: {stats['done']}/{quantity} tickets ({stats['done'] / quantity * 100:.1f}%)")
+
+        if upload and self.group is None:
+            log(f"🚀 Subiendo por bloques de {chunk_size} tickets con {self.upload_method()}...")
+
+        pools = None
+        if upload:
+            pools = self.group.open_pools() if self.group is not None else self.open_pool()
+            pipeline.add_stage('subida', upload_chunk, workers=provisioning.UPLOAD_WINDOW)
+        pipeline.add_stage('tabla', sink)
+        try:
+            pipeline.run(generate_chunks())
+        finally:
+            if self.group is not None and pools is not None:
+                self.group.close_pools(pools)
+            elif pools is not None:
+                pools.close()
+
+        if stats['skipped']:
+            log(f"♻️ {stats['skipped']} códigos omitidos porque ya existían en el router")
+        if upload and self.group is None:
+            log(format_upload_summary(stats['counts']))
+        return stats
@@ -0,0 +1,144 @@
+"""
+CH Pines - Generador de códigos de ticket sin colisiones
+Permutación pseudoaleatoria con clave (red de Feistel que preserva el formato)
+sobre el espacio de 6 dígitos, con cursor persistente por prefijo
+"""
+
+import hashlib
+import json
+import os
+import secrets
+import threading
+
+# Espacio de códigos: siempre 6 dígitos, igual que los tickets anteriores
+CODE_MIN = 100000
+CODE_MAX = 999999
+CODE_SPACE = CODE_MAX - CODE_MIN + 1
+
+# Dominio binario de la red de Feistel: 2^20 = 1048576 >= CODE_SPACE
+HALF_BITS = 10
+FEISTEL_ROUNDS = 6
+
+# Clave y cursores persistidos junto al programa
+STATE_FILE = 'ticket_codes.json'
+
+
+class FeistelPermutation:
+    """Biyección con clave sobre [0, domain) (por defecto [0, CODE_SPACE))
+
+    Red de Feistel balanceada de 2 * half_bits bits con recorrido de ciclo
+    (cycle-walking): si la salida cae fuera del espacio se vuelve a cifrar
+    hasta caer dentro, lo que conserva la biyección sobre el subconjunto.
+    """
+
+    def __init__(self, key, tweak='', domain=CODE_SPACE, half_bits=HALF_BITS):
+        if not 0 < domain <= 1 << (2 * half_bits) or half_bits > 16:
+            raise ValueError("El dominio no cabe en la red de Feistel")
+        self.domain = domain
+        self._half_bits = half_bits
+        self._half_mask = (1 << half_bits) - 1
+        # Subclave por ronda y por prefijo: cada prefijo recorre otro orden
+        self._round_keys = [
+            hashlib.blake2b(f'{tweak}|{r}'.encode('utf-8'), key=key, digest_size=32).digest()
+            for r in range(FEISTEL_ROUNDS)
+        ]
+
+    def _round(self, r, value):
+        digest = hashlib.blake2b(value.to_bytes(2, 'big'), key=self._round_keys[r], digest_size=2).digest()
+        return int.from_bytes(digest, 'big') & self._half_mask
+
+    def _encrypt(self, value):
+        left, right = value >> self._half_bits, value & self._half_mask
+        for r in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ self._round(r, right)
+        return (left << self._half_bits) | right
+
+    def permute(self, index):
+        """Posición index (0..domain-1) -> código permutado en el mismo rango"""
+        value = self._encrypt(index)
+        while value >= self.domain:
+            value = self._encrypt(value)
+        return value
+
+
+class CodeGenerator:
+    """Entrega nombres de usuario únicos por prefijo sin reintentos
+
+    Recorre la permutación de cada prefijo con un cursor que avanza y se
+    guarda en disco antes de devolver los nombres: una ejecución posterior
+    nunca vuelve a emitir un código ya entregado. Memoria O(1) por prefijo.
+    """
+
+    def __init__(self, state_path=None):
+        if state_path is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            state_path = os.path.join(script_dir, STATE_FILE)
+        self.state_path = state_path
+        self._lock = threading.Lock()
+        self._permutations = {}
+        self.key = None
+        self.cursors = {}
+        self._load()
+
+    def _load(self):
+        state = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        if state.get('key'):
+            self.key = bytes.fromhex(state['key'])
+            self.cursors = {prefix: int(cursor) for prefix, cursor in state.get('cursors', {}).items()}
+        else:
+            # Primera ejecución: clave nueva, todos los cursores en cero
+            self.key = secrets.token_bytes(32)
+            self.cursors = {}
+            self._save()
+
+    def _save(self):
+        state = {'key': self.key.hex(), 'cursors': self.cursors}
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(temp_path, self.state_path)
+
+    def _permutation(self, prefix):
+        permutation = self._permutations.get(prefix)
+        if permutation is None:
+            permutation = FeistelPermutation(self.key, prefix)
+            self._permutations[prefix] = permutation
+        return permutation
+
+    def remaining(self, prefix):
+        """Códigos que aún no se han emitido para el prefijo"""
+        return CODE_SPACE - self.cursors.get(prefix, 0)
+
+    def take(self, prefix, count, taken=None):
+        """Reserva count nombres nuevos para el prefijo
+
+        taken: set opcional de nombres ocupados (p. ej. usuarios ya existentes
+        en el router); esos códigos se saltan y los nombres entregados se
+        agregan al set.
+        Devuelve (lista de nombres, códigos saltados por estar ocupados).
+        """
+        with self._lock:
+            permutation = self._permutation(prefix)
+            cursor = self.cursors.get(prefix, 0)
+            usernames = []
+            skipped = 0
+            while len(usernames) < count:
+                if cursor >= CODE_SPACE:
+                    raise Exception(f"Se agotaron los códigos de 6 dígitos para el prefijo '{prefix}'")
+                username = f"{prefix}{CODE_MIN + permutation.permute(cursor)}"
+                cursor += 1
+                if taken is not None and username in taken:
+                    skipped += 1
+                    continue
+                usernames.append(username)
+
+            # Guardar el cursor antes de usar los nombres: nunca se reemiten
+            self.cursors[prefix] = cursor
+            self._save()
+
+        if taken is not None:
+            taken.update(usernames)
+        return usernames, skipped
@@ -0,0 +1,189 @@
+"""
+CH Pines - Registro persistente de tickets (SQLite)
+Cada ticket generado queda guardado con su lote, perfil, tiempo, router y
+estado; consultas por lote, estado o fecha sin cargar todo en memoria
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+# Base de datos junto al programa
+LEDGER_FILE = 'ticket_ledger.db'
+
+# Filas por executemany dentro de una transacción
+INSERT_CHUNK_SIZE = 5000
+
+STATUS_GENERATED = 'Generado'
+STATUS_USED = 'Usado'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    password TEXT NOT NULL DEFAULT '',
+    batch TEXT NOT NULL,
+    prefix TEXT NOT NULL DEFAULT '',
+    profile TEXT NOT NULL DEFAULT '',
+    uptime TEXT NOT NULL DEFAULT '',
+    router TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_username ON tickets (username);
+CREATE INDEX IF NOT EXISTS idx_tickets_batch ON tickets (batch, status);
+CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets (status);
+CREATE INDEX IF NOT EXISTS idx_tickets_created ON tickets (created_at);
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prefix TEXT NOT NULL DEFAULT '',
+    created_at TEXT NOT NULL
+);
+"""
+
+TICKET_COLUMNS = ('username', 'password', 'batch', 'prefix', 'profile', 'uptime',
+                  'router', 'status', 'created_at', 'updated_at')
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _chunks(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class TicketLedger:
+    """Registro de tickets en SQLite, seguro para usar desde varios hilos
+
+    Las escrituras van en lotes (executemany) dentro de una sola
+    transacción; las consultas usan los índices por usuario, lote,
+    estado y fecha y devuelven listas de diccionarios.
+    """
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            db_path = os.path.join(script_dir, LEDGER_FILE)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params)]
+
+    def new_batch_id(self, prefix):
+        """Identificador de lote legible y único: PREFIJO-AAAAMMDD-HHMMSS-N
+
+        N es el id de la fila en la tabla batches: dos lotes con el mismo
+        prefijo en el mismo segundo no se mezclan en el registro.
+        """
+        now = datetime.now()
+        with self._lock, self._conn:
+            cursor = self._conn.execute("INSERT INTO batches (prefix, created_at) VALUES (?, ?)",
+                                        (prefix or '', now.strftime('%Y-%m-%d %H:%M:%S')))
+        return f"{prefix or 'lote'}-{now.strftime('%Y%m%d-%H%M%S')}-{cursor.lastrowid}"
+
+    def record_tickets(self, tickets, batch, prefix='', router=''):
+        """Guarda los tickets de un lote; devuelve cuántos se registraron"""
+        now = _now()
+        rows = [(ticket['username'], ticket.get('password', ''), batch, prefix,
+                 ticket.get('profile', ''), ticket.get('uptime_limit', ''), router,
+                 ticket.get('status', STATUS_GENERATED), now, now)
+                for ticket in tickets]
+        sql = (f"INSERT INTO tickets ({', '.join(TICKET_COLUMNS)}) "
+               f"VALUES ({', '.join('?' * len(TICKET_COLUMNS))})")
+        with self._lock, self._conn:
+            for chunk in _chunks(rows, INSERT_CHUNK_SIZE):
+                self._conn.executemany(sql, chunk)
+        return len(rows)
+
+    def update_statuses(self, tickets, batch=None):
+        """Actualiza el estado guardado de cada ticket (por usuario y lote)"""
+        now = _now()
+        if batch is None:
+            sql = "UPDATE tickets SET status = ?, updated_at = ? WHERE username = ?"
+            rows = [(ticket.get('status', ''), now, ticket['username']) for ticket in tickets]
+        else:
+            sql = "UPDATE tickets SET status = ?, updated_at = ? WHERE username = ? AND batch = ?"
+            rows = [(ticket.get('status', ''), now, ticket['username'], batch) for ticket in tickets]
+        with self._lock, self._conn:
+            for chunk in _chunks(rows, INSERT_CHUNK_SIZE):
+                self._conn.executemany(sql, chunk)
+
+    def mark_used(self, usernames, batch=None):
+        """Marca tickets como usados (por usuario y lote, igual que update_statuses)
+
+        Los usuarios vienen del router (BatchRunner.sync_used). Devuelve
+        cuántos tickets pasaron a usados.
+        """
+        now = _now()
+        if batch is None:
+            sql = "UPDATE tickets SET status = ?, updated_at = ? WHERE username = ? AND status != ?"
+            rows = [(STATUS_USED, now, username, STATUS_USED) for username in usernames]
+        else:
+            sql = ("UPDATE tickets SET status = ?, updated_at = ? WHERE username = ? AND batch = ? "
+                   "AND status != ?")
+            rows = [(STATUS_USED, now, username, batch, STATUS_USED) for username in usernames]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            for chunk in _chunks(rows, INSERT_CHUNK_SIZE):
+                self._conn.executemany(sql, chunk)
+            return self._conn.total_changes - before
+
+    def find(self, username):
+        """Historial de un usuario (puede haber varios registros si se reimportó)"""
+        return self._query("SELECT * FROM tickets WHERE username = ? ORDER BY id", (username,))
+
+    def tickets_by_batch(self, batch, status=None):
+        if status is None:
+            return self._query("SELECT * FROM tickets WHERE batch = ? ORDER BY id", (batch,))
+        return self._query("SELECT * FROM tickets WHERE batch = ? AND status = ? ORDER BY id",
+                           (batch, status))
+
+    def tickets_by_status(self, status, limit=None):
+        sql = "SELECT * FROM tickets WHERE status = ? ORDER BY id"
+        if limit:
+            return self._query(sql + " LIMIT ?", (status, int(limit)))
+        return self._query(sql, (status,))
+
+    def tickets_between(self, start, end):
+        """Tickets creados entre dos fechas ('AAAA-MM-DD' o 'AAAA-MM-DD HH:MM:SS')"""
+        if len(end) == 10:
+            end += ' 23:59:59'
+        return self._query("SELECT * FROM tickets WHERE created_at BETWEEN ? AND ? ORDER BY id",
+                           (start, end))
+
+    def unused_tickets(self, batch):
+        """Tickets del lote que no se han usado ni fallaron al subir
+
+        'Usado' solo lo conoce el router: la respuesta vale a partir de la
+        última sincronización (BatchRunner.sync_used).
+        """
+        return self._query("SELECT * FROM tickets WHERE batch = ? AND status != ? "
+                           "AND status NOT LIKE 'Error%' ORDER BY id", (batch, STATUS_USED))
+
+    def batches(self, limit=20):
+        """Últimos lotes con su cantidad de tickets y fecha"""
+        return self._query("SELECT batch, prefix, profile, router, COUNT(*) AS total, "
+                           "MIN(created_at) AS created_at FROM tickets "
+                           "GROUP BY batch ORDER BY MIN(id) DESC LIMIT ?", (int(limit),))
+
+    def status_counts(self, batch):
+        """{estado: cantidad} para un lote"""
+        rows = self._query("SELECT status, COUNT(*) AS total FROM tickets WHERE batch = ? "
+                           "GROUP BY status", (batch,))
+        return {row['status']: row['total'] for row in rows}
@@ -0,0 +1,219 @@
+"""
+CH Pines - Almacén de tickets en columnas
+Arreglos paralelos en lugar de un diccionario por ticket: los nombres en
+un solo búfer de bytes y perfil, tiempo, estado y lote como códigos
+enteros de tablas de valores; un millón de tickets ocupa decenas de MB
+"""
+
+from array import array
+from collections.abc import Mapping
+
+# Campos que tienen columna propia (uptime_limit comparte la de time_limit)
+FIELDS = ('number', 'username', 'password', 'profile', 'uptime_limit', 'time_limit', 'status', 'batch_id')
+_FIELD_SET = frozenset(FIELDS)
+_TIME_KEYS = ('time_limit', 'uptime_limit')
+
+
+class _CodeColumn:
+    """Columna de valores repetidos: código entero por fila + tabla de valores
+
+    Los códigos empiezan en 16 bits y pasan a 32 si aparecen más de 65535
+    valores distintos (p. ej. muchos estados de error con detalle).
+    """
+
+    def __init__(self):
+        self.values = []
+        self._index = {}
+        self.codes = array('H')
+
+    def code(self, value):
+        code = self._index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self._index[value] = code
+            if code > 0xFFFF and self.codes.typecode == 'H':
+                self.codes = array('I', self.codes)
+        return code
+
+    def append(self, value):
+        self.codes.append(self.code(value))
+
+    def get(self, index):
+        return self.values[self.codes[index]]
+
+
+class TicketRow(Mapping):
+    """Vista de solo lectura de un ticket del almacén (se lee como un dict)
+
+    No copia nada: cada acceso va a las columnas.
+    """
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        value = self.store.value(self.index, key, _ABSENT)
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return iter(self.store.keys(self.index))
+
+    def __len__(self):
+        return len(self.store.keys(self.index))
+
+    def __repr__(self):
+        return f"TicketRow({dict(self)!r})"
+
+
+_ABSENT = object()
+
+
+class TicketStore:
+    """Lista de tickets en columnas; se usa como una lista de diccionarios
+
+    - len(), for, store[i] (TicketRow) y store[a:b] (lista de TicketRow).
+    - extend(tickets) / append(ticket) empaquetan diccionarios (o filas) y
+      no guardan referencia a ellos.
+    - value(i, campo) y column(campo) leen sin crear vistas; es lo que usan
+      la tabla, el plan de páginas y las copias al portapapeles.
+    Los tickets sin número, tiempo o lote devuelven el valor por defecto
+    de get(); las claves fuera de FIELDS se guardan aparte por fila.
+    """
+
+    def __init__(self, tickets=None):
+        self._name_bytes = bytearray()
+        self._name_ends = array('I')
+        self._numbers = array('I')  # 0 = sin número
+        self._passwords = {}        # Solo los tickets con contraseña
+        self._profiles = _CodeColumn()
+        self._times = _CodeColumn()
+        self._statuses = _CodeColumn()
+        self._batches = _CodeColumn()
+        self._code_columns = {'profile': self._profiles, 'time_limit': self._times,
+                              'uptime_limit': self._times, 'status': self._statuses,
+                              'batch_id': self._batches}
+        self._extras = {}           # fila → {clave: valor} fuera de FIELDS
+        self.version = 0            # Cambia con cada extend (invalida índices)
+        if tickets is not None:
+            self.extend(tickets)
+
+    # Lista
+
+    def __len__(self):
+        return len(self._name_ends)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TicketRow(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return TicketRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield TicketRow(self, index)
+
+    def append(self, ticket):
+        self.extend((ticket,))
+
+    def extend(self, tickets):
+        # Bucle con todo en variables locales: se empaqueta un bloque por vez desde la interfaz
+        name_bytes, name_ends, numbers = self._name_bytes, self._name_ends, self._numbers
+        profiles, times, statuses, batches = self._profiles, self._times, self._statuses, self._batches
+        index = len(name_ends)
+        for ticket in tickets:
+            get = ticket.get
+            name_bytes += str(get('username', '')).encode('utf-8')
+            name_ends.append(len(name_bytes))
+
+            number = get('number')
+            stored_number = number if type(number) is int and 0 < number <= 0xFFFFFFFF else 0
+            numbers.append(stored_number)
+            password = get('password')
+            if password:
+                self._passwords[index] = password
+
+            time_limit = get('time_limit', get('uptime_limit'))
+            profiles.append(get('profile'))
+            times.append(time_limit)
+            statuses.append(get('status'))
+            batches.append(get('batch_id'))
+
+            extra_keys = ticket.keys() - _FIELD_SET
+            if 'number' in ticket and not stored_number:
+                extra_keys.add('number')
+            if 'uptime_limit' in ticket and ticket['uptime_limit'] != time_limit:
+                extra_keys.add('uptime_limit')
+            if extra_keys:
+                self._extras[index] = {key: ticket[key] for key in extra_keys}
+            index += 1
+        self.version += 1
+
+    # Lectura por columnas
+
+    def username(self, index):
+        start = self._name_ends[index - 1] if index else 0
+        return self._name_bytes[start:self._name_ends[index]].decode('utf-8')
+
+    def codes(self, key):
+        """(códigos por fila, tabla de valores) de profile, time_limit, status o batch_id"""
+        column = self._code_columns[key]
+        return column.codes, column.values
+
+    def time_codes(self):
+        """(códigos por fila, tabla de valores) de la columna de tiempo"""
+        return self.codes('time_limit')
+
+    def value(self, index, key, default=None):
+        """Campo de un ticket sin crear su vista (default si no lo tiene)"""
+        extras = self._extras.get(index)
+        if extras and key in extras:
+            return extras[key]
+        if key == 'username':
+            return self.username(index)
+        if key in _TIME_KEYS:
+            value = self._times.get(index)
+        elif key == 'profile':
+            value = self._profiles.get(index)
+        elif key == 'status':
+            value = self._statuses.get(index)
+        elif key == 'batch_id':
+            value = self._batches.get(index)
+        elif key == 'number':
+            value = self._numbers[index] or None
+        elif key == 'password':
+            return self._passwords.get(index, '')
+        else:
+            return default
+        return default if value is None else value
+
+    def keys(self, index):
+        keys = ['username', 'password']
+        if self._numbers[index]:
+            keys.insert(0, 'number')
+        for key, column in (('profile', self._profiles), ('uptime_limit', self._times),
+                            ('time_limit', self._times), ('status', self._statuses),
+                            ('batch_id', self._batches)):
+            if column.get(index) is not None:
+                keys.append(key)
+        for key in self._extras.get(index, ()):
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    def column(self, key, default=None):
+        """Recorre un campo de todos los tickets en orden"""
+        if key == 'username':
+            for index in range(len(self)):
+                yield self.username(index)
+            return
+        for index in range(len(self)):
+            yield self.value(index, key, default)
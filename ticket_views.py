@@ -0,0 +1,280 @@
+"""
+CH Pines - Orden y búsqueda de la tabla de tickets
+Permutaciones e índices sobre el TicketStore: ordenar o filtrar no mueve
+los tickets, solo cambia qué ticket muestra cada fila de la tabla
+"""
+
+from array import array
+
+import time_spec
+
+# Campos por los que se puede ordenar (y sus nombres equivalentes)
+SORT_FIELDS = ('username', 'profile', 'time_limit', 'status', 'batch_id')
+FIELD_ALIASES = {'uptime_limit': 'time_limit', 'time': 'time_limit', 'batch': 'batch_id'}
+
+# Primer elemento de la clave de orden de un valor vacío
+_BLANK = 2
+
+# Campos con índice invertido para filtrar
+FILTER_FIELDS = ('status', 'profile', 'batch_id')
+# Filas nuevas que se recorren sin ordenar antes de fusionarlas al índice de nombres
+SEARCH_TAIL_MIN = 4096
+
+
+def sort_field(field):
+    """Nombre del campo de orden, o None si no se puede ordenar por él"""
+    field = FIELD_ALIASES.get(field, field)
+    return field if field in SORT_FIELDS else None
+
+
+def _natural_key(value):
+    """Números antes que textos y los vacíos al final"""
+    if value is None or value == '':
+        return (_BLANK, 0, '')
+    if isinstance(value, (int, float)):
+        return (0, value, '')
+    return (1, 0, str(value).casefold())
+
+
+def _time_key(value):
+    """Por duración (1H antes que DÍA); lo que no se reconoce, por texto"""
+    if value is None or value == '':
+        return (_BLANK, 0, '')
+    seconds = time_spec.parse(value).seconds
+    if seconds is None:
+        return (1, 0, str(value).casefold())
+    return (0, seconds, '')
+
+
+class SortIndex:
+    """Permutaciones ordenadas de un TicketStore, una por campo y sentido
+
+    order(campo, descendente) devuelve un array('I') con los índices del
+    almacén en ese orden. Es estable: los empates conservan el orden de
+    generación, y los vacíos quedan al final en ambos sentidos. Cada
+    permutación se calcula una vez y se reutiliza hasta que el almacén
+    cambie (store.version).
+    - Perfil, tiempo, estado y lote: se ordena la tabla de valores (unos
+      pocos) y los índices se reparten por código, sin comparar tickets.
+    - Usuario: un sort sobre los nombres del búfer.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._version = store.version
+        self._orders = {}
+
+    def order(self, field, descending=False):
+        field = sort_field(field)
+        if field is None:
+            raise ValueError("No se puede ordenar por ese campo")
+        if self.store.version != self._version:
+            self._orders.clear()
+            self._version = self.store.version
+        order = self._orders.get((field, descending))
+        if order is None:
+            order = self._orders[(field, descending)] = self._build(field, descending)
+        return order
+
+    def _build(self, field, descending):
+        store = self.store
+        if field == 'username':
+            return array('I', sorted(range(len(store)), key=store.username, reverse=descending))
+
+        codes, values = store.codes(field)
+        value_key = _time_key if field == 'time_limit' else _natural_key
+        keys = [value_key(value) for value in values]
+        ranked = sorted(range(len(values)), key=keys.__getitem__)
+        if descending:
+            # Invertido, pero los vacíos siguen al final
+            ranked = ([code for code in reversed(ranked) if keys[code][0] != _BLANK]
+                      + [code for code in ranked if keys[code][0] == _BLANK])
+        buckets = [array('I') for _ in values]
+        for index, code in enumerate(codes):
+            buckets[code].append(index)
+        order = array('I')
+        for code in ranked:
+            order.extend(buckets[code])
+        return order
+
+
+class SearchIndex:
+    """Índice de búsqueda sobre un TicketStore, al día con cada bloque nuevo
+
+    - Usuarios: índices del almacén ordenados por nombre en minúsculas; los
+      que empiezan con un prefijo son un tramo contiguo que se ubica con
+      dos búsquedas binarias. Las filas nuevas esperan en una cola corta
+      que se recorre entera y se fusiona al índice cuando crece (cada
+      fusión mueve al menos una cuarta parte de lo ya ordenado).
+    - Estado, perfil y lote: filas de cada código (índice invertido).
+    Solo se guardan índices enteros; los nombres se leen del almacén.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._name_order = array('I')
+        self._tail = array('I')
+        self._tail_keys = []   # Nombres en minúsculas de la cola (pocos, se recorren en cada búsqueda)
+        self._postings = {field: [] for field in FILTER_FIELDS}
+        self._indexed = 0
+
+    def _key(self, index):
+        return self.store.username(index).casefold()
+
+    def update(self):
+        """Indexa las filas agregadas desde la última vez"""
+        start, end = self._indexed, len(self.store)
+        if start == end:
+            return
+        for field in FILTER_FIELDS:
+            self._add_postings(field, start, end)
+        self._tail.extend(range(start, end))
+        self._tail_keys.extend(self._key(index) for index in range(start, end))
+        if len(self._tail) > max(SEARCH_TAIL_MIN, len(self._name_order) // 4):
+            # Dos tramos ya ordenados: el sort de Python los fusiona en una pasada
+            tail = sorted(range(len(self._tail)), key=self._tail_keys.__getitem__)
+            self._tail = array('I', [self._tail[position] for position in tail])
+            self._name_order = array('I', sorted(self._name_order + self._tail, key=self._key))
+            self._tail = array('I')
+            self._tail_keys = []
+        self._indexed = end
+
+    def _add_postings(self, field, start, end):
+        codes, _ = self.store.codes(field)
+        postings = self._postings[field]
+        for index in range(start, end):
+            code = codes[index]
+            while len(postings) <= code:
+                postings.append(array('I'))
+            postings[code].append(index)
+
+    def values(self, field):
+        """Valores de un campo de filtro que tiene al menos un ticket"""
+        self.update()
+        _, values = self.store.codes(field)
+        return [values[code] for code, rows in enumerate(self._postings[field])
+                if rows and values[code] is not None]
+
+    def prefix_rows(self, prefix):
+        """Tickets cuyo usuario empieza con prefix (sin distinguir mayúsculas), en orden de generación"""
+        self.update()
+        prefix = prefix.casefold()
+        # Los que empiezan con prefix están entre prefix y el prefijo siguiente ("ch1" → "ch2")
+        following = prefix[:-1] + chr(ord(prefix[-1]) + 1) if prefix else None
+        first = self._lower_bound(prefix)
+        last = self._lower_bound(following) if following else len(self._name_order)
+        rows = list(self._name_order[first:last])
+        rows.extend(index for index, key in zip(self._tail, self._tail_keys) if key.startswith(prefix))
+        rows.sort()
+        return array('I', rows)
+
+    def _lower_bound(self, text):
+        """Primera posición del índice de nombres cuyo nombre no es menor que text"""
+        key = self._key
+        order = self._name_order
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if key(order[middle]) < text:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def search(self, prefix='', **filters):
+        """Índices (orden de generación) que cumplen el prefijo y los filtros
+
+        filters: status, profile y/o batch_id con el valor exacto buscado.
+        """
+        self.update()
+        store = self.store
+        checks = []
+        candidates = None
+        for field, value in filters.items():
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"No se puede filtrar por {field}")
+            codes, values = store.codes(field)
+            postings = self._postings[field]
+            code = values.index(value) if value in values else len(postings)
+            rows = postings[code] if code < len(postings) else array('I')
+            if candidates is None or len(rows) < len(candidates):
+                candidates = rows
+            checks.append((codes, code))
+
+        if prefix:
+            candidates = self.prefix_rows(prefix)
+        elif candidates is None:
+            return array('I', range(len(store)))
+        # El conjunto más chico se recorre y los demás criterios se comparan por código
+        return array('I', [index for index in candidates
+                           if all(codes[index] == code for codes, code in checks)])
+
+
+class TicketView:
+    """Filas que muestra la tabla: el almacén a través del filtro y el orden
+
+    index(fila) traduce una fila de la tabla al índice del ticket en el
+    almacén; sin filtro ni orden es la misma fila (orden de generación).
+    Las filas visibles se recalculan solas cuando el almacén cambia, así
+    los bloques que llegan durante la generación aparecen si cumplen el
+    filtro.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.sorter = SortIndex(store)
+        self.searcher = SearchIndex(store)
+        self.sort_field = None
+        self.descending = False
+        self.prefix = ''
+        self.filters = {}
+        self._rows = None        # índices del almacén por fila, None = todas en orden
+        self._rows_version = None
+
+    def __len__(self):
+        rows = self._current_rows()
+        return len(self.store) if rows is None else len(rows)
+
+    @property
+    def filtered(self):
+        return bool(self.prefix or self.filters)
+
+    def sort(self, field, descending=False):
+        """Ordena por campo (None vuelve al orden de generación)"""
+        self.sort_field = sort_field(field) if field is not None else None
+        self.descending = descending if self.sort_field else False
+        self._rows_version = None
+        self._current_rows()
+
+    def filter(self, prefix='', **filters):
+        """Muestra solo los tickets cuyo usuario empieza con prefix y con esos valores
+
+        Los filtros con valor None se ignoran; sin nada se muestran todos.
+        """
+        self.prefix = prefix or ''
+        self.filters = {field: value for field, value in filters.items() if value is not None}
+        self._rows_version = None
+        self._current_rows()
+
+    def index(self, row):
+        rows = self._current_rows()
+        return row if rows is None else rows[row]
+
+    def _current_rows(self):
+        if self._rows_version != self.store.version:
+            self._rows = self._build_rows()
+            self._rows_version = self.store.version
+        return self._rows
+
+    def _build_rows(self):
+        order = self.sorter.order(self.sort_field, self.descending) if self.sort_field else None
+        if not self.filtered:
+            return order
+        matches = self.searcher.search(self.prefix, **self.filters)
+        if order is None:
+            return matches
+        # Conservar el orden elegido: recorrer la permutación y quedarse con las coincidencias
+        mask = bytearray(len(self.store))
+        for index in matches:
+            mask[index] = 1
+        return array('I', [index for index in order if mask[index]])
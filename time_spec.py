@@ -0,0 +1,138 @@
+"""
+CH Pines - Interpretación de tiempos de ticket
+Un solo análisis por valor distinto de time_limit: etiqueta impresa (1H,
+DÍA, SEM...), texto limit-uptime para RouterOS y duración en segundos
+"""
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import app_log
+
+log = app_log.get_logger('time_spec')
+
+# Valores distintos que se recuerdan (un lote trae solo unos pocos)
+CACHE_SIZE = 512
+
+DEFAULT_LABEL = "1H"
+
+# text: valor original; seconds: duración o None si no se reconoce;
+# label: etiqueta para la hoja; uptime: texto para limit-uptime
+TimeSpec = namedtuple('TimeSpec', 'text seconds label uptime')
+
+_HOURS_ONLY = re.compile(r'^\d+h$')
+_DAYS_ONLY = re.compile(r'^\d+d$')
+_HOURS = re.compile(r'(\d+)h')
+_DAYS = re.compile(r'(\d+)d')
+_NUMBER = re.compile(r'\d+')
+# Duración estilo RouterOS: 1w2d3h4m5s, opcionalmente seguida de HH:MM:SS ("1d 01:00:00")
+_ROUTEROS = re.compile(r'^(?:(\d+)w)?(?:(\d+)d)?(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?'
+                       r'\s*(?:(\d+):(\d+):(\d+))?$')
+
+_UNIT_SECONDS = (7 * 86400, 86400, 3600, 60, 1, 3600, 60, 1)
+
+
+def _display_label(time_limit):
+    """Etiqueta impresa (misma lógica que el format_time_display original)"""
+    if not time_limit:
+        return DEFAULT_LABEL
+
+    time_str = str(time_limit).lower().strip()
+
+    # Patrones específicos primero (más específico a menos específico)
+    if "30d" in time_str:
+        return "MES"
+    elif "15d" in time_str:
+        return "15D"
+    elif "7d" in time_str:
+        return "SEM"
+    elif "1d" in time_str or time_str == "24h":
+        return "DÍA"
+    elif "mes" in time_str or "month" in time_str or time_str == "1m":
+        return "MES"
+    elif "sem" in time_str or "week" in time_str or time_str == "1w":
+        return "SEM"
+    elif "día" in time_str or "day" in time_str:
+        return "DÍA"
+    elif _HOURS_ONLY.match(time_str):  # Exactamente Xh (ej: 2h, 3h, etc)
+        return f"{time_str[:-1]}H"
+    elif _DAYS_ONLY.match(time_str):  # Exactamente Xd (ej: 2d, 3d, etc)
+        return f"{time_str[:-1]}D"
+    elif "d" in time_str:
+        # Formatos como "1d 01:00:00": 1 día (sin importar horas extra) = DÍA
+        days = _DAYS.findall(time_str)
+        if not days:
+            return "1D"
+        day_num = int(days[0])
+        return "DÍA" if day_num == 1 else f"{day_num}D"
+    elif "h" in time_str:
+        hours = _HOURS.findall(time_str)
+        return f"{hours[0]}H" if hours else DEFAULT_LABEL
+    else:
+        # Si no coincide con nada, tratar de extraer números
+        numbers = _NUMBER.findall(time_str)
+        if not numbers:
+            return DEFAULT_LABEL
+        num = int(numbers[0])
+        return f"{num}D" if num >= 24 else f"{num}H"  # >= 24: probablemente días
+
+
+def _uptime(time_str):
+    """DD:HH:MM:SS, HH:MM:SS o MM:SS al formato de RouterOS (lo demás queda igual)"""
+    try:
+        parts = time_str.split(':')
+
+        if len(parts) == 4:  # DD:HH:MM:SS
+            days, hours, minutes, seconds = map(int, parts)
+            if days > 0:
+                return f"{days}d{hours:02d}:{minutes:02d}:{seconds:02d}"
+            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        elif len(parts) == 3:  # HH:MM:SS
+            hours, minutes, seconds = map(int, parts)
+            return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        elif len(parts) == 2:  # MM:SS
+            minutes, seconds = map(int, parts)
+            return f"00:{minutes:02d}:{seconds:02d}"
+        else:
+            return time_str  # Usar como está si no coincide con formato esperado
+
+    except Exception as e:
+        log.debug("Tiempo %s sin formato DD:HH:MM:SS, se usa como está: %s", time_str, e)
+        return time_str
+
+
+def _seconds(uptime):
+    """Duración en segundos de un texto limit-uptime, o None si no se reconoce"""
+    if not isinstance(uptime, str):
+        return None
+    text = uptime.lower().strip()
+    match = _ROUTEROS.match(text) if text else None
+    if not match or not any(match.groups()):
+        return None
+    return sum(int(value) * unit for value, unit in zip(match.groups(), _UNIT_SECONDS) if value)
+
+
+def _parse(time_limit):
+    log.debug("🔍 Procesando tiempo: '%s'", time_limit)
+    uptime = _uptime(time_limit)
+    return TimeSpec(time_limit, _seconds(uptime), _display_label(time_limit), uptime)
+
+
+_parse_cached = lru_cache(maxsize=CACHE_SIZE, typed=True)(_parse)
+
+
+def parse(time_limit):
+    """TimeSpec del valor, calculado una vez por valor distinto"""
+    try:
+        return _parse_cached(time_limit)
+    except TypeError:
+        return _parse(time_limit)  # Valor no hashable: sin memoria
+
+
+def display_label(time_limit):
+    return parse(time_limit).label
+
+
+def uptime(time_limit):
+    return parse(time_limit).uptime
@@ -0,0 +1,517 @@
+"""
+CH Pines - Tabla virtual de tickets
+Un solo Canvas que dibuja únicamente las filas visibles y recicla sus
+elementos al hacer scroll: abre 100k tickets al instante y sin paginar
+"""
+
+import bisect
+import tkinter as tk
+from collections import OrderedDict
+
+# Geometría y colores (mismos tonos que la tabla Excel anterior)
+ROW_HEIGHT = 22
+HEADER_HEIGHT = 26
+HEADER_BG = '#34495e'
+HEADER_FG = 'white'
+CELL_BG = '#ffffff'
+CELL_ALT_BG = '#f8f9fa'
+CELL_FG = '#2c3e50'
+SELECTED_BG = '#3498db'
+SELECTED_FG = 'white'
+GRID_LINE = '#d5d8dc'
+CELL_FONT = ('Segoe UI', 8)
+SELECTED_FONT = ('Segoe UI', 8, 'bold')
+HEADER_FONT = ('Segoe UI', 9, 'bold')
+
+# Textos leídos por bloques de una pantalla; se guardan los últimos bloques
+ROW_CACHE_PAGES = 5
+
+
+class RowIntervals:
+    """Conjunto de filas guardado como intervalos [inicio, fin) ordenados y disjuntos
+
+    Pertenencia por bisect y cantidad mantenida al día: agregar o quitar un
+    rango de 100k filas cuesta lo mismo que una sola fila.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, row):
+        i = bisect.bisect_right(self.starts, row) - 1
+        return i >= 0 and row < self.ends[i]
+
+    def add(self, start, end):
+        """Agrega las filas start..end-1 (une los intervalos que se tocan)"""
+        if start >= end:
+            return
+        lo = bisect.bisect_left(self.ends, start)    # primero que termina en start o después
+        hi = bisect.bisect_right(self.starts, end)   # primero que empieza después de end
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.count -= sum(e - s for s, e in zip(self.starts[lo:hi], self.ends[lo:hi]))
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+        self.count += end - start
+
+    def remove(self, start, end):
+        """Quita las filas start..end-1 (parte los intervalos que lo cruzan)"""
+        if start >= end:
+            return
+        lo = bisect.bisect_right(self.ends, start)
+        hi = bisect.bisect_left(self.starts, end)
+        if lo >= hi:
+            return
+        starts, ends = [], []
+        if self.starts[lo] < start:
+            starts.append(self.starts[lo])
+            ends.append(start)
+        if self.ends[hi - 1] > end:
+            starts.append(end)
+            ends.append(self.ends[hi - 1])
+        self.count -= sum(e - s for s, e in zip(self.starts[lo:hi], self.ends[lo:hi]))
+        self.count += sum(e - s for s, e in zip(starts, ends))
+        self.starts[lo:hi] = starts
+        self.ends[lo:hi] = ends
+
+    def intervals(self):
+        return zip(self.starts, self.ends)
+
+    def rows(self):
+        for start, end in zip(self.starts, self.ends):
+            yield from range(start, end)
+
+
+class SelectionModel:
+    """Selección de celdas como intervalos de filas por columna
+
+    Reemplaza al conjunto de tuplas (fila, columna): seleccionar una
+    columna o un rectángulo guarda un intervalo por columna, contar es una
+    suma y la extracción recorre los intervalos sin ordenar celdas.
+    """
+
+    def __init__(self):
+        self._columns = {}  # columna → RowIntervals
+
+    def __len__(self):
+        return sum(len(rows) for rows in self._columns.values())
+
+    def __bool__(self):
+        return any(self._columns.values())
+
+    def __contains__(self, cell):
+        rows = self._columns.get(cell[1])
+        return rows is not None and cell[0] in rows
+
+    def clear(self):
+        self._columns.clear()
+
+    def column_rows(self, col):
+        """RowIntervals de una columna (vacío si no tiene nada seleccionado)"""
+        return self._columns.get(col) or RowIntervals()
+
+    def set_range(self, min_row, max_row, min_col, max_col):
+        """Reemplaza la selección por el rectángulo indicado (extremos incluidos)"""
+        self._columns.clear()
+        self.add_range(min_row, max_row, min_col, max_col)
+
+    def add_range(self, min_row, max_row, min_col, max_col):
+        for col in range(min_col, max_col + 1):
+            self._columns.setdefault(col, RowIntervals()).add(min_row, max_row + 1)
+
+    def toggle(self, row, col):
+        rows = self._columns.setdefault(col, RowIntervals())
+        if row in rows:
+            rows.remove(row, row + 1)
+        else:
+            rows.add(row, row + 1)
+
+    def cells(self):
+        """Celdas seleccionadas en orden (fila, columna)
+
+        Recorre tramos de filas con el mismo conjunto de columnas, así
+        una selección rectangular no se ordena celda por celda.
+        """
+        columns = sorted(col for col, rows in self._columns.items() if rows)
+        if not columns:
+            return
+        bounds = sorted({edge for col in columns
+                         for start, end in self._columns[col].intervals()
+                         for edge in (start, end)})
+        for start, end in zip(bounds, bounds[1:]):
+            cols = [col for col in columns if start in self._columns[col]]
+            for row in range(start, end) if cols else ():
+                for col in cols:
+                    yield row, col
+
+
+class VirtualTicketGrid(tk.Frame):
+    """Tabla estilo Excel sobre un Canvas con filas recicladas
+
+    columns: lista de (encabezado, peso de ancho)
+    Los datos no se copian: set_data(cantidad, get_cell) recibe una función
+    get_cell(fila, columna) que se consulta solo para las filas visibles.
+    Filas y columnas de la selección empiezan en 0; la selección es un
+    SelectionModel y solo se repintan las celdas visibles. Doble clic en
+    un encabezado llama on_sort(columna). Todos los eventos se enlazan una
+    vez al Canvas, no a cada celda.
+    Los textos se leen por bloques del alto de la pantalla y, con el bucle
+    de Tk libre, se cargan el bloque anterior y el siguiente: RePág/AvPág
+    pintan desde la caché. Con scheduler (job_engine.IdleScheduler) esa
+    carga es una tarea por partes dentro del presupuesto por cuadro. Cada elemento del pool solo se reconfigura si
+    su texto o color cambió.
+    """
+
+    def __init__(self, parent, columns, on_selection_change=None, on_sort=None, scheduler=None,
+                 **kwargs):
+        kwargs.setdefault('bg', CELL_BG)
+        super().__init__(parent, **kwargs)
+        self.columns = list(columns)
+        self.on_selection_change = on_selection_change
+        self.on_sort = on_sort
+        self.scheduler = scheduler
+        self.sort_indicator = None  # (columna, descendente) que marca el encabezado
+
+        self.row_count = 0
+        self.get_cell = lambda row, col: ''
+        self.top_row = 0
+        self.visible_rows = 0
+        self.selection = SelectionModel()
+        self.anchor = None
+
+        self._col_edges = [0]
+        self._row_pool = []  # [(fondo, texto), ...] por fila visible
+        self._header_items = []
+        self._item_state = {}            # elemento → última configuración aplicada
+        self._page_cache = OrderedDict()  # bloque → [[texto por columna] por fila]
+        self._page_size = 1
+        self._prefetch_id = None
+
+        self.canvas = tk.Canvas(self, bg=CELL_BG, highlightthickness=0, takefocus=1)
+        self.scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind('<Configure>', self._on_configure)
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<Double-Button-1>', self._on_double_click)
+        self.canvas.bind('<Control-Button-1>', self._on_ctrl_click)
+        self.canvas.bind('<Shift-Button-1>', self._on_shift_click)
+        self.canvas.bind('<B1-Motion>', self._on_drag)
+        self.canvas.bind('<MouseWheel>', self._on_mousewheel)
+        self.canvas.bind('<Button-4>', lambda e: self.scroll_rows(-3))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll_rows(3))
+        self.canvas.bind('<Prior>', lambda e: self.scroll_rows(-self.visible_rows))
+        self.canvas.bind('<Next>', lambda e: self.scroll_rows(self.visible_rows))
+        self.canvas.bind('<Home>', lambda e: self.scroll_to(0))
+        self.canvas.bind('<End>', lambda e: self.scroll_to(self.row_count))
+
+    # Datos
+
+    def set_data(self, row_count, get_cell):
+        """Cambia la fuente de datos y vuelve al inicio"""
+        self.row_count = row_count
+        self.get_cell = get_cell
+        self.top_row = 0
+        self.selection.clear()
+        self.anchor = None
+        self.refresh()
+        self._selection_changed()
+
+    def set_row_count(self, row_count):
+        """Actualiza la cantidad de filas sin mover el scroll ni la selección"""
+        self.row_count = row_count
+        self.refresh()
+
+    def refresh(self):
+        """Vuelve a leer y pintar las filas visibles (p. ej. tras cambiar estados)"""
+        self._page_cache.clear()
+        self._redraw()
+
+    def destroy(self):
+        if self._prefetch_id is not None:
+            self.after_cancel(self._prefetch_id)
+            self._prefetch_id = None
+        if self.scheduler is not None:
+            self.scheduler.cancel(self._prefetch_key())
+        super().destroy()
+
+    # Caché de filas
+
+    def _page_values(self, page):
+        """Textos de un bloque de filas (se leen de get_cell una sola vez)"""
+        values = self._page_cache.get(page)
+        if values is not None:
+            self._page_cache.move_to_end(page)
+            return values
+        start = page * self._page_size
+        get_cell = self.get_cell
+        columns = range(len(self.columns))
+        values = [[str(get_cell(row, col)) for col in columns]
+                  for row in range(start, min(self.row_count, start + self._page_size))]
+        self._page_cache[page] = values
+        while len(self._page_cache) > ROW_CACHE_PAGES:
+            self._page_cache.popitem(last=False)
+        return values
+
+    def _row_values(self, row):
+        page, offset = divmod(row, self._page_size)
+        return self._page_values(page)[offset]
+
+    def _prefetch_key(self):
+        return f"{self}:prefetch"
+
+    def _schedule_prefetch(self):
+        if not self.row_count:
+            return
+        if self.scheduler is not None:
+            # Reemplaza la carga pendiente: solo importan los vecinos de la posición actual
+            self.scheduler.submit(self._prefetch_units(), key=self._prefetch_key())
+        elif self._prefetch_id is None:
+            self._prefetch_id = self.after_idle(self._prefetch)
+
+    def _prefetch(self):
+        """Carga el bloque siguiente y el anterior a los visibles"""
+        self._prefetch_id = None
+        for _ in self._prefetch_units():
+            pass
+
+    def _prefetch_units(self):
+        """Un bloque por unidad de trabajo"""
+        first = self.top_row // self._page_size
+        last = (self.top_row + self.visible_rows - 1) // self._page_size
+        for page in (last + 1, first - 1):
+            if page >= 0 and page * self._page_size < self.row_count and page not in self._page_cache:
+                self._page_values(page)
+                yield
+
+    # Scroll
+
+    def _max_top(self):
+        return max(0, self.row_count - max(1, self.visible_rows - 1))
+
+    def scroll_to(self, row):
+        top = min(max(0, int(row)), self._max_top())
+        if top != self.top_row:
+            self.top_row = top
+            self._redraw()
+        else:
+            self._update_scrollbar()
+
+    def scroll_rows(self, delta):
+        self.scroll_to(self.top_row + delta)
+
+    def yview(self, *args):
+        """Comando del Scrollbar ('moveto' fracción o 'scroll' n units/pages)"""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * self.row_count)
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= max(1, self.visible_rows - 1)
+            self.scroll_rows(amount)
+
+    def _update_scrollbar(self):
+        if self.row_count <= 0:
+            self.scrollbar.set(0.0, 1.0)
+            return
+        first = self.top_row / self.row_count
+        last = min(1.0, (self.top_row + self.visible_rows) / self.row_count)
+        self.scrollbar.set(first, last)
+
+    def _on_mousewheel(self, event):
+        self.scroll_rows(-3 if event.delta > 0 else 3)
+
+    # Dibujo
+
+    def _on_configure(self, event):
+        width = max(1, event.width)
+        total_weight = sum(weight for _, weight in self.columns) or 1
+        edges = [0]
+        for _, weight in self.columns:
+            edges.append(edges[-1] + width * weight / total_weight)
+        self._col_edges = edges
+
+        self.visible_rows = max(1, (event.height - HEADER_HEIGHT) // ROW_HEIGHT + 1)
+        if self._page_size != self.visible_rows:
+            self._page_size = self.visible_rows
+            self._page_cache.clear()
+        self._build_items()
+        self.top_row = min(self.top_row, self._max_top())
+        self._redraw()
+
+    def _build_items(self):
+        """Crea (o reubica) los elementos del encabezado y del pool de filas"""
+        canvas = self.canvas
+        edges = self._col_edges
+
+        for items in self._header_items:
+            for item in items:
+                canvas.delete(item)
+        self._header_items = []
+        for col, (header, _) in enumerate(self.columns):
+            rect = canvas.create_rectangle(edges[col], 0, edges[col + 1], HEADER_HEIGHT,
+                                           fill=HEADER_BG, outline=GRID_LINE)
+            text = canvas.create_text((edges[col] + edges[col + 1]) / 2, HEADER_HEIGHT / 2,
+                                      text=self._header_text(col, header),
+                                      fill=HEADER_FG, font=HEADER_FONT)
+            self._header_items.append((rect, text))
+
+        # Solo se crean elementos nuevos si la ventana creció; los demás se reubican
+        while len(self._row_pool) < self.visible_rows:
+            cells = []
+            for col in range(len(self.columns)):
+                rect = canvas.create_rectangle(0, 0, 0, 0, outline=GRID_LINE)
+                text = canvas.create_text(0, 0, anchor='w', font=CELL_FONT, fill=CELL_FG)
+                cells.append((rect, text))
+            self._row_pool.append(cells)
+
+        for i, cells in enumerate(self._row_pool):
+            y0 = HEADER_HEIGHT + i * ROW_HEIGHT
+            for col, (rect, text) in enumerate(cells):
+                canvas.coords(rect, edges[col], y0, edges[col + 1], y0 + ROW_HEIGHT)
+                canvas.coords(text, edges[col] + 6, y0 + ROW_HEIGHT / 2)
+
+    def _header_text(self, col, header):
+        if self.sort_indicator and self.sort_indicator[0] == col:
+            return f"{header} {'▼' if self.sort_indicator[1] else '▲'}"
+        return header
+
+    def set_sort_indicator(self, col, descending=False):
+        """Marca el encabezado de la columna ordenada (col None quita la marca)"""
+        self.sort_indicator = (col, descending) if col is not None else None
+        for col, (header, _) in enumerate(self.columns):
+            if col < len(self._header_items):
+                self.canvas.itemconfigure(self._header_items[col][1], text=self._header_text(col, header))
+
+    def _configure_item(self, item, **options):
+        """itemconfigure solo si cambió algo (cada llamada es un viaje a Tcl)"""
+        state = tuple(options.items())
+        if self._item_state.get(item) != state:
+            self._item_state[item] = state
+            self.canvas.itemconfigure(item, **options)
+
+    def _redraw(self):
+        configure = self._configure_item
+        selected = [self.selection.column_rows(col) for col in range(len(self.columns))]
+        for i, cells in enumerate(self._row_pool):
+            row = self.top_row + i
+            if i >= self.visible_rows or row >= self.row_count:
+                for rect, text in cells:
+                    configure(rect, state='hidden')
+                    configure(text, state='hidden')
+                continue
+
+            base_bg = CELL_ALT_BG if row % 2 else CELL_BG
+            values = self._row_values(row)
+            for col, (rect, text) in enumerate(cells):
+                if row in selected[col]:
+                    configure(rect, fill=SELECTED_BG, state='normal')
+                    configure(text, text=values[col], fill=SELECTED_FG, font=SELECTED_FONT, state='normal')
+                else:
+                    configure(rect, fill=base_bg, state='normal')
+                    configure(text, text=values[col], fill=CELL_FG, font=CELL_FONT, state='normal')
+        self._update_scrollbar()
+        self._schedule_prefetch()
+
+    # Selección
+
+    def _cell_at(self, x, y):
+        """(fila, columna) bajo el puntero; fila -1 = encabezado"""
+        col = bisect.bisect_right(self._col_edges, x) - 1
+        col = min(max(col, 0), len(self.columns) - 1)
+        if y < HEADER_HEIGHT:
+            return -1, col
+        row = self.top_row + int((y - HEADER_HEIGHT) // ROW_HEIGHT)
+        return min(max(row, 0), max(0, self.row_count - 1)), col
+
+    def _on_click(self, event):
+        self.canvas.focus_set()
+        row, col = self._cell_at(event.x, event.y)
+        if row < 0:
+            self.select_column(col)
+            return
+        if not self.row_count:
+            return
+        self.selection.set_range(row, row, col, col)
+        self.anchor = (row, col)
+        self._redraw()
+        self._selection_changed()
+
+    def _on_double_click(self, event):
+        row, col = self._cell_at(event.x, event.y)
+        if row < 0 and self.on_sort:
+            self.on_sort(col)
+
+    def _on_ctrl_click(self, event):
+        row, col = self._cell_at(event.x, event.y)
+        if row < 0 or not self.row_count:
+            return
+        self.selection.toggle(row, col)
+        self.anchor = (row, col)
+        self._redraw()
+        self._selection_changed()
+
+    def _on_shift_click(self, event):
+        row, col = self._cell_at(event.x, event.y)
+        if row < 0 or not self.row_count:
+            return
+        if self.anchor is None:
+            self.anchor = (row, col)
+        self.select_range(self.anchor, (row, col))
+
+    def _on_drag(self, event):
+        if self.anchor is None or not self.row_count:
+            return
+        # Auto-scroll al arrastrar fuera del área visible
+        if event.y < HEADER_HEIGHT:
+            self.scroll_rows(-1)
+        elif event.y > self.canvas.winfo_height():
+            self.scroll_rows(1)
+        row, col = self._cell_at(event.x, max(event.y, HEADER_HEIGHT))
+        self.select_range(self.anchor, (row, col))
+
+    def select_range(self, start, end):
+        """Selecciona el rectángulo entre dos celdas (reemplaza la selección)"""
+        min_row, max_row = sorted((start[0], end[0]))
+        min_col, max_col = sorted((start[1], end[1]))
+        self.selection.set_range(min_row, max_row, min_col, max_col)
+        self._redraw()
+        self._selection_changed()
+
+    def select_column(self, col):
+        if not self.row_count:
+            return
+        self.anchor = (0, col)
+        self.select_range((0, col), (self.row_count - 1, col))
+
+    def select_all(self):
+        if not self.row_count:
+            return
+        self.anchor = (0, 0)
+        self.select_range((0, 0), (self.row_count - 1, len(self.columns) - 1))
+
+    def clear_selection(self):
+        self.selection.clear()
+        self.anchor = None
+        self._redraw()
+        self._selection_changed()
+
+    def selected_values(self, col=None):
+        """Valores seleccionados en orden (fila, columna); opcionalmente de una columna"""
+        get_cell = self.get_cell
+        if col is not None:
+            return [str(get_cell(row, col)) for row in self.selection.column_rows(col).rows()]
+        return [str(get_cell(row, c)) for row, c in self.selection.cells()]
+
+    def _selection_changed(self):
+        if self.on_selection_change:
+            self.on_selection_change(len(self.selection))
@@ -6,24 +6,66 @@ Versión mejorada con descubrimiento automático de dispositivos
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import threading
-import time
-import random
-import string
 from datetime import datetime
+from collections.abc import Mapping
 import json
 import socket
 import subprocess
 import re
 import paramiko
+import mikrotik_ssh
+import routeros_api
+import provisioning
+import ticket_codes
+import ticket_ledger
+import job_engine
+import virtual_grid
+import preview_pages
+import page_layout
+import ticket_store
+import ticket_views
+import ticket_batch
+import app_log
 try:
     import openpyxl
+    import plantilla_export
+    import pdf_writer
     from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
     import os
-    from copy import copy
     EXCEL_AVAILABLE = True
 except ImportError:
     EXCEL_AVAILABLE = False
 
+# Modos de subida de usuarios al MikroTik
+UPLOAD_MODE_SCRIPT = "Masiva (.rsc)"
+UPLOAD_MODE_PARALLEL = "Paralela (SSH)"
+UPLOAD_MODE_SINGLE = "Individual"
+UPLOAD_MODE_KEYS = {
+    UPLOAD_MODE_SCRIPT: provisioning.MODE_SCRIPT,
+    UPLOAD_MODE_PARALLEL: provisioning.MODE_PARALLEL,
+    UPLOAD_MODE_SINGLE: provisioning.MODE_SINGLE,
+}
+
+# Transportes de conexión disponibles y su puerto por defecto
+TRANSPORT_SSH = "SSH"
+TRANSPORT_API = "API RouterOS"
+TRANSPORT_API_SSL = "API-SSL RouterOS"
+TRANSPORT_KEYS = {
+    TRANSPORT_SSH: provisioning.TRANSPORT_SSH,
+    TRANSPORT_API: provisioning.TRANSPORT_API,
+    TRANSPORT_API_SSL: provisioning.TRANSPORT_API_SSL,
+}
+TRANSPORT_PORTS = {label: provisioning.DEFAULT_PORTS[key] for label, key in TRANSPORT_KEYS.items()}
+
+# Tickets por bloque en el pipeline generar → subir → registro/tabla
+PIPELINE_CHUNK_SIZE = ticket_batch.PIPELINE_CHUNK_SIZE
+
+# Columnas de la tabla de tickets: (encabezado, peso de ancho) y campo del ticket
+TICKET_GRID_COLUMNS = [('No.', 1), ('Usuario', 3), ('Password', 2), ('Perfil', 3), ('Tiempo', 2), ('Estado', 4)]
+TICKET_GRID_FIELDS = ('number', 'username', 'password', 'profile', 'uptime_limit', 'status')
+# Opción del filtro de estado que muestra todos los tickets
+ALL_STATUSES = "Todos los estados"
+
 class MikroTikHotspotGenerator:
     def __init__(self, root):
         self.root = root
@@ -38,24 +80,35 @@ class MikroTikHotspotGenerator:
         self.selected_device = None
         self.selected_device_name = "Desconocido"
         self.connection = None
-        self.tickets_data = []
-        
-        # Variables Excel
-        self.selected_cells = set()
-        self.cell_widgets = {}
-        self.drag_start = None
-        self.is_dragging = False
-        self.tickets_tree = None
+        self.connection_params = None  # (ip, puerto, usuario, contraseña) para conexiones extra
+        
+        # Grupo de routers que reciben el mismo lote en paralelo
+        self.device_group = provisioning.DeviceGroup()
+        # Códigos únicos por prefijo (permutación con clave + cursor persistente)
+        self.code_generator = ticket_codes.CodeGenerator()
+        # Registro persistente de todos los tickets generados
+        self.ledger = ticket_ledger.TicketLedger()
+        # Registro: búfer circular para la ventana + archivo rotativo en otro hilo
+        self.log_system = app_log.LogSystem()
+        self.log = app_log.get_logger('gui')
+        # Trabajo por partes en el hilo de Tk: como mucho 8 ms por cuadro, el resto para repintar
+        self.idle_scheduler = job_engine.IdleScheduler(self.root.after)
+        # Canal único hilo → interfaz: logs en bloque y progreso agrupado cada 50 ms
+        self.ui_channel = job_engine.UIChannel(self.root.after, log_sink=self._write_log_lines,
+                                               log_buffer=self.log_system.buffer,
+                                               scheduler=self.idle_scheduler)
+        # Trabajos en segundo plano (generación y cola no corren en el hilo de Tk)
+        self.job_engine = job_engine.JobEngine(self.root.after, channel=self.ui_channel)
+        self.active_job = None
+        # Tickets en columnas (se leen como diccionarios, ocupan una fracción)
+        self.tickets_data = ticket_store.TicketStore()
+        # Orden de la tabla: permutación sobre tickets_data (no mueve los tickets)
+        self.ticket_view = ticket_views.TicketView(self.tickets_data)
         
         # Sistema de cola para múltiples lotes
         self.tickets_queue = []
         self.total_queued_tickets = 0
         
-        # Optimización para grandes volúmenes
-        self.tickets_per_page = 100
-        self.current_page = 0
-        self.total_pages = 0
-        
         # Configurar estilo
         self.setup_style()
         
@@ -67,6 +120,7 @@ class MikroTikHotspotGenerator:
         
         # Asegurar configuración correcta
         self.root.after(100, self.ensure_correct_config)
+        self.ui_channel.start()
     
     def _init_variables(self):
         """Inicializa las variables de tkinter de forma segura"""
@@ -74,8 +128,12 @@ class MikroTikHotspotGenerator:
             self.ticket_type = tk.StringVar(self.root, value="user_only")
             self.quantity_var = tk.StringVar(self.root, value="1000")
             self.profile_var = tk.StringVar(self.root, value="default")
+            self.upload_mode_var = tk.StringVar(self.root, value=UPLOAD_MODE_SCRIPT)
+            self.transport_var = tk.StringVar(self.root, value=TRANSPORT_SSH)
+            self.concurrency_var = tk.StringVar(self.root, value=str(mikrotik_ssh.DEFAULT_CONCURRENCY))
+            self.use_group_var = tk.BooleanVar(self.root, value=False)
         except Exception as e:
-            print(f"Error inicializando variables: {e}")
+            self.log.error(f"Error inicializando variables: {e}")
     
     def __del__(self):
         """Destructor para limpiar recursos"""
@@ -169,7 +227,7 @@ class MikroTikHotspotGenerator:
             self.add_log("🔧 Configuración inicial aplicada correctamente")
             
         except Exception as e:
-            print(f"⚠️ Error en configuración inicial: {e}")
+            self.log.warning(f"⚠️ Error en configuración inicial: {e}")
     
     def create_interface(self):
         """Crea la interfaz principal con scrollbars"""
@@ -237,7 +295,7 @@ class MikroTikHotspotGenerator:
             elif event.num == 5:
                 self.main_canvas.yview_scroll(1, "units")
         except Exception as e:
-            print(f"Error en scroll: {e}")
+            self.log.debug(f"Error en scroll: {e}")
     
     def _on_shiftmousewheel(self, event):
         """Maneja el scroll horizontal con Shift+MouseWheel"""
@@ -245,7 +303,7 @@ class MikroTikHotspotGenerator:
             if event.delta:
                 self.main_canvas.xview_scroll(int(-1*(event.delta/120)), "units")
         except Exception as e:
-            print(f"Error en scroll horizontal: {e}")
+            self.log.debug(f"Error en scroll horizontal: {e}")
     
     def _on_page_up(self, event):
         """Page Up - scroll hacia arriba una página"""
@@ -321,7 +379,11 @@ class MikroTikHotspotGenerator:
         self._create_clean_field(form_frame, "Contraseña:", "", 2, 'device_pass_entry', password=True)
         
         # Campo Puerto
-        self._create_clean_field(form_frame, "Puerto SSH:", "22", 3, 'device_port_entry')
+        self._create_clean_field(form_frame, "Puerto:", "22", 3, 'device_port_entry')
+        
+        # Campo Transporte (SSH o API nativa)
+        self._create_clean_choice(form_frame, "Transporte:", list(TRANSPORT_PORTS), 
+                                  self.transport_var, self._on_transport_selected)
         
         # SECCIÓN DE BOTONES
         button_section = tk.Frame(main_container, bg='#ffffff')
@@ -394,6 +456,39 @@ class MikroTikHotspotGenerator:
         # Guardar referencia
         setattr(self, attr_name, entry)
     
+    def _create_clean_choice(self, parent, label_text, values, variable, command=None):
+        """Crea un selector de formulario con el mismo estilo que los campos"""
+        field_container = tk.Frame(parent, bg='#ffffff')
+        field_container.pack(fill=tk.X, pady=12)
+        
+        label = tk.Label(field_container, 
+                        text=label_text, 
+                        font=('Segoe UI', 12),
+                        bg='#ffffff', 
+                        fg='#2c3e50',
+                        width=22,
+                        anchor='w')
+        label.pack(side=tk.LEFT)
+        
+        combo = ttk.Combobox(field_container, textvariable=variable, values=values,
+                             font=('Segoe UI', 12), state="readonly")
+        combo.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(10, 0), ipady=4)
+        if command:
+            combo.bind('<<ComboboxSelected>>', lambda e: command())
+        return combo
+    
+    def _on_transport_selected(self):
+        """Ajusta el puerto al valor por defecto del transporte elegido"""
+        current_port = self.device_port_entry.get().strip()
+        default_ports = [str(port) for port in TRANSPORT_PORTS.values()]
+        if not current_port or current_port in default_ports:
+            self.device_port_entry.delete(0, tk.END)
+            self.device_port_entry.insert(0, str(TRANSPORT_PORTS[self.transport_var.get()]))
+    
+    def _using_api(self):
+        """Indica si la conexión activa usa la API de RouterOS"""
+        return provisioning.is_api_connection(self.connection)
+    
     def connect_manual_device(self):
         """Conecta manualmente al dispositivo usando los datos ingresados"""
         ip = self.device_ip_entry.get().strip()
@@ -421,7 +516,7 @@ class MikroTikHotspotGenerator:
         
         # Conectar en thread separado
         connect_thread = threading.Thread(target=self._perform_manual_connection, 
-                                        args=(ip, username, password, port))
+                                        args=(ip, username, password, port, self.transport_var.get()))
         connect_thread.daemon = True
         connect_thread.start()
         
@@ -429,22 +524,33 @@ class MikroTikHotspotGenerator:
         self.connect_manual_button.config(state=tk.DISABLED)
         self.add_log(f"🔄 Conectando a {ip} como {username}...")
     
-    def _perform_manual_connection(self, ip, username, password, port):
-        """Realiza la conexión SSH manual"""
+    def _perform_manual_connection(self, ip, username, password, port, transport=TRANSPORT_SSH):
+        """Realiza la conexión manual (SSH o API de RouterOS)"""
         try:
+            if transport != TRANSPORT_SSH:
+                client = routeros_api.RouterOSApiClient(ip, port, use_ssl=(transport == TRANSPORT_API_SSL))
+                client.connect(username, password)
+                self.connection = client
+                
+                # Mismo formato que '/system identity print' para reutilizar el parser
+                result = f"name: {client.get_identity()}"
+                self.ui_channel.call(self._manual_connection_success, ip, result)
+                return
+            
             self.connection = paramiko.SSHClient()
             self.connection.set_missing_host_key_policy(paramiko.AutoAddPolicy())
             
             self.connection.connect(ip, port=port, username=username, password=password, timeout=10)
+            self.connection_params = (ip, port, username, password)
             
             # Probar conexión ejecutando comando simple
             stdin, stdout, stderr = self.connection.exec_command('/system identity print')
             result = stdout.read().decode()
             
-            self.root.after(0, lambda: self._manual_connection_success(ip, result))
+            self.ui_channel.call(self._manual_connection_success, ip, result)
             
         except Exception as e:
-            self.root.after(0, lambda: self._manual_connection_error(str(e)))
+            self.ui_channel.call(self._manual_connection_error, str(e))
     
     def _manual_connection_success(self, ip, identity_result=""):
         """Callback de conexión exitosa manual"""
@@ -518,6 +624,107 @@ class MikroTikHotspotGenerator:
                                          relief=tk.FLAT, bd=2,
                                          state=tk.DISABLED)
         self.disconnect_button.pack(pady=15)
+        
+        # Grupo de routers: el mismo lote se envía a todos en paralelo
+        group_frame = tk.Frame(inner_frame, bg='#ffffff')
+        group_frame.pack(fill=tk.X, pady=12)
+        
+        tk.Label(group_frame, text="Grupo de routers:", 
+                font=('Segoe UI', 11), bg='#ffffff').pack(side=tk.LEFT)
+        
+        tk.Button(group_frame, text="➕ Agregar router actual", 
+                 command=self.add_device_to_group,
+                 font=('Segoe UI', 11), bg='#3498db', fg='white',
+                 relief=tk.FLAT, bd=2).pack(side=tk.LEFT, padx=15)
+        
+        tk.Button(group_frame, text="👁️ Ver grupo", 
+                 command=self.show_device_group,
+                 font=('Segoe UI', 11), bg='#95a5a6', fg='white',
+                 relief=tk.FLAT, bd=2).pack(side=tk.LEFT, padx=2)
+        
+        tk.Button(group_frame, text="🗑️", 
+                 command=self.clear_device_group,
+                 font=('Segoe UI', 11), bg='#e74c3c', fg='white', width=3,
+                 relief=tk.FLAT, bd=2).pack(side=tk.LEFT, padx=2)
+        
+        tk.Checkbutton(group_frame, text="Enviar lotes a todo el grupo", 
+                      variable=self.use_group_var, command=self.update_group_status,
+                      font=('Segoe UI', 11), bg='#ffffff').pack(side=tk.LEFT, padx=15)
+        
+        self.group_status = tk.Label(group_frame, text="Grupo vacío", 
+                                    font=('Segoe UI', 10), bg='#ffffff', fg='#7f8c8d')
+        self.group_status.pack(side=tk.LEFT, padx=15)
+    
+    # FUNCIONES DEL GRUPO DE ROUTERS
+    
+    def add_device_to_group(self):
+        """Agrega el router del formulario de conexión al grupo"""
+        ip = self.device_ip_entry.get().strip()
+        username = self.device_user_entry.get().strip()
+        password = self.device_pass_entry.get()
+        transport = self.transport_var.get()
+        
+        if not ip or not username:
+            self.add_log("❌ Error: Introduce IP y usuario del router a agregar")
+            return
+        
+        try:
+            port = int(self.device_port_entry.get().strip())
+        except ValueError:
+            self.add_log("❌ Error: El puerto debe ser un número")
+            return
+        
+        device = provisioning.make_device(ip, username, password, port,
+                                          TRANSPORT_KEYS[transport], name=f"MikroTik-{ip}")
+        device = self.device_group.add(device)
+        self.update_group_status()
+        self.add_log(f"➕ Router agregado al grupo: {device['name']} - {ip}:{port} ({transport})")
+    
+    def show_device_group(self):
+        """Muestra en el log los routers del grupo"""
+        if not len(self.device_group):
+            self.add_log("ℹ️ Grupo vacío - Agrega routers desde el formulario de conexión")
+            return
+        
+        self.add_log(f"🌐 Grupo de routers ({len(self.device_group)}):")
+        for device in self.device_group:
+            self.add_log(f"   • {device['name']} - {device['host']}:{device['port']} ({device['transport']})")
+    
+    def clear_device_group(self):
+        """Vacía el grupo de routers"""
+        self.device_group.clear()
+        self.use_group_var.set(False)
+        self.update_group_status()
+        self.add_log("🗑️ Grupo de routers vaciado")
+    
+    def update_group_status(self):
+        """Actualiza el estado visual del grupo"""
+        count = len(self.device_group)
+        if not count:
+            self.group_status.config(text="Grupo vacío", fg='#7f8c8d')
+        elif self.use_group_var.get():
+            self.group_status.config(text=f"Activo: {count} routers", fg='#27ae60')
+        else:
+            self.group_status.config(text=f"{count} routers (inactivo)", fg='#7f8c8d')
+    
+    def _group_active(self):
+        """Indica si los lotes deben enviarse al grupo de routers"""
+        return self.use_group_var.get() and len(self.device_group) > 0
+    
+    def _batch_runner(self, upload_mode=UPLOAD_MODE_SINGLE, concurrency=mikrotik_ssh.DEFAULT_CONCURRENCY,
+                      use_group=False, log=None):
+        """Motor de lotes (ticket_batch) con la conexión, el grupo y el registro de la ventana"""
+        return ticket_batch.BatchRunner(
+            self.code_generator, self.ledger, connection=self.connection,
+            group=self.device_group if use_group else None, connect_params=self.connection_params,
+            upload_mode=UPLOAD_MODE_KEYS[upload_mode], concurrency=concurrency,
+            router_name=getattr(self, 'selected_device_name', '') or 'MikroTik',
+            log=log or self.add_log)
+    
+    def _provision_group(self, tickets, upload_mode, concurrency, log=None, cancel_event=None):
+        """Envía los tickets a todos los routers del grupo (llamar desde un hilo)"""
+        runner = self._batch_runner(upload_mode, concurrency, use_group=True, log=log)
+        return runner.provision_group(tickets, cancel_event=cancel_event)
     
     def create_tickets_panel(self, parent):
         """Panel de generación de tickets"""
@@ -605,6 +812,20 @@ class MikroTikHotspotGenerator:
         tk.Label(time_frame, text="(formato: DD:HH:MM:SS)", 
                 font=('Segoe UI', 8), bg='#ffffff', fg='#7f8c8d').pack(side=tk.LEFT, padx=15)
         
+        # Modo de subida al MikroTik
+        upload_frame = tk.Frame(config_frame, bg='#ffffff')
+        upload_frame.pack(fill=tk.X, padx=20, pady=12)
+        tk.Label(upload_frame, text="Subida:", font=('Segoe UI', 11), bg='#ffffff').pack(side=tk.LEFT)
+        self.upload_mode_combo = ttk.Combobox(upload_frame, textvariable=self.upload_mode_var,
+                                              values=[UPLOAD_MODE_SCRIPT, UPLOAD_MODE_PARALLEL, UPLOAD_MODE_SINGLE],
+                                              font=('Segoe UI', 11), width=14, state="readonly")
+        self.upload_mode_combo.pack(side=tk.LEFT, padx=15)
+        tk.Label(upload_frame, text="Canales:", font=('Segoe UI', 11), bg='#ffffff').pack(side=tk.LEFT)
+        self.concurrency_spinbox = tk.Spinbox(upload_frame, from_=1, to=64, 
+                                              textvariable=self.concurrency_var,
+                                              font=('Segoe UI', 11), width=4)
+        self.concurrency_spinbox.pack(side=tk.LEFT, padx=15)
+        
         # Sistema de cola
         queue_frame = tk.LabelFrame(config_frame, text="📥 Cola de Lotes", 
                                    font=('Segoe UI', 11), bg='#ffffff', fg='#2c3e50')
@@ -655,6 +876,13 @@ class MikroTikHotspotGenerator:
                                           height=2, state='disabled')
         self.generate_queue_btn.pack(fill=tk.X)
         
+        self.cancel_btn = tk.Button(generate_frame, text="⏹️ Cancelar",
+                                          command=self.cancel_active_job,
+                                          font=('Segoe UI', 11),
+                                          bg='#e74c3c', fg='white',
+                                          relief=tk.FLAT, bd=2, state='disabled')
+        self.cancel_btn.pack(fill=tk.X, pady=(5, 0))
+        
         # Barra de progreso
         self.progress = ttk.Progressbar(config_frame, length=200, mode='indeterminate')
         self.progress.pack(fill=tk.X, padx=20, pady=12)
@@ -685,9 +913,36 @@ class MikroTikHotspotGenerator:
         tk.Button(excel_buttons_frame, text='📄 Exportar PDF', command=self.generate_pdf_directly,
                  bg='#e74c3c', fg='white', font=('Segoe UI', 11, 'bold'), padx=15).pack(side=tk.LEFT, padx=15)
         
+        tk.Button(excel_buttons_frame, text='📒 Historial', command=self.show_ledger_history,
+                 bg='#95a5a6', fg='white', font=('Segoe UI', 11), padx=15).pack(side=tk.LEFT, padx=5)
+        
+        tk.Button(excel_buttons_frame, text='📋 Copiar usuarios', command=self.copy_selection,
+                 bg='#3498db', fg='white', font=('Segoe UI', 11), padx=15).pack(side=tk.LEFT, padx=5)
+        
+        self.count_label = tk.Label(excel_buttons_frame, text='Celdas: 0',
+                                    font=('Segoe UI', 10), bg='#ffffff', fg='#7f8c8d')
+        self.count_label.pack(side=tk.LEFT, padx=10)
+        
+        # Búsqueda por PIN y filtro de estado (sobre todos los tickets, no solo los visibles)
+        tk.Label(excel_buttons_frame, text='🔎 PIN:', font=('Segoe UI', 10),
+                 bg='#ffffff', fg='#2c3e50').pack(side=tk.LEFT, padx=(10, 2))
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(excel_buttons_frame, textvariable=self.search_var,
+                                     font=('Segoe UI', 10), width=14)
+        self.search_entry.pack(side=tk.LEFT, padx=2)
+        self.search_entry.bind('<Escape>', lambda e: self.search_var.set(''))
+        self.status_filter_var = tk.StringVar(value=ALL_STATUSES)
+        self.status_filter_combo = ttk.Combobox(excel_buttons_frame, textvariable=self.status_filter_var,
+                                                values=[ALL_STATUSES], font=('Segoe UI', 10),
+                                                width=18, state="readonly",
+                                                postcommand=self._refresh_status_filter_values)
+        self.status_filter_combo.pack(side=tk.LEFT, padx=5)
+        self.status_filter_combo.bind('<<ComboboxSelected>>', lambda e: self.apply_ticket_filter())
+        self.search_var.trace_add('write', lambda *args: self.apply_ticket_filter())
+        
 
         
-        # INTERFAZ SIMPLIFICADA - Sin tabla que causa congelamiento
+        # INTERFAZ SIMPLIFICADA - Tabla virtual + log
         simple_container = tk.Frame(tickets_table_frame, bg='#ffffff', relief=tk.FLAT, bd=2)
         simple_container.pack(fill=tk.BOTH, expand=True)
         
@@ -696,6 +951,15 @@ class MikroTikHotspotGenerator:
                                            font=('Segoe UI', 12, 'bold'), bg='#ffffff', fg='#27ae60')
         self.tickets_status_label.pack(pady=15)
         
+        # Tabla virtual: un Canvas que recicla las filas visibles
+        self.tickets_grid = virtual_grid.VirtualTicketGrid(simple_container, TICKET_GRID_COLUMNS,
+                                                           on_selection_change=self.update_count,
+                                                           on_sort=self.sort_tickets,
+                                                           scheduler=self.idle_scheduler,
+                                                           height=260)
+        self.tickets_grid.pack(fill=tk.BOTH, expand=True, padx=20)
+        self.tickets_grid.canvas.bind('<Control-c>', lambda e: self.copy_selection())
+        
         # 📝 ÁREA DE LOG PRINCIPAL - Ocupa toda el área
         log_frame = tk.Frame(simple_container, bg='#f8f9fa', relief=tk.FLAT, bd=1)
         log_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=15)
@@ -717,29 +981,52 @@ class MikroTikHotspotGenerator:
         
         # Mensaje inicial en log
         self.add_log("🚀 Sistema iniciado - Listo para generar tickets")
-        
-        # Variables simplificadas (mantener compatibilidad)
-        self.tickets_data = []
     
     def add_log(self, message):
-        """Agregar mensaje al log visual (reemplaza ventanitas OK)"""
+        """Agregar mensaje al log visual (reemplaza ventanitas OK)
+        
+        Seguro desde cualquier hilo: la línea entra al búfer circular del
+        registro (y al archivo) y el canal de la interfaz escribe juntas todas
+        las de un tick; no fuerza redibujados.
+        """
+        self.log.info(message)
+    
+    def _write_log_lines(self, lines):
+        """Escribe un bloque de líneas del canal en el log (hilo de la interfaz)
+        
+        El widget conserva como máximo las líneas del búfer circular: lo que
+        sobra se borra del principio en una sola operación.
+        """
         try:
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            full_message = f"[{timestamp}] {message}\n"
-            
-            self.log_text.insert(tk.END, full_message)
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            # 'end-1c' cae en la línea vacía que deja el último salto
+            excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - self.log_system.buffer.capacity
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
             self.log_text.see(tk.END)  # Auto-scroll al final
-            self.root.update()  # Actualizar UI inmediatamente
         except:
             # Fallback si hay error
-            print(f"LOG: {message}")
+            for line in lines:
+                print(f"LOG: {line}")
+    
+    def _start_progress(self):
+        """Barra en modo animado hasta que el trabajo informe avance"""
+        self.progress.config(mode='indeterminate', value=0)
+        self.progress.start()
+    
+    def _show_job_progress(self, done, total, message=''):
+        """Avance del trabajo en curso (llega agrupado: solo el último valor por tick)"""
+        if str(self.progress.cget('mode')) != 'determinate':
+            self.progress.stop()
+            self.progress.config(mode='determinate')
+        self.progress.config(maximum=max(1, total), value=done)
     
     def disconnect_from_device(self):
         """Desconecta del dispositivo"""
         if self.connection:
             self.connection.close()
             self.connection = None
+        self.connection_params = None
         
         # Actualizar interfaz
         self.connection_status.config(text="❌ Desconectado", fg='#e74c3c')
@@ -766,6 +1053,13 @@ class MikroTikHotspotGenerator:
             return
         
         try:
+            if self._using_api():
+                profiles = self.connection.get_hotspot_profiles() or ["default"]
+                self.profile_combo['values'] = profiles
+                self.profile_var.set(profiles[0])
+                self.add_log(f"✅ Se encontraron {len(profiles)} perfiles")
+                return
+            
             # Obtener perfiles de hotspot
             stdin, stdout, stderr = self.connection.exec_command('/ip hotspot user profile print')
             output = stdout.read().decode('utf-8', errors='ignore')
@@ -883,11 +1177,18 @@ class MikroTikHotspotGenerator:
             
             try:
                 # Crear perfil en MikroTik
-                command = f'/ip hotspot user profile add name="{name}" rate-limit="{rate_limit}" keepalive-timeout="{keepalive}"'
-                
-                stdin, stdout, stderr = self.connection.exec_command(command)
-                output = stdout.read().decode('utf-8', errors='ignore')
-                errors = stderr.read().decode('utf-8', errors='ignore')
+                if self._using_api():
+                    try:
+                        self.connection.add_hotspot_profile(name, rate_limit, keepalive)
+                        errors = ''
+                    except routeros_api.RouterOSApiError as e:
+                        errors = e.message
+                else:
+                    command = f'/ip hotspot user profile add name="{name}" rate-limit="{rate_limit}" keepalive-timeout="{keepalive}"'
+                    
+                    stdin, stdout, stderr = self.connection.exec_command(command)
+                    output = stdout.read().decode('utf-8', errors='ignore')
+                    errors = stderr.read().decode('utf-8', errors='ignore')
                 
                 if errors:
                     self.add_log(f"❌ Error creando perfil: {errors}")
@@ -1088,103 +1389,151 @@ class MikroTikHotspotGenerator:
             self.generate_queue_btn.config(state='disabled')
     
     def process_queue(self):
-        """Procesa todos los lotes de la cola de una vez"""
+        """Procesa todos los lotes de la cola en segundo plano (sin bloquear la ventana)"""
         if not self.tickets_queue:
             self.add_log("⚠️ Cola vacía - No hay lotes para procesar")
             return
         
+        if self.active_job and self.active_job.active:
+            self.add_log("⚠️ Ya hay una generación en curso")
+            return
+        
+        # Todo lo que depende de widgets se lee aquí, en el hilo de la interfaz
+        batches = list(self.tickets_queue)
+        use_group = self._group_active()
+        upload_mode = self.upload_mode_var.get()
+        concurrency = self._get_concurrency()
+        
+        self.add_log(f"🚀 Procesando cola: {len(batches)} lotes ({self.total_queued_tickets} tickets)")
+        self.generate_queue_btn.config(state='disabled')
+        self.cancel_btn.config(state='normal')
+        self._start_progress()
+        
+        self.active_job = self.job_engine.submit(
+            "Procesar cola",
+            lambda job: self._process_queue_job(job, batches, upload_mode, concurrency, use_group),
+            on_log=self.add_log,
+            on_progress=self._show_job_progress,
+            on_done=self._queue_job_done,
+            on_error=self._queue_job_error,
+            on_cancelled=self._queue_job_cancelled)
+    
+    def cancel_active_job(self):
+        """Pide la cancelación del trabajo en curso (lote actual o cola)"""
+        if self.active_job and self.active_job.active:
+            self.active_job.cancel()
+            self.cancel_btn.config(state='disabled')
+            self.add_log("⏹️ Cancelando... se detiene al terminar el paso en curso")
+    
+    def _process_queue_job(self, job, batches, upload_mode, concurrency, use_group):
+        """Trabajo de la cola: genera cada lote y sube el resultado (hilo de trabajo)"""
+        # 🔎 Pre-verificación: usuarios existentes en el router en una sola consulta
+        taken = self._load_existing_usernames(use_group, log=job.log)
+        
+        tickets = []
+        processed = 0
+        for i, batch in enumerate(batches):
+            # Al cancelar se conserva lo ya generado: sus códigos ya están en el registro
+            if job.cancelled:
+                break
+            processed = i + 1
+            try:
+                batch_tickets = self.generate_batch_tickets(batch, taken, use_group)
+            except Exception as e:
+                job.log(f"❌ Error procesando lote {i+1}: {str(e)}")
+                continue
+            tickets.extend(batch_tickets)
+            job.progress(i + 1, len(batches))
+            job.log(f"🎯 Lote {i+1}/{len(batches)}: {len(batch_tickets)} tickets de {batch['prefix']}")
+        
+        # Lo generado antes de cancelar no se sube: queda en la tabla como 'Generado'
+        upload = bool(tickets) and not job.cancelled
+        
+        # 🌐 ENVIAR AL GRUPO DE ROUTERS (cada router en su propio hilo)
+        if use_group and upload:
+            reports = self._provision_group(tickets, upload_mode, concurrency,
+                                            log=job.log, cancel_event=job.cancel_event)
+            ok_routers = sum(1 for report in reports.values() if report['state'] == 'ok')
+            job.log(f"🌐 Grupo completado: {ok_routers}/{len(reports)} routers sin errores")
+        
+        # 🎯 SUBIR TICKETS AL MIKROTIK SI HAY CONEXIÓN
+        elif self.connection and upload:
+            device_name = getattr(self, 'selected_device_name', 'Desconocido')
+            job.log(f"🚀 Subiendo {len(tickets)} tickets a {device_name}...")
+            try:
+                counts = self._upload_tickets_to_router(
+                    tickets, upload_mode, concurrency=concurrency, cancel_event=job.cancel_event,
+                    on_progress=lambda done, total: job.progress(done, total, "tickets subidos"))
+                success_count = counts['ok'] + counts['dup']
+                if success_count > 0:
+                    job.log(f"✅ Subida completada: {success_count}/{len(tickets)} tickets al MikroTik")
+                    job.log(self._format_upload_summary(counts))
+                else:
+                    job.log("❌ Error de subida: No se pudo subir ningún ticket al MikroTik")
+            except Exception as e:
+                job.log(f"❌ Error subiendo tickets al MikroTik: {str(e)}")
+        
+        # Se empaqueta aquí, en el hilo de trabajo, para no frenar la interfaz
+        return {'tickets': ticket_store.TicketStore(tickets), 'batches': processed,
+                'processed': batches[:processed]}
+    
+    def _finish_queue_job(self):
+        """Restablece los controles al terminar el trabajo de la cola"""
+        self.progress.stop()
+        self.cancel_btn.config(state='disabled')
+        self.update_queue_status()
+    
+    def _load_queue_result(self, result):
+        """Pasa los tickets del trabajo a la tabla y quita de la cola los lotes procesados"""
+        self.tickets_data = result['tickets']
+        
+        # Actualizar tabla siempre: la vista y la tabla deben apuntar al almacén nuevo
         try:
-            # Confirmar procesamiento
-            # Procesar cola directamente sin preguntar
-            self.add_log(f"🚀 Procesando cola: {len(self.tickets_queue)} lotes ({self.total_queued_tickets} tickets)")
-            
-            # Limpiar tickets actuales
-            self.tickets_data.clear()
-            
-            # Procesar cada lote
-            total_processed = 0
-            processed_batches = len(self.tickets_queue)  # Guardar antes de limpiar
-            self.progress.start()
-            
-            for i, batch in enumerate(self.tickets_queue):
-                print(f"🎯 Procesando lote {i+1}/{len(self.tickets_queue)}: {batch['quantity']} tickets de {batch['prefix']}")
-                
-                try:
-                    # Generar tickets para este lote
-                    batch_tickets = self.generate_batch_tickets(batch)
-                    self.tickets_data.extend(batch_tickets)
-                    total_processed += len(batch_tickets)
-                    
-                    # Actualizar progreso
-                    self.root.update()
-                    
-                except Exception as e:
-                    print(f"❌ Error procesando lote {i+1}: {e}")
-                    continue
-            
-            self.progress.stop()
-            
-            # 🎯 SUBIR TICKETS AL MIKROTIK SI HAY CONEXIÓN
-            if self.connection and self.tickets_data:
-                device_name = self.selected_device_name if hasattr(self, 'selected_device_name') else 'Desconocido'
-                # Subir directamente sin preguntar
-                self.add_log(f"🚀 Subiendo {total_processed} tickets a {device_name}...")
-                upload_result = True
-                
-                if upload_result:
-                    try:
-                        print(f"🚀 Subiendo {total_processed} tickets al MikroTik...")
-                        self.progress.start()
-                        
-                        success_count = 0
-                        for ticket in self.tickets_data:
-                            try:
-                                self.upload_single_ticket_to_mikrotik(ticket)
-                                success_count += 1
-                            except Exception as e:
-                                print(f"❌ Error subiendo ticket {ticket.get('username', '?')}: {e}")
-                        
-                        self.progress.stop()
-                        
-                        if success_count > 0:
-                            self.add_log(f"✅ Subida completada: {success_count}/{total_processed} tickets al MikroTik")
-                        else:
-                            self.add_log("❌ Error de subida: No se pudo subir ningún ticket al MikroTik")
-                            
-                    except Exception as e:
-                        self.progress.stop()
-                        self.add_log(f"❌ Error subiendo tickets al MikroTik: {str(e)}")
-            
-            # Actualizar tabla si hay datos
-            if self.tickets_data:
-                try:
-                    self.create_excel_table()
-                except Exception as e:
-                    print(f"⚠️ Error actualizando tabla: {e}")
-                    # Crear tabla básica si falla la completa
-                    pass
-            
-            # Limpiar cola
-            self.tickets_queue.clear()
-            self.total_queued_tickets = 0
-            self.update_queue_status()
-            
-            # Mensaje de éxito
-            self.add_log(f"✅ Cola procesada exitosamente: {total_processed} tickets generados, {processed_batches} lotes procesados")
-            
+            self.create_excel_table()
         except Exception as e:
-            self.progress.stop()
-            self.add_log(f"❌ Error procesando la cola: {str(e)}")
-            import traceback
-            print(f"🔥 ERROR procesando cola: {traceback.format_exc()}")
-    
-    def generate_batch_tickets(self, batch):
-        """Genera tickets para un lote específico"""
+            self.log.warning(f"⚠️ Error actualizando tabla: {e}")
+        
+        # Los lotes agregados mientras corría el trabajo siguen en la cola
+        processed = result['processed']
+        self.tickets_queue[:] = [batch for batch in self.tickets_queue
+                                 if not any(batch is done for done in processed)]
+        self.total_queued_tickets = sum(batch['quantity'] for batch in self.tickets_queue)
+    
+    def _queue_job_done(self, result):
+        """Fin del trabajo de la cola (hilo de la interfaz)"""
+        self._load_queue_result(result)
+        self._finish_queue_job()
+        
+        self.add_log(f"✅ Cola procesada exitosamente: {len(self.tickets_data)} tickets generados, "
+                     f"{result['batches']} lotes procesados")
+    
+    def _queue_job_cancelled(self, result=None):
+        """Cancelación de la cola: lo ya generado pasa a la tabla y sale de la cola"""
+        if result is None or not result['processed']:
+            self._finish_queue_job()
+            self.add_log("⏹️ Procesamiento de cola cancelado - La cola se conserva")
+            return
+        self._load_queue_result(result)
+        self._finish_queue_job()
+        self.add_log(f"⏹️ Procesamiento de cola cancelado: {len(self.tickets_data)} tickets de "
+                     f"{result['batches']} lotes quedaron en la tabla y el historial; "
+                     f"{len(self.tickets_queue)} lotes siguen en la cola")
+    
+    def _queue_job_error(self, error):
+        self._finish_queue_job()
+        self.add_log(f"❌ Error procesando la cola: {str(error)}")
+    
+    def generate_batch_tickets(self, batch, taken=None, use_group=False):
+        """Genera tickets para un lote específico
+        
+        taken: set de nombres ya ocupados (router y lotes previos); esos
+        códigos se saltan al recorrer la permutación del prefijo.
+        """
         tickets = []
+        usernames, skipped = self.code_generator.take(batch['prefix'], batch['quantity'], taken)
         
-        for i in range(batch['quantity']):
+        for username in usernames:
             # Solo usuario (simplificado)
-            username = f"{batch['prefix']}{random.randint(100000, 999999)}"
             password = ""
             
             ticket = {
@@ -1193,13 +1542,76 @@ class MikroTikHotspotGenerator:
                 'profile': batch['profile'],
                 'uptime_limit': batch['time_limit'],
                 'time_limit': batch['time_limit'],  # Para compatibilidad
-                'batch_info': f"{batch['prefix']} ({batch['timestamp']})"
             }
             
             tickets.append(ticket)
         
+        self._record_in_ledger(tickets, batch['prefix'], use_group)
         return tickets
     
+    def _ledger_router_name(self, use_group):
+        """Destino de los tickets tal como se guarda en el registro"""
+        return self._batch_runner(use_group=use_group).ledger_router_name
+    
+    def _record_in_ledger(self, tickets, prefix, use_group=False, batch_id=None):
+        """Guarda un lote en el registro SQLite y marca cada ticket con su lote"""
+        return self._batch_runner(use_group=use_group).record(tickets, prefix, batch_id)
+    
+    def _update_ledger(self, tickets):
+        """Copia al registro el estado final de los tickets tras una subida"""
+        self._batch_runner().update_ledger(tickets)
+    
+    def show_ledger_history(self):
+        """Muestra en el log los últimos lotes guardados y su estado
+        
+        Con un router (o el grupo) conectado, antes se marcan como usados los
+        tickets que ya tienen tiempo o tráfico en el router, en un trabajo
+        de fondo.
+        """
+        use_group = self._group_active()
+        if not (use_group or self.connection):
+            self._show_ledger_batches()
+            return
+        
+        def sync(job):
+            used = self._batch_runner(use_group=use_group, log=job.log).sync_used()
+            job.log(f"🔄 Registro sincronizado con el router: {used} tickets pasaron a usados")
+        
+        def failed(error):
+            self.add_log(f"⚠️ No se pudo leer el uso de los tickets: {str(error)}")
+            self._show_ledger_batches()
+        
+        self.job_engine.submit("Sincronizar registro", sync, on_log=self.add_log,
+                               on_done=lambda result: self._show_ledger_batches(),
+                               on_error=failed,
+                               on_cancelled=lambda result: self._show_ledger_batches())
+    
+    def _show_ledger_batches(self):
+        """Escribe en el log los últimos lotes del registro y cuántos hay en cada estado"""
+        try:
+            batches = self.ledger.batches(limit=10)
+        except Exception as e:
+            self.add_log(f"❌ Error leyendo el registro: {str(e)}")
+            return
+        
+        if not batches:
+            self.add_log("ℹ️ Registro vacío - Aún no se han generado tickets")
+            return
+        
+        self.add_log(f"📒 Últimos {len(batches)} lotes registrados:")
+        for batch in batches:
+            counts = self.ledger.status_counts(batch['batch'])
+            detail = ", ".join(f"{status}: {total}" for status, total in counts.items())
+            self.add_log(f"   • {batch['batch']} ({batch['created_at']}) - {batch['total']} tickets "
+                         f"en {batch['router']} [{detail}]")
+    
+    def _load_existing_usernames(self, use_group=False, log=None):
+        """Carga en memoria los usuarios que ya existen en el router (o en el grupo)
+        
+        Una sola consulta 'print terse' por router; se puede llamar desde un hilo.
+        """
+        return self._batch_runner(use_group=use_group, log=log).load_existing_usernames()
+    
     def upload_single_ticket_to_mikrotik(self, ticket):
         """Sube un ticket individual al MikroTik"""
         if not self.connection:
@@ -1214,11 +1626,43 @@ class MikroTikHotspotGenerator:
             raise Exception("Username vacío")
         
         # Usar la función existente
-        self._create_hotspot_user(username, password, profile, uptime_limit)
+        return self._create_hotspot_user(username, password, profile, uptime_limit)
+    
+    def _ticket_upload_tuple(self, ticket):
+        """Prepara (usuario, contraseña, perfil, limit-uptime) de un ticket para subirlo"""
+        return ticket_batch.ticket_upload_tuple(ticket)
+    
+    def _get_concurrency(self):
+        """Canales simultáneos configurados para la subida paralela"""
+        try:
+            return max(1, int(self.concurrency_var.get()))
+        except ValueError:
+            return mikrotik_ssh.DEFAULT_CONCURRENCY
+    
+    def _upload_tickets_to_router(self, tickets, upload_mode, on_progress=None,
+                                  concurrency=mikrotik_ssh.DEFAULT_CONCURRENCY, cancel_event=None):
+        """Sube una lista de tickets con el modo indicado y actualiza su estado
+        
+        No toca widgets: se puede llamar desde el hilo de generación.
+        Devuelve un resumen {'ok': n, 'dup': n, 'error': n}.
+        """
+        runner = self._batch_runner(upload_mode, concurrency)
+        return runner.upload(tickets, on_progress=on_progress, cancel_event=cancel_event)
+    
+    def _apply_upload_results(self, tickets, results):
+        """Aplica los resultados por usuario al estado de cada ticket"""
+        return ticket_batch.apply_upload_results(tickets, results)
+    
+    def _format_upload_summary(self, counts):
+        """Texto de resumen de una subida para el log"""
+        return ticket_batch.format_upload_summary(counts)
     
     def generate_tickets(self):
         """Genera los tickets de hotspot"""
-        if not self.connection:
+        use_group = self._group_active()
+        if use_group:
+            self.add_log(f"🌐 Generando tickets para el grupo de {len(self.device_group)} routers...")
+        elif not self.connection:
             # Generar tickets localmente si no hay conexión
             # Auto-generar localmente sin confirmación (UX mejorada)
             self.add_log("⚠️ Sin conexión MikroTik - Generando tickets SOLO localmente")
@@ -1244,11 +1688,14 @@ class MikroTikHotspotGenerator:
             self.add_log("❌ Error: Introduce el tiempo de duración")
             return
         
+        if self.active_job and self.active_job.active:
+            self.add_log("⚠️ Ya hay una generación en curso")
+            return
+        
         # 🚀 AUTO-OPTIMIZACIÓN PARA GRANDES VOLÚMENES (UX mejorada)
         if quantity > 1000:
             self.add_log(f"🚀 Volumen grande detectado: {quantity} tickets")
-            self.add_log("🚀 OPTIMIZACIONES ACTIVADAS: Lotes de 50, vista paginada, progreso optimizado")
-            self.add_log(f"⏱️ Tiempo estimado: {quantity * 0.1:.1f} segundos")
+            self.add_log(f"🚀 Pipeline por bloques de {PIPELINE_CHUNK_SIZE}: generar → subir → mostrar")
             self.add_log(f"🚀 MODO OPTIMIZADO ACTIVADO para {quantity} tickets")
         elif quantity > 500:
             self.add_log(f"⚡ Generación optimizada para {quantity} tickets")
@@ -1256,167 +1703,97 @@ class MikroTikHotspotGenerator:
             self.add_log(f"📊 Generación normal para {quantity} tickets")
         
         # Mostrar progreso
-        self.progress.start()
+        self._start_progress()
         self.generate_single_btn.config(state=tk.DISABLED)
+        self.cancel_btn.config(state='normal')
         
-        # Generar en thread separado
-        gen_thread = threading.Thread(target=self._generate_tickets_thread, 
-                                    args=(ticket_type, prefix, quantity, profile, uptime_limit))
-        gen_thread.daemon = True
-        gen_thread.start()
-    
-    def _generate_tickets_thread(self, ticket_type, prefix, quantity, profile, uptime_limit):
-        """Genera tickets en segundo plano - CON LOG VISUAL"""
-        try:
-            # LOG inicial
-            self.root.after(0, lambda: self.add_log(f"🚀 Iniciando generación de {quantity} tickets"))
-            
-            tickets = []
-            batch_size = 50  # Procesar en lotes de 50 para mantener UI responsiva
-            
-            self.root.after(0, lambda: self.add_log(f"� Procesando en lotes de {batch_size} tickets"))
-            
-            for batch_start in range(0, quantity, batch_size):
-                batch_end = min(batch_start + batch_size, quantity)
-                batch_tickets = []
-                
-                # Generar lote actual
-                for i in range(batch_start, batch_end):
-                    # Generar usuario
-                    numbers = ''.join(random.choices(string.digits, k=6))
-                    username = f"{prefix}{numbers}"
-                    
-                    # Solo usuarios - sin contraseña
-                    password = ""
-                    
-                    ticket = {
-                        'number': i + 1,
-                        'username': username,
-                        'password': password,
-                        'profile': profile,
-                        'uptime_limit': uptime_limit,
-                        'time_limit': uptime_limit,  # Para compatibilidad con vista previa
-                        'status': 'Generado'
-                    }
-                    
-                    # Intentar crear en MikroTik si hay conexión
-                    if self.connection:
-                        try:
-                            self._create_hotspot_user(username, password, profile, uptime_limit)
-                            ticket['status'] = 'Creado en MikroTik'
-                            if (i + 1) % 100 == 0:  # Log cada 100 tickets
-                                self.root.after(0, lambda p=i+1, q=quantity: self.add_log(f"✅ Progreso: {p}/{q} tickets creados"))
-                        except Exception as e:
-                            print(f"❌ Error creando usuario {username}: {e}")
-                            ticket['status'] = f'Error: {str(e)[:50]}'
-                    else:
-                        ticket['status'] = 'Solo local (sin conexión)'
-                    
-                    batch_tickets.append(ticket)
-                
-                # Agregar lote a la lista principal
-                tickets.extend(batch_tickets)
-                
-                # 🚀 OPTIMIZACIÓN CRÍTICA: Actualizar UI periódicamente sin sobrecargar
-                progress_percent = ((batch_end) / quantity) * 100
-                self.root.after(0, lambda p=progress_percent, be=batch_end, q=quantity: self.add_log(f"📊 Progreso: {be}/{q} tickets ({p:.1f}%)"))
-                
-                # Permitir que la UI se actualice sin bloquear
-                self.root.after(0, lambda: None)
-                
-                # Pequeña pausa para evitar saturación
-                if quantity > 1000:
-                    import time
-                    time.sleep(0.01)  # 10ms pausa solo para volúmenes muy grandes
-            
-            self.root.after(0, lambda: self.add_log(f"✅ GENERACIÓN COMPLETADA: {len(tickets)} tickets creados"))
-            self.tickets_data = tickets
-            self.root.after(0, self._generation_completed)
-            
-        except Exception as e:
-            print(f"❌ Error generando tickets: {e}")
-            self.root.after(0, self._generation_error)
+        # La tabla se va llenando a medida que cada bloque termina
+        self.tickets_data = ticket_store.TicketStore()
+        self.create_excel_table()
+        
+        # Generar en un trabajo de fondo
+        upload_mode = self.upload_mode_var.get()
+        concurrency = self._get_concurrency()
+        self.active_job = self.job_engine.submit(
+            "Generar lote",
+            lambda job: self._generate_tickets_job(job, ticket_type, prefix, quantity, profile, uptime_limit,
+                                                   upload_mode, concurrency, use_group),
+            on_log=self.add_log,
+            on_progress=self._show_job_progress,
+            on_done=self._generation_completed,
+            on_error=self._generation_error,
+            on_cancelled=self._generation_cancelled)
+    
+    def _generate_tickets_job(self, job, ticket_type, prefix, quantity, profile, uptime_limit,
+                              upload_mode=UPLOAD_MODE_SINGLE, concurrency=mikrotik_ssh.DEFAULT_CONCURRENCY,
+                              use_group=False):
+        """Genera y sube tickets en pipeline: generar → subir → registro/tabla
+        
+        El pipeline vive en ticket_batch.BatchRunner (el mismo de la línea de
+        comandos); aquí cada bloque terminado se pasa a la tabla.
+        """
+        job.log(f"🚀 Iniciando generación de {quantity} tickets")
+        
+        runner = self._batch_runner(upload_mode, concurrency, use_group, log=job.log)
+        stats = runner.generate(prefix, quantity, profile, uptime_limit,
+                                on_chunk=lambda chunk: job.call_ui(lambda: self._append_tickets(chunk)),
+                                on_progress=job.progress, cancel_event=job.cancel_event)
+        job.check_cancelled()
+        
+        job.log(f"✅ GENERACIÓN COMPLETADA: {stats['done']} tickets creados")
+        return stats
+    
+    def _append_tickets(self, tickets):
+        """Agrega un bloque terminado a la tabla (hilo de la interfaz)"""
+        self.tickets_data.extend(tickets)
+        self.tickets_grid.set_row_count(len(self.ticket_view))
+        self.tickets_status_label.config(text=f"🎫 Tickets generados: {len(self.tickets_data)}", fg='#27ae60')
     
     def _create_hotspot_user(self, username, password, profile, uptime_limit):
-        """Crea usuario en MikroTik via SSH"""
+        """Crea usuario en MikroTik via SSH (devuelve 'ok' o 'dup')"""
         try:
             if not self.connection:
                 raise Exception("No hay conexión SSH al MikroTik")
             
-            # Construir comando base
-            if password and password.strip():
-                command = f'/ip hotspot user add name="{username}" password="{password}" profile="{profile}"'
-            else:
-                command = f'/ip hotspot user add name="{username}" profile="{profile}"'
-            
             # Agregar límite de tiempo si se especifica
+            mikrotik_time = ''
             if uptime_limit and uptime_limit.strip():
                 # Convertir formato DD:HH:MM:SS a formato MikroTik
                 try:
                     mikrotik_time = self._convert_time_format(uptime_limit)
-                    if mikrotik_time and mikrotik_time.strip():
-                        command += f' limit-uptime="{mikrotik_time}"'
                 except Exception as e:
-                    print(f"⚠️ Error convirtiendo tiempo '{uptime_limit}': {e}")
+                    self.log.warning("⚠️ Error convirtiendo tiempo '%s': %s", uptime_limit, e)
                     # Continuar sin límite de tiempo
             
-            print(f"🔧 Ejecutando: {command}")
-            
             # Ejecutar comando
-            stdin, stdout, stderr = self.connection.exec_command(command)
-            result = stdout.read().decode().strip()
-            errors = stderr.read().decode().strip()
+            if self._using_api():
+                result = self.connection.add_hotspot_user(username, password, profile, mikrotik_time)
+            else:
+                # Se llama por cada usuario: el comando solo se arma si la depuración está activa
+                if self.log.isEnabledFor(app_log.DEBUG):
+                    self.log.debug("🔧 Ejecutando: %s", mikrotik_ssh.build_user_add_command(
+                        username, password, profile, mikrotik_time))
+                result = mikrotik_ssh.create_hotspot_user(self.connection, username, password, profile, mikrotik_time)
             
-            # Verificar errores
-            if errors:
-                if "already have user" in errors.lower() or "item already exists" in errors.lower():
-                    print(f"⚠️ Usuario {username} ya existe")
-                    # No es error crítico, continuar
-                    return  # Salir exitosamente
-                else:
-                    raise Exception(f"Error MikroTik: {errors}")
+            if result == mikrotik_ssh.RESULT_DUP:
+                # No es error crítico, continuar
+                self.log.debug("⚠️ Usuario %s ya existe", username)
             
-            if result:
-                print(f"✅ Usuario {username} creado: {result}")
+            return result
             
         except Exception as e:
-            print(f"❌ Error creando usuario {username}: {e}")
+            self.log.error("❌ Error creando usuario %s: %s", username, e)
             raise  # Re-lanzar para que el código padre lo maneje
     
     def _convert_time_format(self, time_str):
         """Convierte formato DD:HH:MM:SS a formato MikroTik"""
-        try:
-            # Formato de entrada: DD:HH:MM:SS o HH:MM:SS
-            parts = time_str.split(':')
-            
-            if len(parts) == 4:  # DD:HH:MM:SS
-                days, hours, minutes, seconds = map(int, parts)
-                
-                # Convertir a formato MikroTik
-                if days > 0:
-                    return f"{days}d{hours:02d}:{minutes:02d}:{seconds:02d}"
-                else:
-                    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-                    
-            elif len(parts) == 3:  # HH:MM:SS
-                hours, minutes, seconds = map(int, parts)
-                return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
-            
-            elif len(parts) == 2:  # MM:SS
-                minutes, seconds = map(int, parts)
-                return f"00:{minutes:02d}:{seconds:02d}"
-            
-            else:
-                return time_str  # Usar como está si no coincide con formato esperado
-                
-        except Exception as e:
-            print(f"Error convirtiendo tiempo {time_str}: {e}")
-            return time_str
+        return ticket_batch.convert_time_format(time_str)
     
-    def _generation_completed(self):
+    def _generation_completed(self, result=None):
         """Callback cuando termina la generación - CON LOG VISUAL"""
         self.progress.stop()
         self.generate_single_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state='disabled')
         
         count = len(self.tickets_data)
         
@@ -1424,266 +1801,74 @@ class MikroTikHotspotGenerator:
         try:
             self.tickets_status_label.config(text=f"✅ {count} tickets generados correctamente", fg='#27ae60')
         except AttributeError:
-            print(f"✅ {count} tickets generados correctamente")
+            self.log.debug(f"✅ {count} tickets generados correctamente")
         
         # Actualizar contador en interfaz simplificada
         if hasattr(self, 'tickets_status_label'):
             self.tickets_status_label.config(text=f"🎫 Tickets generados: {count}")
         
+        # Tabla virtual: ya se llenó bloque a bloque, solo se repinta
+        self.tickets_grid.refresh()
+        
         # LOG en lugar de ventanita molesta
         self.add_log(f"🎉 GENERACIÓN COMPLETADA: {count} tickets creados")
         self.add_log("📄 Usa 'Exportar PDF' para exportar directamente")
-        self.add_log("🚀 Sin tabla = Sin congelamiento")
     
-    def _generation_error(self):
+    def _generation_error(self, error=None):
         """Callback de error en generación - CON LOG"""
         self.progress.stop()
         self.generate_single_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state='disabled')
         
         # LOG en lugar de ventanita
+        if error is not None:
+            self.log.error(f"❌ Error generando tickets: {error}", exc_info=error)
         self.add_log("❌ ERROR: Fallo en generación de tickets")
         self.add_log("🔧 Revisa conexión SSH y parámetros")
     
-    def _populate_tickets_table(self):
-        """Llena la tabla de tickets usando paginación optimizada para grandes volúmenes"""
-        total_tickets = len(self.tickets_data)
-        
-        # 🚀 OPTIMIZACIÓN: Si hay muchos tickets, usar paginación
-        if total_tickets > self.tickets_per_page:
-            print(f"🚀 OPTIMIZACIÓN: {total_tickets} tickets detectados - Usando paginación")
-            self.total_pages = (total_tickets + self.tickets_per_page - 1) // self.tickets_per_page
-            self._populate_tickets_paginated()
-        else:
-            print(f"📊 Cargando {total_tickets} tickets normalmente")
-            self._populate_tickets_normal()
-    
-    def _populate_tickets_normal(self):
-        """Carga normal para pocos tickets (≤100)"""
-        excel_data = []
-        for ticket in self.tickets_data:
-            excel_row = [
-                ticket['number'],
-                ticket['username'],
-                ticket['password'], 
-                ticket['profile'],
-                ticket.get('uptime_limit', '01:00:00')
-            ]
-            excel_data.append(excel_row)
-        
-        self.excel_table_data = excel_data
-        self.create_excel_table()
-        self.update_selection_count()
-    
-    def _populate_tickets_paginated(self):
-        """Carga paginada ULTRA OPTIMIZADA - Sin bloqueo de UI"""
-        # Calcular índices de página actual
-        start_idx = self.current_page * self.tickets_per_page
-        end_idx = min(start_idx + self.tickets_per_page, len(self.tickets_data))
-        
-        # Preparar datos de forma más eficiente
-        self.excel_table_data = []
-        
-        # Crear datos en pequeños lotes para evitar bloqueo
-        batch_size = 10  # Procesar 10 tickets a la vez
-        current_batch = 0
-        
-        def process_batch():
-            nonlocal current_batch
-            batch_start = start_idx + (current_batch * batch_size)
-            batch_end = min(batch_start + batch_size, end_idx)
-            
-            # Procesar lote actual
-            for i in range(batch_start, batch_end):
-                if i < len(self.tickets_data):
-                    ticket = self.tickets_data[i]
-                    excel_row = [
-                        ticket['number'],
-                        ticket['username'],
-                        ticket['password'], 
-                        ticket['profile'],
-                        ticket.get('uptime_limit', '01:00:00')
-                    ]
-                    self.excel_table_data.append(excel_row)
-            
-            current_batch += 1
-            
-            # Si hay más lotes, procesar el siguiente de forma asíncrona
-            if batch_end < end_idx:
-                self.root.after(10, process_batch)  # 10ms delay entre lotes
-            else:
-                # Cuando termine, crear la tabla
-                self.root.after(5, self._finish_pagination_load)
-        
-        # Iniciar procesamiento asíncrono
-        process_batch()
-    
-    def _finish_pagination_load(self):
-        """Termina la carga paginada creando la tabla"""
-        self.create_excel_table_with_pagination()
-        self.update_selection_count_paginated()
-        
-        # Actualizar status
-        total_showing = len(self.excel_table_data)
-        total_all = len(self.tickets_data)
-        try:
-            self.tickets_status_label.config(
-                text=f"✅ Mostrando {total_showing} de {total_all} tickets (Página {self.current_page + 1})", 
-                fg='#27ae60'
-            )
-        except AttributeError:
-            print(f"✅ Mostrando {total_showing} de {total_all} tickets (Página {self.current_page + 1})")
+    def _generation_cancelled(self, result=None):
+        """Callback de cancelación de la generación (la tabla ya tiene los bloques terminados)"""
+        self.progress.stop()
+        self.generate_single_btn.config(state=tk.NORMAL)
+        self.cancel_btn.config(state='disabled')
+        self.add_log(f"⏹️ Generación cancelada: {len(self.tickets_data)} tickets quedaron en la tabla y el historial")
     
     def sort_tickets(self, column):
-        """Ordena la tabla por columna"""
-        # Implementar ordenamiento si es necesario
-        pass
+        """Ordena la tabla por columna (índice o campo); repetir invierte el orden
+        
+        Usuario, perfil, tiempo, estado y lote; 'No.' vuelve al orden de
+        generación. Solo cambia la permutación de la vista: la tabla
+        repinta las filas visibles y los tickets no se mueven.
+        """
+        field = TICKET_GRID_FIELDS[column] if isinstance(column, int) else column
+        view = self.ticket_view
+        if field == 'number':
+            view.sort(None)
+        else:
+            field = ticket_views.sort_field(field)
+            if field is None:
+                return
+            view.sort(field, descending=(field == view.sort_field and not view.descending))
+        
+        sorted_col = None
+        if view.sort_field:
+            grid_fields = [ticket_views.sort_field(name) for name in TICKET_GRID_FIELDS]
+            if view.sort_field in grid_fields:
+                sorted_col = grid_fields.index(view.sort_field)
+        self.tickets_grid.set_sort_indicator(sorted_col, view.descending)
+        # La selección es por fila de la tabla: tras reordenar apuntaría a otros tickets
+        self.tickets_grid.clear_selection()
+        self.tickets_grid.refresh()
     
     # 🚀 FUNCIONES DE PAGINACIÓN PARA OPTIMIZACIÓN
-    def create_excel_table_with_pagination(self):
-        """Crea tabla Excel con controles de paginación para grandes volúmenes"""
-        # Mostrar controles de paginación
-        self.pagination_frame.pack(fill=tk.X, padx=15, pady=2)
-        
-        # Crear tabla normal (pero solo con datos de la página actual)
-        self.create_excel_table()
-        
-        # Actualizar controles de paginación
-        self.update_pagination_controls()
-    
-    def update_pagination_controls(self):
-        """Actualiza los controles de paginación"""
-        total_tickets = len(self.tickets_data)
-        
-        # Actualizar información de página
-        start_ticket = (self.current_page * self.tickets_per_page) + 1
-        end_ticket = min((self.current_page + 1) * self.tickets_per_page, total_tickets)
-        
-        self.page_info_label.config(
-            text=f"Página {self.current_page + 1}/{self.total_pages} | "
-                 f"Tickets {start_ticket}-{end_ticket} de {total_tickets}"
-        )
-        
-        # Info de optimización
-        self.optimization_info.config(
-            text=f"🚀 Modo optimizado: {self.tickets_per_page} tickets por página"
-        )
-        
-        # Habilitar/deshabilitar botones
-        self.prev_page_btn.config(state=tk.NORMAL if self.current_page > 0 else tk.DISABLED)
-        self.next_page_btn.config(state=tk.NORMAL if self.current_page < self.total_pages - 1 else tk.DISABLED)
-    
-    def prev_page(self):
-        """Ir a página anterior - OPTIMIZADO"""
-        if self.current_page > 0:
-            # Mostrar indicador de carga
-            self.tickets_status_label.config(text="🔄 Cargando página anterior...", fg='#3498db')
-            self.current_page -= 1
-            
-            # Cargar página de forma asíncrona
-            self.root.after(10, self._populate_tickets_paginated)
-    
-    def next_page(self):
-        """Ir a página siguiente - OPTIMIZADO"""
-        if self.current_page < self.total_pages - 1:
-            # Mostrar indicador de carga
-            self.tickets_status_label.config(text="🔄 Cargando página siguiente...", fg='#3498db')
-            self.current_page += 1
-            
-            # Cargar página de forma asíncrona
-            self.root.after(10, self._populate_tickets_paginated)
-    
-    def update_selection_count_paginated(self):
-        """Actualiza contador con información de paginación"""
-        total_tickets = len(self.tickets_data)
-        showing_tickets = len(self.excel_table_data)
-        
-        self.selection_count_label.config(
-            text=f"Mostrando: {showing_tickets} | Total: {total_tickets} tickets"
-        )
-    
-    def _load_first_page_ultra_async(self):
-        """Carga la primera página de forma ultra asíncrona para grandes volúmenes"""
-        self.tickets_status_label.config(text="🔄 Cargando primera página...", fg='#3498db')
-        
-        # Cargar primera página sin bloquear
-        self.root.after(50, self._populate_tickets_paginated)
-    
-    def select_column(self, column):
-        """Selecciona toda una columna y copia al portapapeles"""
-        if not self.tickets_data:
-            messagebox.showwarning("Advertencia", "No hay datos para seleccionar")
-            return
-        
-        # Mapear columnas a campos de datos
-        column_mapping = {
-            'No.': 'number',
-            'Usuario': 'username', 
-            'Contraseña': 'password',
-            'Perfil': 'profile',
-            'Tiempo': 'uptime_limit',
-            'Estado': 'status'
-        }
-        
-        if column not in column_mapping:
-            return
-        
-        field = column_mapping[column]
-        
-        # Extraer datos de la columna
-        column_data = []
-        for ticket in self.tickets_data:
-            if isinstance(ticket, dict):
-                if field == 'uptime_limit':
-                    value = ticket.get(field, 'N/A')
-                else:
-                    value = ticket.get(field, '')
-            else:
-                # Si es lista/tupla, usar índices seguros
-                value = 'N/A'
-            column_data.append(str(value))
-        
-        # Copiar al portapapeles
-        text = '\n'.join(column_data)
-        self.root.clipboard_clear()
-        self.root.clipboard_append(text)
-        
-        # Mostrar información
-        messagebox.showinfo("Columna Copiada", 
-                          f"✅ Columna '{column}' copiada al portapapeles\n\n"
-                          f"📊 {len(column_data)} elementos copiados\n"
-                          f"📋 Formato: uno por línea\n\n"
-                          f"💡 Puedes pegarlos en Excel, Word o cualquier editor")
-    
-    def on_ticket_click(self, event):
-        """Maneja click en ticket"""
-        # Mostrar información del click
-        item = self.tickets_tree.identify('item', event.x, event.y)
-        column = self.tickets_tree.identify('column', event.x, event.y)
-        
-        if item and column:
-            pass
-    
     def copy_selection(self):
         """Copiar solo los usuarios de las celdas seleccionadas"""
-        if not self.selected_cells:
-            return
-        
-        # Obtener solo usuarios (columna 1)
-        users = []
-        for row, col in sorted(self.selected_cells):
-            if col == 1:  # Solo columna de usuarios
-                if isinstance(self.tickets_data[row-1], dict):
-                    ticket = self.tickets_data[row-1]
-                    user = ticket.get('username', f'USER{row:03d}')
-                else:
-                    user = self.tickets_data[row-1][col] if col < len(self.tickets_data[row-1]) else ''
-                users.append(str(user))
-        
+        users = self.tickets_grid.selected_values(col=TICKET_GRID_FIELDS.index('username'))
         if users:
             # Copiar solo los usuarios al portapapeles
-            text = '\n'.join(users)
             self.root.clipboard_clear()
-            self.root.clipboard_append(text)
+            self.root.clipboard_append('\n'.join(users))
+            self.add_log(f"📋 {len(users)} usuarios copiados al portapapeles")
     
     def copy_all_tickets(self):
         """Copia todos los tickets al portapapeles"""
@@ -1719,10 +1904,8 @@ class MikroTikHotspotGenerator:
             messagebox.showwarning("Advertencia", "No hay tickets para copiar")
             return
         
-        # Solo usuarios, uno por línea
-        users = []
-        for ticket in self.tickets_data:
-            users.append(ticket['username'])
+        # Solo usuarios, uno por línea (directo de la columna de nombres)
+        users = list(self.tickets_data.column('username'))
         
         text = '\n'.join(users)
         self.root.clipboard_clear()
@@ -1750,123 +1933,6 @@ class MikroTikHotspotGenerator:
         else:
             messagebox.showinfo("Info", "No hay contraseñas para copiar (tickets solo con usuario)")
 
-    def on_cell_click(self, event):
-        """Maneja clic en una celda individual"""
-        region = self.tickets_tree.identify_region(event.x, event.y)
-        if region == "cell":
-            item = self.tickets_tree.identify_row(event.y)
-            column = self.tickets_tree.identify_column(event.x)
-            
-            if item and column:
-                # Limpiar selección anterior si no se presiona Ctrl
-                if not (event.state & 0x4):  # Ctrl no presionado
-                    self.selected_cells.clear()
-                
-                # Agregar o quitar celda de selección
-                cell_id = (item, column)
-                if cell_id in self.selected_cells:
-                    self.selected_cells.remove(cell_id)
-                else:
-                    self.selected_cells.add(cell_id)
-                
-                self.last_selected_cell = cell_id
-                self.update_cell_selection_display()
-                self.update_selection_count()
-
-    def on_ctrl_cell_click(self, event):
-        """Maneja Ctrl+clic para selección múltiple de celdas"""
-        region = self.tickets_tree.identify_region(event.x, event.y)
-        if region == "cell":
-            item = self.tickets_tree.identify_row(event.y)
-            column = self.tickets_tree.identify_column(event.x)
-            
-            if item and column:
-                cell_id = (item, column)
-                if cell_id in self.selected_cells:
-                    self.selected_cells.remove(cell_id)
-                else:
-                    self.selected_cells.add(cell_id)
-                
-                self.last_selected_cell = cell_id
-                self.update_cell_selection_display()
-                self.update_selection_count()
-
-    def on_shift_cell_click(self, event):
-        """Maneja Shift+clic para selección de rango de celdas"""
-        if not self.last_selected_cell:
-            self.on_cell_click(event)
-            return
-            
-        region = self.tickets_tree.identify_region(event.x, event.y)
-        if region == "cell":
-            item = self.tickets_tree.identify_row(event.y)
-            column = self.tickets_tree.identify_column(event.x)
-            
-            if item and column:
-                # Seleccionar rango desde la última celda hasta esta
-                self.select_cell_range(self.last_selected_cell, (item, column))
-                self.update_cell_selection_display()
-                self.update_selection_count()
-
-    def select_cell_range(self, start_cell, end_cell):
-        """Selecciona un rango de celdas"""
-        # Implementación simplificada - selecciona las celdas individuales
-        self.selected_cells.add(start_cell)
-        self.selected_cells.add(end_cell)
-
-    def update_cell_selection_display(self):
-        """Actualiza la visualización de celdas seleccionadas"""
-        # Aquí podrías cambiar colores de fondo de las celdas seleccionadas
-        # Por simplicidad, solo actualizamos el contador
-        pass
-
-    def clear_selection(self):
-        """Limpia la selección de celdas"""
-        self.selected_cells.clear()
-        self.last_selected_cell = None
-        self.update_cell_selection_display()
-        self.update_selection_count()
-
-    def select_entire_column(self, column):
-        """Selecciona una columna completa"""
-        self.selected_cells.clear()
-        for item in self.tickets_tree.get_children():
-            self.selected_cells.add((item, column))
-        self.update_cell_selection_display()
-        self.update_selection_count()
-
-    def copy_selected_cells(self):
-        """Copia solo las celdas seleccionadas"""
-        if not self.selected_cells:
-            messagebox.showwarning("Advertencia", "No hay celdas seleccionadas")
-            return
-        
-        # Recopilar valores de celdas seleccionadas
-        cell_values = []
-        column_mapping = {'#1': 0, '#2': 1, '#3': 2, '#4': 3, '#5': 4, '#6': 5}
-        
-        for item_id, column_id in self.selected_cells:
-            if column_id in column_mapping:
-                values = self.tickets_tree.item(item_id, 'values')
-                if values:
-                    col_index = column_mapping[column_id]
-                    if col_index < len(values):
-                        cell_values.append(str(values[col_index]))
-        
-        if cell_values:
-            # Copiar valores separados por nuevas líneas
-            text = '\n'.join(cell_values)
-            self.root.clipboard_clear()
-            self.root.clipboard_append(text)
-            messagebox.showinfo("Éxito", f"Se copiaron {len(cell_values)} celdas al portapapeles")
-        else:
-            messagebox.showwarning("Advertencia", "No se pudieron obtener valores de las celdas")
-
-    def update_selection_count(self):
-        """Actualiza el contador de celdas seleccionadas"""
-        count = len(self.selected_cells)
-        self.selection_count_label.config(text=f"Celdas: {count}")
-    
     def format_for_printing(self):
         """Abre ventana con formato especial para impresión"""
         if not self.tickets_data:
@@ -1964,7 +2030,7 @@ class MikroTikHotspotGenerator:
             format_type = format_var.get()
             
             if format_type == "users_only":
-                users = [ticket['username'] for ticket in self.tickets_data]
+                users = list(self.tickets_data.column('username'))
                 text = '\n'.join(users)
                 
             elif format_type == "full_table":
@@ -1998,12 +2064,16 @@ class MikroTikHotspotGenerator:
                  relief=tk.FLAT, bd=2).pack(side=tk.LEFT, padx=15)
     
     def generate_pdf_directly(self):
-        """RESTAURADO: Genera EXCEL primero, luego convierte a PDF (tu flujo original)"""
+        """Genera el PDF de tickets con el diseño de Plantilla.xlsx
+
+        Se dibuja directo con pdf_writer.render_tickets_pdf, página por
+        página; no se guarda ningún Excel temporal ni hace falta Excel.
+        """
         if not self.tickets_data:
             return
         
         try:
-            # 1. PRIMERO: Crear Excel con tu plantilla (como antes)
+            # 1. PRIMERO: La plantilla da el diseño de cada página
             script_dir = os.path.dirname(os.path.abspath(__file__))
             template_path = os.path.join(script_dir, "Plantilla.xlsx")
             
@@ -2019,35 +2089,24 @@ class MikroTikHotspotGenerator:
             )
             
             if pdf_filename:
-                # 3. TERCERO: Crear Excel temporal con tu plantilla
-                temp_excel = pdf_filename.replace('.pdf', '_temp.xlsx')
-                self.export_with_your_template(template_path, temp_excel)
-                
-                # 4. CUARTO: Convertir Excel a PDF (tu proceso original)
-                self.convert_to_pdf(temp_excel, pdf_filename)
+                # 3. TERCERO: PDF directo con el diseño de tu plantilla (sin Excel instalado)
+                result = pdf_writer.render_tickets_pdf(template_path, pdf_filename,
+                                                       self.tickets_data, self.format_time_display)
+                self.add_log(f"✅ PDF guardado: {os.path.basename(pdf_filename)} ({result['pages']} páginas)")
                 
-                # 5. NUEVO: Opción de guardar Excel también
+                # 4. CUARTO: Guardar el Excel también
                 excel_final = pdf_filename.replace('.pdf', '.xlsx')
                 if os.path.exists(excel_final):
                     try:
                         os.remove(excel_final)
                     except:
                         pass
-                try:
-                    import shutil
-                    shutil.copy2(temp_excel, excel_final)
+                self.export_with_your_template(template_path, excel_final)
+                if os.path.exists(excel_final):
                     self.add_log(f"✅ Excel guardado: {os.path.basename(excel_final)}")
-                except:
-                    pass
-                
-                # 6. SEXTO: Limpiar archivo temporal
-                try:
-                    os.remove(temp_excel)
-                except:
-                    pass
                 
         except Exception as e:
-            pass  # Error silencioso
+            self.add_log(f"❌ Error generando PDF: {str(e)}")
     
 
     def export_to_excel(self):
@@ -2115,7 +2174,10 @@ class MikroTikHotspotGenerator:
                 messagebox.showerror("Error", f"Error creando fichas:\n{str(e)}")
     
     def convert_to_pdf(self, excel_file, pdf_file=None):
-        """Convierte archivo Excel a PDF usando formato profesional (requiere Excel instalado)"""
+        """Convierte archivo Excel a PDF usando formato profesional (requiere Excel instalado)
+
+        Los PDF de tickets ya no pasan por aquí: los dibuja pdf_writer sin Excel.
+        """
         try:
             import win32com.client as win32
             
@@ -2166,8 +2228,9 @@ class MikroTikHotspotGenerator:
         
         # Título con info de páginas
         total_tickets = len(self.tickets_data)
-        tickets_per_page = 40 * 4  # 40 filas x 4 columnas
-        total_pages = (total_tickets + tickets_per_page - 1) // tickets_per_page
+        # Mismo plan de páginas que usarán el Excel y el PDF (se calcula una vez)
+        plan = page_layout.plan_for(self.tickets_data, self.format_time_display)
+        total_pages = plan.pages
         
         tk.Label(buttons_frame, text=f"� Vista Previa REAL - {total_tickets} tickets - {total_pages} página(s)", 
                 font=('Segoe UI', 12, 'bold'), bg='#f0f0f0', fg='#2c3e50').pack(pady=15)
@@ -2188,191 +2251,12 @@ class MikroTikHotspotGenerator:
                  command=preview_window.destroy,
                  bg='#95a5a6', fg='white', font=('Segoe UI', 11)).pack(side=tk.LEFT, padx=15)
         
-        # Crear canvas con scrollbar para las hojas
-        canvas_frame = tk.Frame(main_frame, bg='#ffffff')
-        canvas_frame.pack(fill=tk.BOTH, expand=True)
-        
-        canvas = tk.Canvas(canvas_frame, bg='#ffffff')
-        scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=canvas.yview)
-        scrollable_frame = tk.Frame(canvas, bg='#ffffff')
-        
-        scrollable_frame.bind(
-            "<Configure>",
-            lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-        )
-        
-        canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
-        
-        # Generar vista previa de TODAS las hojas
-        self.generate_sheets_preview(scrollable_frame)
-        
-        # Pack canvas y scrollbar
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # Bind mousewheel
-        def _on_mousewheel(event):
-            canvas.yview_scroll(int(-1*(event.delta/120)), "units")
-        canvas.bind_all("<MouseWheel>", _on_mousewheel)
-    
-    def generate_sheets_preview(self, parent_frame):
-        """Genera la vista previa EXACTA de las hojas como se van a imprimir"""
-        
-        # Configuración de tu plantilla
-        column_pairs = [(1,2), (3,4), (6,7), (8,9)]  # Las 4 columnas de datos
-        max_rows_per_column = 40
-        tickets_per_page = max_rows_per_column * len(column_pairs)  # 160 tickets por página
-        
-        total_tickets = len(self.tickets_data)
-        total_pages = (total_tickets + tickets_per_page - 1) // tickets_per_page
-        
-        for sheet_num in range(total_pages):
-            # Frame para cada hoja
-            sheet_frame = tk.Frame(parent_frame, bg='#ffffff', relief=tk.FLAT, bd=2)
-            sheet_frame.pack(fill=tk.X, pady=15, padx=20)
-            
-            # Encabezado de la hoja (como en tu plantilla)
-            header_frame = tk.Frame(sheet_frame, bg='#f8f9fa', height=40)
-            header_frame.pack(fill=tk.X, pady=(0, 5))
-            header_frame.pack_propagate(False)
-            
-            tk.Label(header_frame, text=f"Hoja {sheet_num + 1} - CH Pines", 
-                    font=('Arial', 12, 'bold'), bg='#f8f9fa', fg='#2c3e50').pack(pady=15)
-            
-            # Frame para la tabla de datos (simular tu formato exacto)
-            data_frame = tk.Frame(sheet_frame, bg='#ffffff')
-            data_frame.pack(fill=tk.X, padx=20, pady=15)
-            
-            # Crear grid que simule tu plantilla EXACTA
-            # Fila de headers (opcional, como guía visual)
-            header_row = tk.Frame(data_frame, bg='#e9ecef')
-            header_row.pack(fill=tk.X, pady=(0, 2))
-            
-            # Headers para las 4 columnas
-            col_widths = [60, 120, 60, 120, 80, 60, 120, 60, 120]
-            headers = ['1h', 'PIN', '1h', 'PIN', '', '1h', 'PIN', '1h', 'PIN']
-            
-            for i, (header, width) in enumerate(zip(headers, col_widths)):
-                if i == 4:  # Columna separadora
-                    tk.Label(header_row, text=header, width=8, font=('Arial', 8), 
-                            bg='#e9ecef', relief=tk.FLAT).pack(side=tk.LEFT, padx=1)
-                else:
-                    tk.Label(header_row, text=header, width=width//10, font=('Arial', 8, 'bold'), 
-                            bg='#dee2e6', relief=tk.RIDGE, bd=1).pack(side=tk.LEFT, padx=1)
-            
-            # Calcular rango de tickets para esta hoja
-            start_ticket = sheet_num * tickets_per_page
-            
-            # Generar solo las filas que tienen contenido (más estético)
-            for row in range(max_rows_per_column):
-                # Pre-verificar si esta fila tendrá contenido
-                has_content = False
-                
-                # Verificar si alguna columna en esta fila tiene datos
-                col_indices = [
-                    start_ticket + row,           # Columna A-B
-                    start_ticket + row + 40,      # Columna C-D  
-                    start_ticket + row + 80,      # Columna F-G
-                    start_ticket + row + 120      # Columna H-I
-                ]
-                
-                for col_idx in col_indices:
-                    if col_idx < total_tickets:
-                        has_content = True
-                        break
-                
-                # Solo crear la fila si tiene contenido
-                if not has_content:
-                    break
-                    
-                row_frame = tk.Frame(data_frame, bg='#ffffff')
-                row_frame.pack(fill=tk.X, pady=1)
-                
-                # LÓGICA CORREGIDA: Llenar usando índices de columna como en export
-                current_row_data = []
-                
-                # Columna A-B: tickets del rango start_ticket + (row)
-                col1_index = start_ticket + row
-                if col1_index < total_tickets:
-                    ticket = self.tickets_data[col1_index]
-                    
-                    if isinstance(ticket, dict):
-                        time_val = ticket.get('time_limit', ticket.get('uptime_limit', '1h'))
-                        pin_val = ticket.get('username', f'ERROR_NO_USERNAME_{col1_index}')
-                    else:
-                        # Si no es dict, asumir que es string directo
-                        time_val = '1h'
-                        pin_val = str(ticket) if ticket else f'ERROR_EMPTY_{col1_index}'
-                    current_row_data.extend([time_val, pin_val])
-                else:
-                    current_row_data.extend(['', ''])
-                
-                # Columna C-D: tickets del rango start_ticket + row + 40
-                col2_index = start_ticket + row + 40
-                if col2_index < total_tickets:
-                    ticket = self.tickets_data[col2_index]
-                    if isinstance(ticket, dict):
-                        time_val = ticket.get('time_limit', ticket.get('uptime_limit', '1h'))
-                        pin_val = ticket.get('username', f'ERROR_NO_USERNAME_{col2_index}')
-                    else:
-                        # Si no es dict, asumir que es string directo
-                        time_val = '1h'
-                        pin_val = str(ticket) if ticket else f'ERROR_EMPTY_{col2_index}'
-                    current_row_data.extend([time_val, pin_val])
-                else:
-                    current_row_data.extend(['', ''])
-                
-                # Insertar columna separadora vacía
-                current_row_data.insert(4, '')
-                
-                # Columna F-G: tickets del rango start_ticket + row + 80
-                col3_index = start_ticket + row + 80
-                if col3_index < total_tickets:
-                    ticket = self.tickets_data[col3_index]
-                    if isinstance(ticket, dict):
-                        time_val = ticket.get('time_limit', ticket.get('uptime_limit', '1h'))
-                        pin_val = ticket.get('username', f'ERROR_NO_USERNAME_{col3_index}')
-                    else:
-                        # Si no es dict, asumir que es string directo
-                        time_val = '1h'
-                        pin_val = str(ticket) if ticket else f'ERROR_EMPTY_{col3_index}'
-                    current_row_data.extend([time_val, pin_val])
-                else:
-                    current_row_data.extend(['', ''])
-                
-                # Columna H-I: tickets del rango start_ticket + row + 120
-                col4_index = start_ticket + row + 120
-                if col4_index < total_tickets:
-                    ticket = self.tickets_data[col4_index]
-                    if isinstance(ticket, dict):
-                        time_val = ticket.get('time_limit', ticket.get('uptime_limit', '1h'))
-                        pin_val = ticket.get('username', f'ERROR_NO_USERNAME_{col4_index}')
-                    else:
-                        # Si no es dict, asumir que es string directo
-                        time_val = '1h'
-                        pin_val = str(ticket) if ticket else f'ERROR_EMPTY_{col4_index}'
-                    current_row_data.extend([time_val, pin_val])
-                else:
-                    current_row_data.extend(['', ''])
-                
-                # Crear celdas con formato visual
-                for i, (cell_value, width) in enumerate(zip(current_row_data, col_widths)):
-                    if i == 4:  # Columna separadora
-                        tk.Label(row_frame, text='', width=8, bg='#ffffff').pack(side=tk.LEFT, padx=1)
-                    elif i in [0, 2, 5, 7]:  # Columnas de tiempo
-                        color = '#FFFF99' if cell_value == '1h' else '#99FF99' if cell_value == '2h' else '#ffffff'
-                        tk.Label(row_frame, text=cell_value, width=width//10, 
-                                font=('Arial', 9, 'bold'), bg=color, relief=tk.RIDGE, bd=1,
-                                anchor='center').pack(side=tk.LEFT, padx=1)
-                    else:  # Columnas de PIN
-                        tk.Label(row_frame, text=cell_value, width=width//10, 
-                                font=('Arial', 10, 'bold'), bg='#ffffff', relief=tk.RIDGE, bd=1,
-                                anchor='center').pack(side=tk.LEFT, padx=1)
-            
-            # Espacio entre hojas
-            if sheet_num < total_pages - 1:
-                tk.Frame(parent_frame, height=20, bg='#f0f0f0').pack(fill=tk.X)
+        # Hojas virtuales: se dibuja solo lo visible, la ventana abre al instante
+        sheets = preview_pages.LazyPagePreview(
+            main_frame, total_pages, lambda page: preview_pages.preview_page_rows(plan, page),
+            scheduler=self.idle_scheduler)
+        sheets.pack(fill=tk.BOTH, expand=True)
+        sheets.canvas.focus_set()
     
     def export_with_template_from_preview(self, parent_window):
         """Exportar usando la plantilla desde la vista previa"""
@@ -2408,32 +2292,24 @@ class MikroTikHotspotGenerator:
             
             if filename:
                 # ✅ USAR TU PLANTILLA BONITA para PDF también
-                template_path = "Plantilla.xlsx"
+                script_dir = os.path.dirname(os.path.abspath(__file__))
+                template_path = os.path.join(script_dir, "Plantilla.xlsx")
                 if not os.path.exists(template_path):
                     messagebox.showerror("Error", f"No se encuentra tu plantilla: {template_path}")
                     return
                 
-                # Crear Excel temporal con TU FORMATO BONITO
-                temp_excel = filename.replace('.pdf', '_temp.xlsx')
-                print(f"🎨 Creando PDF con TU PLANTILLA BONITA...")
-                
-                # ✨ USAR LA FUNCIÓN BONITA en lugar de la fea
-                self.export_with_your_template(template_path, temp_excel)
-                
-                # Convertir a PDF
-                self.convert_to_pdf(temp_excel, filename)
+                self.log.debug("🎨 Creando PDF con TU PLANTILLA BONITA...")
                 
-                # Eliminar archivo temporal
-                if os.path.exists(temp_excel):
-                    os.remove(temp_excel)
+                # ✨ Mismo diseño que el Excel, escrito directo a PDF
+                pdf_writer.render_tickets_pdf(template_path, filename,
+                                              self.tickets_data, self.format_time_display)
                 
                 messagebox.showinfo("Exportación Exitosa", f"PDF guardado correctamente:\n{os.path.basename(filename)}")
                 parent_window.destroy()
                 
         except Exception as e:
             messagebox.showerror("Error", f"Error creando PDF bonito:\n{str(e)}")
-            import traceback
-            print(f"🔥 ERROR PDF: {traceback.format_exc()}")
+            self.log.exception(f"🔥 ERROR PDF: {e}")
 
     def export_preview_excel(self, parent_window):
         """Exporta la vista previa a Excel con plantilla"""
@@ -2478,7 +2354,7 @@ class MikroTikHotspotGenerator:
         
         # Datos usando TU formato exacto
         for i, ticket in enumerate(self.tickets_data, 1):
-            if isinstance(ticket, dict):
+            if isinstance(ticket, Mapping):
                 time_limit = ticket.get('time_limit', '1h')
                 pin_base = ticket.get('username', f'M{100+i}')
             else:
@@ -2532,279 +2408,67 @@ class MikroTikHotspotGenerator:
 
     def clear_tickets(self):
         """Limpia la tabla de tickets"""
-        if hasattr(self, 'tickets_tree'):
-            for item in self.tickets_tree.get_children():
-                self.tickets_tree.delete(item)
-        if hasattr(self, 'tickets_table_frame'):
-            for widget in self.tickets_table_frame.winfo_children():
-                widget.destroy()
-            self.cell_widgets.clear()
-            self.selected_cells.clear()
-        self.tickets_data = []
+        self.tickets_data = ticket_store.TicketStore()
+        self.create_excel_table()
     
     # FUNCIONES EXCEL
     
     def create_excel_table(self):
-        """Crear tabla estilo Excel OPTIMIZADA - Sin bloqueo de UI"""
-        # Crear stub para compatibilidad con funciones que buscan tickets_tree
-        self.tickets_tree = None
-        
-        if not hasattr(self, 'tickets_table_frame'):
-            return
-            
-        # Limpiar tabla anterior
-        for widget in self.tickets_table_frame.winfo_children():
-            widget.destroy()
-        self.cell_widgets.clear()
-        self.selected_cells.clear()
-        
-        # Usar excel_table_data si existe, si no tickets_data
-        data_to_use = getattr(self, 'excel_table_data', self.tickets_data)
-        if not data_to_use:
-            return
-        
-        # Headers
-        headers = ['No.', 'Usuario', 'Password', 'Perfil', 'Tiempo']
-        
-        # Crear headers inmediatamente
-        for col, header in enumerate(headers):
-            header_btn = tk.Button(self.tickets_table_frame, text=header, 
-                                  font=('Segoe UI', 11),
-                                  bg='#34495e', fg='white', relief=tk.FLAT, bd=1,
-                                  command=lambda c=col: self.select_column(c))
-            header_btn.grid(row=0, column=col, sticky='nsew', padx=1, pady=1)
-        
-        # 🚀 OPTIMIZACIÓN CRÍTICA: Crear filas de forma asíncrona
-        self.current_row_index = 1
-        self.total_rows_to_create = len(data_to_use)
-        
-        # Iniciar creación asíncrona de filas
-        self._create_table_rows_async(data_to_use, headers)
-    
-    def _create_table_rows_async(self, data_to_use, headers):
-        """Crea filas de tabla de forma asíncrona para evitar bloqueo de UI"""
-        rows_per_batch = 5  # Crear 5 filas por lote para mantener UI responsiva
-        
-        batch_end = min(self.current_row_index + rows_per_batch, self.total_rows_to_create + 1)
-        
-        # Crear lote actual de filas
-        for row in range(self.current_row_index, batch_end):
-            data_index = row - 1  # row empieza en 1, data_index en 0
-            
-            if data_index >= len(data_to_use):
-                break
-                
-            for col in range(len(headers)):
-                # Obtener valor de la celda
-                if isinstance(data_to_use[data_index], dict):
-                    # Formato diccionario
-                    ticket = data_to_use[data_index]
-                    if col == 0:
-                        cell_value = ticket.get('number', row)
-                    elif col == 1:
-                        cell_value = ticket.get('username', f'USER{row:03d}')
-                    elif col == 2:
-                        cell_value = ticket.get('password', '123456')
-                    elif col == 3:
-                        cell_value = ticket.get('profile', 'hotspot-5M')
-                    elif col == 4:
-                        cell_value = ticket.get('time', '01:00:00')
-                else:
-                    # Formato lista
-                    cell_value = data_to_use[data_index][col] if col < len(data_to_use[data_index]) else ''
-                
-                cell = tk.Label(self.tickets_table_frame, text=str(cell_value), 
-                               font=('Segoe UI', 8), bg='#ffffff', fg='#2c3e50',
-                               relief=tk.SOLID, bd=1, padx=6, pady=3)
-                cell.grid(row=row, column=col, sticky='nsew', padx=1, pady=1)
-                
-                # Guardar referencia
-                self.cell_widgets[(row, col)] = cell
-                
-                # Eventos de mouse
-                cell.bind('<Button-1>', lambda e, r=row, c=col: self.on_cell_click(e, r, c))
-                cell.bind('<Control-Button-1>', lambda e, r=row, c=col: self.on_ctrl_click(e, r, c))
-                cell.bind('<Shift-Button-1>', lambda e, r=row, c=col: self.on_shift_click(e, r, c))
-                cell.bind('<B1-Motion>', lambda e, r=row, c=col: self.on_drag(e, r, c))
-                cell.bind('<ButtonRelease-1>', self.on_drag_end)
-        
-        # Actualizar índice para próximo lote
-        self.current_row_index = batch_end
-        
-        # Si hay más filas por crear, continuar de forma asíncrona
-        if self.current_row_index <= self.total_rows_to_create:
-            # Mostrar progreso
-            progress = (self.current_row_index - 1) / self.total_rows_to_create * 100
-            if hasattr(self, 'status_label'):
-                self.tickets_status_label.config(
-                    text=f"🔄 Cargando tabla... {progress:.0f}%", 
-                    fg='#3498db'
-                )
-            
-            # Continuar con el siguiente lote después de una pequeña pausa
-            self.root.after(10, lambda: self._create_table_rows_async(data_to_use, headers))
-        else:
-            # Terminado: configurar tabla final
-            self._finish_table_creation(headers)
-    
-    def _finish_table_creation(self, headers):
-        """Termina la creación de tabla configurando columnas y contador"""
-        # Configurar peso de columnas
-        for col in range(len(headers)):
-            self.tickets_table_frame.columnconfigure(col, weight=1, minsize=100)
-        
-        # Actualizar contador final
-        self.update_count()
-        
-        # Actualizar status
-        if hasattr(self, 'status_label'):
-            showing_count = len(getattr(self, 'excel_table_data', self.tickets_data))
-            total_count = len(self.tickets_data)
+        """Muestra los tickets en la tabla virtual (solo se dibujan las filas visibles)"""
+        self.ticket_view = ticket_views.TicketView(self.tickets_data)
+        self.tickets_grid.set_sort_indicator(None)
+        # La búsqueda escrita sigue aplicándose a los tickets nuevos
+        prefix, status = self._ticket_filter_values()
+        self.ticket_view.filter(prefix, status=status)
+        self.tickets_grid.set_data(len(self.ticket_view), self._ticket_cell)
+        self.tickets_status_label.config(text=f"🎫 Tickets generados: {len(self.tickets_data)}",
+                                         fg='#27ae60')
+    
+    def _ticket_cell(self, row, col):
+        """Valor de una celda de la tabla (consultado solo para filas visibles)"""
+        field = TICKET_GRID_FIELDS[col]
+        index = self.ticket_view.index(row)
+        if field == 'number':
+            return self.tickets_data.value(index, 'number', index + 1)
+        return self.tickets_data.value(index, field, '')
+    
+    def _ticket_filter_values(self):
+        """(prefijo, estado o None) escritos en la barra de búsqueda"""
+        if not hasattr(self, 'search_var'):
+            return '', None
+        status = self.status_filter_var.get()
+        return self.search_var.get().strip(), (None if status == ALL_STATUSES else status)
+    
+    def _refresh_status_filter_values(self):
+        """Estados presentes en los tickets actuales (al abrir el filtro)"""
+        statuses = sorted(str(status) for status in self.ticket_view.searcher.values('status'))
+        self.status_filter_combo.configure(values=[ALL_STATUSES] + statuses)
+    
+    def apply_ticket_filter(self):
+        """Filtra la tabla por prefijo de PIN y estado sobre todos los tickets
+        
+        Usa el índice de búsqueda de la vista: cada tecla cuesta milisegundos
+        aunque haya 100k tickets, y el orden elegido se conserva.
+        """
+        prefix, status = self._ticket_filter_values()
+        self.ticket_view.filter(prefix, status=status)
+        self.tickets_grid.set_data(len(self.ticket_view), self._ticket_cell)
+        if self.ticket_view.filtered:
             self.tickets_status_label.config(
-                text=f"✅ Tabla cargada: {showing_count} tickets mostrados de {total_count} total", 
-                fg='#27ae60'
-            )
-    
-    def on_cell_click(self, event, row, col):
-        """Clic simple en celda"""
-        if not (event.state & 0x4):  # No Ctrl
-            self.clear_selection()
-        
-        cell_key = (row, col)
-        if cell_key in self.selected_cells:
-            self.selected_cells.remove(cell_key)
-            self.unhighlight_cell(row, col)
-        else:
-            self.selected_cells.add(cell_key)
-            self.highlight_cell(row, col)
-        
-        self.drag_start = (row, col)
-        self.update_count()
-    
-    def on_ctrl_click(self, event, row, col):
-        """Ctrl+Clic para selección múltiple"""
-        cell_key = (row, col)
-        if cell_key in self.selected_cells:
-            self.selected_cells.remove(cell_key)
-            self.unhighlight_cell(row, col)
-        else:
-            self.selected_cells.add(cell_key)
-            self.highlight_cell(row, col)
-        
-        self.update_count()
-    
-    def on_shift_click(self, event, row, col):
-        """Shift+Clic para selección de rango"""
-        if hasattr(self, 'drag_start') and self.drag_start:
-            self.clear_selection()
-            self.select_range(self.drag_start, (row, col))
-            self.update_count()
-    
-    def on_drag(self, event, row, col):
-        """Arrastre para selección continua"""
-        if hasattr(self, 'drag_start') and self.drag_start:
-            self.is_dragging = True
-            self.clear_selection()
-            self.select_range(self.drag_start, (row, col))
-            self.update_count()
-    
-    def on_drag_end(self, event):
-        """Finalizar arrastre"""
-        if hasattr(self, 'is_dragging'):
-            self.is_dragging = False
-    
-    def select_range(self, start, end):
-        """Seleccionar rango rectangular"""
-        start_row, start_col = start
-        end_row, end_col = end
-        
-        min_row = min(start_row, end_row)
-        max_row = max(start_row, end_row)
-        min_col = min(start_col, end_col)
-        max_col = max(start_col, end_col)
-        
-        for row in range(min_row, max_row + 1):
-            for col in range(min_col, max_col + 1):
-                self.selected_cells.add((row, col))
-                self.highlight_cell(row, col)
-    
-    def select_column(self, col):
-        """Seleccionar columna completa"""
-        self.clear_selection()
-        data_to_use = getattr(self, 'excel_table_data', self.tickets_data)
-        for row in range(1, len(data_to_use) + 1):
-            self.selected_cells.add((row, col))
-            self.highlight_cell(row, col)
-        
-        self.update_count()
-    
-    def highlight_cell(self, row, col):
-        """Resaltar celda visualmente"""
-        if (row, col) in self.cell_widgets:
-            cell = self.cell_widgets[(row, col)]
-            cell.configure(bg='#3498db', fg='white', font=('Segoe UI', 8, 'bold'))
-    
-    def unhighlight_cell(self, row, col):
-        """Quitar resaltado de celda"""
-        if (row, col) in self.cell_widgets:
-            cell = self.cell_widgets[(row, col)]
-            cell.configure(bg='#ffffff', fg='#2c3e50', font=('Segoe UI', 8))
+                text=f"🔎 {len(self.ticket_view)} de {len(self.tickets_data)} tickets", fg='#2980b9')
+        elif self.tickets_data:
+            self.tickets_status_label.config(text=f"🎫 Tickets generados: {len(self.tickets_data)}",
+                                             fg='#27ae60')
     
     def clear_selection(self):
         """Limpiar toda la selección"""
-        for row, col in self.selected_cells.copy():
-            self.unhighlight_cell(row, col)
-        self.selected_cells.clear()
-        self.update_count()
+        self.tickets_grid.clear_selection()
     
-    def update_count(self):
+    def update_count(self, count=None):
         """Actualizar contador de selección"""
-        if hasattr(self, 'count_label'):
-            count = len(self.selected_cells)
-            self.count_label.configure(text=f'Celdas: {count}')
-    
-    def on_tickets_frame_configure(self, event):
-        """Actualizar región de scroll"""
-        if hasattr(self, 'tickets_canvas'):
-            self.tickets_canvas.configure(scrollregion=self.tickets_canvas.bbox('all'))
-    
-    def on_tickets_canvas_configure(self, event):
-        """Redimensionar canvas"""
-        if hasattr(self, 'tickets_canvas') and hasattr(self, 'tickets_canvas_window'):
-            canvas_width = event.width
-            self.tickets_canvas.itemconfig(self.tickets_canvas_window, width=canvas_width)
-    
-    # Funciones que faltaban para los botones
-    def copy_selected_tickets(self):
-        """Copiar tickets seleccionados - usando función Excel"""
-        if hasattr(self, 'copy_selection'):
-            self.copy_selection()
-        else:
-            messagebox.showinfo("Info", "Función de copia disponible después de generar tickets")
-    
-    def copy_all_tickets(self):
-        """Copiar todos los tickets"""
-        if hasattr(self, 'select_all_table') and hasattr(self, 'copy_selection'):
-            self.select_all_table()
-            self.copy_selection()
-        else:
-            messagebox.showinfo("Info", "Función disponible después de generar tickets")
-    
-    def copy_users_column(self):
-        """Copiar solo usuarios"""
-        if hasattr(self, 'select_all_users') and hasattr(self, 'copy_selection'):
-            self.select_all_users()
-            self.copy_selection()
-        else:
-            messagebox.showinfo("Info", "Función disponible después de generar tickets")
-    
-    def copy_passwords_column(self):
-        """Copiar solo contraseñas"""
-        if hasattr(self, 'select_all_passwords') and hasattr(self, 'copy_selection'):
-            self.select_all_passwords() 
-            self.copy_selection()
-        else:
-            messagebox.showinfo("Info", "Función disponible después de generar tickets")
+        if count is None:
+            count = len(self.tickets_grid.selection)
+        self.count_label.configure(text=f'Celdas: {count}')
     
     def format_for_printing(self):
         """Formato para impresión"""
@@ -2815,7 +2479,7 @@ class MikroTikHotspotGenerator:
         # Crear texto formateado para impresión
         text = "=== CH PINES - TICKETS MIKROTIK ===\n\n"
         for i, ticket in enumerate(self.tickets_data, 1):
-            if isinstance(ticket, dict):
+            if isinstance(ticket, Mapping):
                 text += f"Ticket #{i:03d}\n"
                 text += f"Usuario: {ticket.get('username', 'N/A')}\n"
                 text += f"Contraseña: {ticket.get('password', 'N/A')}\n"
@@ -2837,373 +2501,39 @@ class MikroTikHotspotGenerator:
 
     def format_time_display(self, time_limit):
         """Convierte el formato de tiempo al formato simple solicitado"""
-        if not time_limit:
-            return "1H"
-        
-        time_str = str(time_limit).lower().strip()
-        print(f"🔍 Procesando tiempo: '{time_limit}' → '{time_str}'")
-        
-        import re
-        
-        # Patrones específicos primero (más específico a menos específico)
-        if "30d" in time_str or time_str == "30d":
-            return "MES"
-        elif "15d" in time_str or time_str == "15d":
-            return "15D"
-        elif "7d" in time_str or time_str == "7d":
-            return "SEM"
-        elif "1d" in time_str or time_str == "1d" or time_str == "24h":
-            return "DÍA"
-        elif "mes" in time_str or "month" in time_str or time_str == "1m":
-            return "MES"
-        elif "sem" in time_str or "week" in time_str or time_str == "1w":
-            return "SEM"  
-        elif "día" in time_str or "day" in time_str:
-            return "DÍA"
-        elif re.match(r'^\d+h$', time_str):  # Exactamente XhH (ej: 2h, 3h, etc)
-            hours = re.findall(r'(\d+)h', time_str)
-            if hours:
-                return f"{hours[0]}H"
-            else:
-                return "1H"
-        elif re.match(r'^\d+d$', time_str):  # Exactamente Xd (ej: 2d, 3d, etc)
-            days = re.findall(r'(\d+)d', time_str)
-            if days:
-                return f"{days[0]}D"
-            else:
-                return "1D"
-        elif "d" in time_str:
-            # Manejar formatos complejos como "1d 01:00:00" 
-            try:
-                # Buscar el número antes de 'd'
-                days = re.findall(r'(\d+)d', time_str)
-                if days:
-                    day_num = int(days[0])
-                    # Si hay más de 1 día, mostrar días; si es 1 día con horas extra, mostrar DÍA
-                    if day_num == 1:
-                        return "DÍA"  # 1 día (sin importar horas extra)
-                    else:
-                        return f"{day_num}D"  # Múltiples días
-                else:
-                    return "1D"
-            except (ValueError, IndexError):
-                print(f"⚠️ Error procesando días en: {time_str}")
-                return "DÍA"  # Default para errores con días
-        elif "h" in time_str:
-            # Manejar horas
-            try:
-                hours = re.findall(r'(\d+)h', time_str)
-                if hours:
-                    return f"{hours[0]}H"
-                else:
-                    return "1H"
-            except (ValueError, IndexError):
-                print(f"⚠️ Error procesando horas en: {time_str}")
-                return "1H"  # Default para errores con horas
-        else:
-            # Si no coincide con nada, tratar de extraer números
-            try:
-                numbers = re.findall(r'\d+', time_str)
-                if numbers:
-                    num = int(numbers[0])
-                    if num >= 24:  # Probablemente días
-                        return f"{num}D"
-                    else:  # Probablemente horas
-                        return f"{num}H"
-                else:
-                    return "1H"
-            except (ValueError, IndexError):
-                print(f"⚠️ Error procesando tiempo genérico: {time_str}")
-                return "1H"  # Default para cualquier error
-
+        return ticket_batch.format_time_display(time_limit)
+    
     def export_with_your_template(self, template_path, output_filename):
-        """🎨 Exporta tickets con TU FORMATO BONITO + Algoritmo probado sin espacios"""
+        """🎨 Exporta tickets con TU FORMATO BONITO + Algoritmo probado sin espacios
+
+        Escritura en streaming (plantilla_export): estilos precalculados por
+        celda de plantilla y filas que se vuelcan al disco al escribirse.
+        """
         try:
-            from openpyxl.styles import PatternFill
-            from copy import copy
-            
-            print(f"🎨 Iniciando exportación con TU PLANTILLA BONITA")
-            print(f"📁 Template: {template_path}")
-            print(f"💾 Output: {output_filename}")
-            print(f"🎫 Total tickets: {len(self.tickets_data)}")
+            self.log.debug("🎨 Iniciando exportación con TU PLANTILLA BONITA")
+            self.log.debug(f"📁 Template: {template_path}")
+            self.log.debug(f"💾 Output: {output_filename}")
+            self.log.debug(f"🎫 Total tickets: {len(self.tickets_data)}")
             
             # Verificar que existe el template
             if not os.path.exists(template_path):
                 self.add_log(f"❌ Error: Template no encontrado: {template_path}")
                 return
             
-            # Cargar TU PLANTILLA BONITA
-            template_wb = openpyxl.load_workbook(template_path)
-            template_ws = template_wb.active
-            print(f"✅ Tu plantilla bonita cargada exitosamente")
-            
-            # Crear nuevo archivo copiando TODO el formato de tu plantilla
-            output_wb = openpyxl.Workbook()
-            ws = output_wb.active
-            
-            # Configuración básica
-            print("🎨 Configurando dimensiones básicas (sin formato en celdas vacías)...")
-            
-            # Copiar dimensiones exactas de tu plantilla
-            for col_letter, col_dimension in template_ws.column_dimensions.items():
-                ws.column_dimensions[col_letter].width = col_dimension.width
-                ws.column_dimensions[col_letter].hidden = col_dimension.hidden
-            
-            # Copiar altura de filas
-            for row_num, row_dimension in template_ws.row_dimensions.items():
-                ws.row_dimensions[row_num].height = row_dimension.height
-                ws.row_dimensions[row_num].hidden = row_dimension.hidden
-            
-            # Copiar configuración de página
-            ws.page_setup.orientation = template_ws.page_setup.orientation
-            ws.page_setup.paperSize = template_ws.page_setup.paperSize
-            ws.page_margins = copy(template_ws.page_margins)
-            
-            # Copiar encabezados y pie de página
-            ws.oddHeader = template_ws.oddHeader
-            ws.oddFooter = template_ws.oddFooter
-            
-            print("✅ TODO tu formato bonito copiado perfectamente")
-            
-            
-            # Llenado columna por columna
-            max_rows_per_column = 40
-            
-            # Colores para diferentes tiempos (paleta pastel correcta)
-            color_map = {
-                '1H': 'FFFF99',        # Amarillo pastel (1 hora)
-                '2H': 'FFE0B3',        # Naranja pastel (2 horas)  
-                '3H': 'B3FFB3',        # Verde pastel (3 horas)
-                '4H': 'B3E0FF',        # Azul pastel (4 horas)
-                '5H': 'FFB3E0',        # Rosa pastel (5 horas)
-                '6H': 'E0B3FF',        # Morado pastel (6 horas)
-                'DÍA': 'FFD9B3',       # Durazno pastel (1 día)
-                'SEM': 'B3FFE0',       # Mint pastel (1 semana)
-                'MES': 'D9D9D9',       # Gris pastel (1 mes)
-            }
-            
-            # Calcular páginas necesarias
-            tickets_per_page = max_rows_per_column * 4  # 40 filas × 4 columnas = 160 tickets por página
-            total_tickets = len(self.tickets_data)
-            total_pages = (total_tickets + tickets_per_page - 1) // tickets_per_page
-            
-            print(f"📊 CALCULANDO PÁGINAS PARA {total_tickets} TICKETS:")
-            print(f"  🎫 Tickets por página: {tickets_per_page}")
-            print(f"  📄 Páginas necesarias: {total_pages}")
-            print(f"  📋 Una sola hoja Excel con {total_pages} páginas de impresión")
-            
-            print(f"🎨 Estrategia: Solo aplicar formato a celdas CON CONTENIDO")
-            print(f"✨ Las celdas vacías quedarán completamente limpias (sin formato)")
-            
-            # Llenado por páginas
-            ticket_index = 0
-            
-            print(f"🎯 Llenando TODAS las {total_pages} páginas con algoritmo probado...")
-            
-            # Definir las 4 columnas de datos
-            column_pairs = [(1, 2), (3, 4), (6, 7), (8, 9)]  # (tiempo, PIN)
-            
-            # Agrupamiento por tiempo
-            print(f"🎯 Agrupando {total_tickets} tickets por tipo de tiempo...")
-            
-            # Agrupar tickets por tipo de tiempo
-            time_groups = {}
-            for i, ticket in enumerate(self.tickets_data):
-                try:
-                    if isinstance(ticket, dict):
-                        raw_time = ticket.get('time_limit', '1h')
-                        time_display = self.format_time_display(raw_time)
-                    elif isinstance(ticket, str):
-                        # Si es string, asumir que es username y crear dict
-                        ticket = {
-                            'username': ticket,
-                            'password': '',
-                            'time_limit': '1h',
-                            'profile': 'default'
-                        }
-                        time_display = '1H'
-                    else:
-                        time_display = '1H'
-                    
-                    if time_display not in time_groups:
-                        time_groups[time_display] = []
-                    time_groups[time_display].append(ticket)
-                    
-                except Exception as e:
-                    print(f"❌ Error procesando ticket {i}: {e}")
-                    print(f"   Tipo: {type(ticket)}")
-                    print(f"   Valor: {ticket}")
-                    # Crear ticket de emergencia
-                    emergency_ticket = {
-                        'username': f'ERROR{i}',
-                        'password': '',
-                        'time_limit': '1h',
-                        'profile': 'default'
-                    }
-                    if '1H' not in time_groups:
-                        time_groups['1H'] = []
-                    time_groups['1H'].append(emergency_ticket)
-            
-            # Ordenar grupos por prioridad (1H, 2H, 3H, DÍA, SEM, MES, etc.)
-            time_priority = {'1H': 1, '2H': 2, '3H': 3, '4H': 4, '5H': 5, '6H': 6, 
-                           'DÍA': 10, 'SEM': 20, 'MES': 30, '15D': 25}
-            
-            sorted_groups = sorted(time_groups.items(), 
-                                 key=lambda x: time_priority.get(x[0], 99))
-            
-            print(f"📊 Grupos encontrados:")
-            for time_type, tickets in sorted_groups:
-                print(f"  • {time_type}: {len(tickets)} tickets")
-            
-            # Llenado agrupado
-            current_row = 1
-            group_count = 0
-            
-            for time_type, group_tickets in sorted_groups:
-                group_count += 1
-                group_size = len(group_tickets)
-                
-                print(f"🎨 Procesando grupo {group_count}/{len(sorted_groups)}: {time_type} ({group_size} tickets)")
-                
-                # Si no es el primer grupo, agregar separación entre grupos (más compacto)
-                if group_count > 1:
-                    # En lugar de salto de página completo, solo agregar 3-5 filas de separación
-                    rows_to_skip = 4  # Espacio más compacto entre grupos
-                    current_row += rows_to_skip
-                    print(f"  📄 Separación compacta: grupo '{time_type}' comienza en fila {current_row} (+{rows_to_skip} filas)")
-                
-                # Llenar tickets de este grupo
-                group_index = 0
-                while group_index < group_size:
-                    # Calcular página actual
-                    template_row = ((current_row - 1) % max_rows_per_column) + 1
-                    
-                    # Llenar las 4 columnas de esta fila
-                    for col_time, col_pin in column_pairs:
-                        if group_index >= group_size:
-                            break
-                            
-                        ticket = group_tickets[group_index]
-                        if isinstance(ticket, dict):
-                            pin_base = ticket.get('username', f'USER{group_index+1:03d}')
-                        else:
-                            pin_base = f'USER{group_index+1:03d}'
-                        
-                        # Llenar celda de tiempo
-                        time_cell = ws.cell(row=current_row, column=col_time)
-                        time_cell.value = time_type
-                        
-                        # Copiar formato de la plantilla
-                        template_time_cell = template_ws.cell(row=template_row, column=col_time)
-                        if template_time_cell.has_style:
-                            time_cell.font = copy(template_time_cell.font)
-                            time_cell.border = copy(template_time_cell.border)
-                            time_cell.number_format = template_time_cell.number_format
-                            time_cell.protection = copy(template_time_cell.protection)
-                            time_cell.alignment = copy(template_time_cell.alignment)
-                        
-                        # Aplicar color según tiempo
-                        color = color_map.get(time_type, 'FFFFFF00')
-                        time_cell.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
-                        
-                        # Llenar celda de PIN
-                        pin_cell = ws.cell(row=current_row, column=col_pin)
-                        pin_cell.value = pin_base
-                        
-                        # Copiar formato de la plantilla para PIN
-                        template_pin_cell = template_ws.cell(row=template_row, column=col_pin)
-                        if template_pin_cell.has_style:
-                            pin_cell.font = copy(template_pin_cell.font)
-                            pin_cell.border = copy(template_pin_cell.border)
-                            pin_cell.fill = copy(template_pin_cell.fill)
-                            pin_cell.number_format = template_pin_cell.number_format
-                            pin_cell.protection = copy(template_pin_cell.protection)
-                            pin_cell.alignment = copy(template_pin_cell.alignment)
-                        
-                        group_index += 1
-                    
-                    current_row += 1
-                
-                print(f"✅ Grupo {time_type} completado en filas hasta {current_row-1}")
-            
-            # Actualizar el total de filas usadas
-            total_rows_used = current_row - 1
-            total_pages = (total_rows_used + max_rows_per_column - 1) // max_rows_per_column
-            
-            print(f"✅ LLENADO AGRUPADO COMPLETADO:")
-            print(f"  📊 {len(sorted_groups)} grupos de tiempo procesados")
-            print(f"  📄 {total_pages} páginas utilizadas")
-            print(f"  📝 Filas usadas: 1-{total_rows_used}")
-            
-            print(f"✅ LLENADO COMPLETADO: {ticket_index} tickets")
-            print(f"📄 TOTAL PÁGINAS CREADAS: {total_pages}")
-            print(f"🎨 Con TODO tu formato bonito preservado")
-            print(f"� Algoritmo probado - SIN espacios en blanco")
-            
-            print(f"📋 Una sola hoja Excel con {total_pages} páginas de impresión")
-            
-            # Configurar diseño de página
-            print(f"�️ Configurando diseño de página ANTES de llenar datos...")
-            
-            # Configurar área de impresión PRIMERO
-            if total_tickets > 0:
-                # Usar solo las filas realmente usadas, no páginas completas
-                print_area = f"A1:I{total_rows_used}"
-                ws.print_area = print_area
-                print(f"  📄 Área de impresión definida: {print_area}")
-            
-            # SIN configuraciones problemáticas de página
-            print(f"🎯 Omitiendo configuraciones que causan saltos incorrectos")
-            
-            # Configurar altura de filas
-            print(f"📏 Configurando altura de filas para todas las páginas...")
-            
-            # Solo configurar altura para las filas realmente usadas
-            for row_num in range(1, total_rows_used + 1):
-                # Usar altura de la plantilla correspondiente (1-40 cíclicamente)
-                template_row = ((row_num - 1) % max_rows_per_column) + 1
-                template_height = template_ws.row_dimensions.get(template_row)
-                
-                if template_height and template_height.height:
-                    ws.row_dimensions[row_num].height = template_height.height
-                else:
-                    ws.row_dimensions[row_num].height = 21.6  # Altura por defecto
-            
-            print(f"✅ Altura configurada para {total_rows_used} filas")
-            
-            # Configuración final
-            print(f"� Configurando saltos de página FINALES...")
-            
-            # SIN saltos de página manuales - Excel los manejará automáticamente
-            print(f"📄 Omitiendo saltos manuales - Excel decidirá automáticamente")
-            
-            # SIN configuraciones de vista/papel - Excel usará configuración por defecto
-            print(f"✅ Datos completados - Excel manejará página automáticamente")
-            
-            # Eliminar hojas extra que pudo haber creado openpyxl por defecto
-            while len(output_wb.worksheets) > 1:
-                for sheet in output_wb.worksheets:
-                    if sheet != ws and not sheet._cells:  # Eliminar hojas vacías que no sean la principal
-                        output_wb.remove(sheet)
-                        break
-            
-            # Cerrar plantilla original
-            template_wb.close()
-            
-            # Guardar archivo NUEVO con tu formato bonito
-            output_wb.save(output_filename)
+            result = plantilla_export.export_tickets(template_path, output_filename,
+                                                     self.tickets_data, self.format_time_display)
             
-            print(f"✅ ARCHIVO CREADO: {output_filename}")
-            print(f"🎫 Total exportado: {ticket_index}")
-            print(f"🔥 LLENADO COLUMNA POR COLUMNA - SIN ESPACIOS")
+            for time_type, count in result['groups']:
+                self.log.debug(f"  🎫 Grupo {time_type}: {count} tickets")
+            self.log.debug(f"✅ ARCHIVO CREADO: {output_filename}")
+            self.log.debug(f"🎫 Total exportado: {result['tickets']} ({result['rows']} filas)")
             
             # Mensaje de éxito en log
-            self.add_log(f"✅ Exportación completada: {len(self.tickets_data)} tickets, {total_pages} páginas")
+            self.add_log(f"✅ Exportación completada: {len(self.tickets_data)} tickets, {result['pages']} páginas")
                 
         except Exception as e:
             self.add_log(f"❌ Error exportando con formato: {str(e)}")
-            import traceback
-            print(f"🔥 ERROR: {traceback.format_exc()}")
+            self.log.exception(f"🔥 ERROR: {e}")
     
     def copy_complete_page_setup(self, source_ws, target_ws):
         """Copia TODA la configuración de página de tu plantilla"""
@@ -3225,10 +2555,10 @@ class MikroTikHotspotGenerator:
                 target_ws.sheet_view.zoomScale = source_ws.sheet_view.zoomScale  # 115%
                 target_ws.sheet_view.showGridLines = source_ws.sheet_view.showGridLines
             
-            print(f"✅ Configuración de página copiada: Márgenes, orientación, zoom 115%")
+            self.log.debug("✅ Configuración de página copiada: Márgenes, orientación, zoom 115%")
             
         except Exception as e:
-            print(f"⚠️ Error copiando configuración de página: {e}")
+            self.log.warning(f"⚠️ Error copiando configuración de página: {e}")
 
 def show_welcome_dialog():
     """Ventana de bienvenida profesional con información del desarrollador"""
@@ -3459,6 +2789,7 @@ if __name__ == "__main__":
         root = tk.Tk()
         app = MikroTikHotspotGenerator(root)
         root.mainloop()
+        app.log_system.stop()
     else:
         print("❌ Acceso denegado - Cerrando aplicación...")
         exit(1)